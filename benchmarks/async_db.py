@@ -0,0 +1,134 @@
+"""
+Concurrent request latency while the SQLite database is locked
+
+Starts the app with uvicorn on a scratch database, then keeps a steady stream of
+cheap requests (GET /health and GET /api/v1/orders/{id}) in flight while another
+connection holds an exclusive lock on the database file for a while. With
+synchronous sessions the blocked query stalls the event loop, so even /health
+waits for the lock; with async sessions only the requests that need the database
+wait.
+
+Usage:
+    python benchmarks/async_db.py [--app-dir PATH] [--lock-seconds 1.5] [--concurrency 20]
+
+Run it on two checkouts (e.g. with `--app-dir` pointing at a `git worktree` of
+the previous revision) to compare before and after.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _order(i: int) -> dict:
+    return {
+        "id": i, "referenceNumber": f"BENCH-{i}", "customer": {"id": f"c{i}", "name": "Bench"},
+        "items": [{"id": 1, "name": "Bench item", "slug": "bench-item", "orderDetails": {"orderedQuantity": 1}}]
+    }
+
+
+def _hold_lock(db_path: str, start: float, seconds: float):
+    time.sleep(start)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("BEGIN EXCLUSIVE")
+    time.sleep(seconds)
+    conn.rollback()
+    conn.close()
+
+
+def _summary(name: str, latencies: list, errors: int) -> str:
+    latencies = sorted(latencies) or [0.0]
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    return (f"{name:<22} n={len(latencies):<5} p50={statistics.median(latencies) * 1000:8.1f} ms"
+            f"  p95={p95 * 1000:8.1f} ms  max={latencies[-1] * 1000:8.1f} ms  errors={errors}")
+
+
+async def _load(base_url: str, duration: float, concurrency: int) -> dict:
+    latencies = {"GET /health": [], "GET /api/v1/orders/{id}": []}
+    errors = {key: 0 for key in latencies}
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int):
+        async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+            i = n
+            while time.perf_counter() < deadline:
+                path, key = ("/health", "GET /health") if i % 2 else (f"/api/v1/orders/{i % 50 + 1}", "GET /api/v1/orders/{id}")
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 500:
+                        errors[key] += 1
+                except httpx.HTTPError:
+                    errors[key] += 1
+                latencies[key].append(time.perf_counter() - started)
+                i += 1
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return {key: (values, errors[key]) for key, values in latencies.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app-dir", default=str(Path(__file__).resolve().parent.parent))
+    parser.add_argument("--lock-seconds", type=float, default=1.5)
+    parser.add_argument("--duration", type=float, default=4.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="picker-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "WEBHOOK_QUEUE_ENABLED": "False", "DEBUG": "False"}
+    env.pop("ASYNC_DATABASE_URL", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=args.app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/health")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        httpx.post(f"{base_url}/packer-order/create", json={
+            "code": 200, "status": "SUCCESS", "data": {"order": [_order(i) for i in range(1, 51)]}
+        }, timeout=60)
+
+        baseline = asyncio.run(_load(base_url, 1.0, args.concurrency))
+        locker = threading.Thread(target=_hold_lock, args=(db_path, 0.5, args.lock_seconds))
+        locker.start()
+        locked = asyncio.run(_load(base_url, args.duration, args.concurrency))
+        locker.join()
+
+        print(f"app: {args.app_dir}")
+        print("-- no lock")
+        for name, (values, errors) in baseline.items():
+            print(_summary(name, values, errors))
+        print(f"-- exclusive lock held for {args.lock_seconds}s")
+        for name, (values, errors) in locked.items():
+            print(_summary(name, values, errors))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
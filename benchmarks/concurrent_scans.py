@@ -0,0 +1,119 @@
+"""
+Concurrent barcode scans against one order item
+
+Starts the app with uvicorn on a scratch database, creates an order whose only
+item has an ordered quantity of --ordered, starts picking, then fires --scans
+parallel POST /api/v1/picking/add-item requests of quantity 1 for that item.
+
+Exactly `ordered` scans must succeed, the rest must be rejected with 400, and the
+stored picked quantity and ITEM_PICKED activity count must both equal the number
+of accepted scans. Lost updates or over-picking make the script exit non-zero.
+
+Usage:
+    python benchmarks/concurrent_scans.py [--app-dir PATH] [--scans 500] [--ordered 300] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _scan_all(base_url: str, order_id: int, product_id: int, scans: int, concurrency: int) -> dict:
+    statuses = {}
+    limit = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def scan():
+            async with limit:
+                response = await client.post("/api/v1/picking/add-item", json={
+                    "order_id": order_id, "product_id": product_id, "quantity": 1, "method": "BARCODE"
+                })
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await asyncio.gather(*(scan() for _ in range(scans)))
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app-dir", default=str(Path(__file__).resolve().parent.parent))
+    parser.add_argument("--scans", type=int, default=500)
+    parser.add_argument("--ordered", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="picker-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "WEBHOOK_QUEUE_ENABLED": "False", "DEBUG": "False"}
+    env.pop("ASYNC_DATABASE_URL", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=args.app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/health")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        httpx.post(f"{base_url}/packer-order/create", json={"code": 200, "status": "SUCCESS", "data": {"order": [{
+            "id": 1, "referenceNumber": "SCAN-1", "customer": {"id": "c1", "name": "Bench"},
+            "items": [{"id": 1, "name": "Bench item", "slug": "bench-item", "orderDetails": {"orderedQuantity": args.ordered}}]
+        }]}}, timeout=60)
+        with sqlite3.connect(db_path) as conn:
+            order_id, product_id = conn.execute("SELECT order_id, product_id FROM order_items").fetchone()
+        httpx.post(f"{base_url}/api/v1/picking/start/{order_id}")
+
+        started = time.perf_counter()
+        statuses = asyncio.run(_scan_all(base_url, order_id, product_id, args.scans, args.concurrency))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    with sqlite3.connect(db_path) as conn:
+        picked = conn.execute("SELECT picked_quantity FROM order_items").fetchone()[0]
+        activities = conn.execute("SELECT COUNT(*) FROM picking_activities WHERE picking_method = 'ITEM_PICKED'").fetchone()[0]
+
+    accepted = statuses.get(200, 0)
+    print(f"app: {args.app_dir}")
+    print(f"{args.scans} scans, concurrency {args.concurrency}, ordered quantity {args.ordered}: "
+          f"{elapsed:.2f}s ({args.scans / elapsed:.0f} scans/s)")
+    print(f"responses: {dict(sorted(statuses.items()))}")
+    print(f"picked_quantity={picked:g}  ITEM_PICKED activities={activities}")
+    problems = []
+    if accepted != min(args.scans, args.ordered):
+        problems.append(f"{accepted} scans accepted, expected {min(args.scans, args.ordered)}")
+    if picked != accepted:
+        problems.append(f"picked quantity {picked:g} != {accepted} accepted scans (lost updates)")
+    if activities != accepted:
+        problems.append(f"{activities} activities != {accepted} accepted scans")
+    if picked > args.ordered:
+        problems.append(f"over-picked: {picked:g} > {args.ordered}")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Connection reuse of the shared HTTP transport against a local stub server
+
+Starts a keep-alive HTTP/1.1 stub that answers like the order service after
+--latency-ms and counts the TCP connections it accepts. Sends --requests PATCH
+calls four ways: a new httpx.Client per call (what the service clients did
+before services.http_transport), the shared sync client, a new AsyncClient per
+call and the shared AsyncClient, the async variants --concurrency at a time.
+Reports requests per second, wall time per request and connections opened.
+
+Usage:
+    python benchmarks/http_transport.py [--requests 500] [--concurrency 20] [--latency-ms 1]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.http_transport import HttpTransport  # noqa: E402
+
+PAYLOAD = {"status": "PACKED", "crates": ["C-1"], "package_metadata": {"weight": 1.5, "items": 3}}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_PATCH(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+        body = json.dumps({"success": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _sync_fresh(url: str, requests: int):
+    for _ in range(requests):
+        with httpx.Client(timeout=30.0) as client:
+            client.patch(url, json=PAYLOAD).raise_for_status()
+
+
+def _sync_shared(url: str, requests: int):
+    transport = HttpTransport()
+    try:
+        for _ in range(requests):
+            transport.client().patch(url, json=PAYLOAD).raise_for_status()
+    finally:
+        transport.close()
+
+
+async def _async_fresh(url: str, requests: int, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with limit:
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                (await client.patch(url, json=PAYLOAD)).raise_for_status()
+    await asyncio.gather(*(call() for _ in range(requests)))
+
+
+async def _async_shared(url: str, requests: int, concurrency: int):
+    transport = HttpTransport()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with limit:
+            (await transport.async_client().patch(url, json=PAYLOAD)).raise_for_status()
+    try:
+        await asyncio.gather(*(call() for _ in range(requests)))
+    finally:
+        await transport.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = StubServer(args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/order-service/order/REF-1"
+
+    runs = [
+        ("sync, client per call", lambda: _sync_fresh(url, args.requests)),
+        ("sync, shared client", lambda: _sync_shared(url, args.requests)),
+        ("async, client per call", lambda: asyncio.run(_async_fresh(url, args.requests, args.concurrency))),
+        ("async, shared client", lambda: asyncio.run(_async_shared(url, args.requests, args.concurrency))),
+    ]
+    print(f"{args.requests} requests, stub latency {args.latency_ms} ms, async concurrency {args.concurrency}")
+    print(f"{'mode':<24} {'req/s':>8} {'ms/req':>8} {'connections':>12}")
+    try:
+        for name, run in runs:
+            before = server.connections
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:<24} {args.requests / elapsed:>8.0f} {elapsed / args.requests * 1000:>8.2f} "
+                f"{server.connections - before:>12}"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
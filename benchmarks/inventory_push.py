@@ -0,0 +1,160 @@
+"""
+Coalescing inventory push against a local stub inventory service
+
+Starts a stub answering POST /inventory-service/item after --latency-ms and
+records the last stock it received per (product, store). --threads packers
+then send --updates stock updates for --skus hot products, evenly paced over
+--seconds, twice: one call per update through InventoryServiceClient (the
+previous behaviour, --concurrency calls at a time) and through
+services.inventory_push. Reports calls sent, the time until the last update
+was accepted, the coalescing ratio and flush latency, and whether the stub
+ended with the latest value of every pair.
+
+Usage:
+    python benchmarks/inventory_push.py [--updates 5000] [--skus 50] [--threads 8] [--seconds 2] [--latency-ms 5]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.inventory_client import InventoryServiceClient  # noqa: E402
+from services.inventory_push import InventoryPushBatcher  # noqa: E402
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.calls = 0
+        self.stock = {}
+        self._lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.server.latency)
+        with self.server._lock:
+            self.server.calls += 1
+            self.server.stock[(payload["productId"], payload["storeId"])] = payload["stock"]
+        body = b'{"success": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _updates(rng: random.Random, count: int, skus: int, threads: int) -> list:
+    """Per packer thread, its (product, store, stock) updates in order; each SKU is packed by one thread"""
+    stock = {(product, 1): 100000 for product in range(1, skus + 1)}
+    per_thread = [[] for _ in range(threads)]
+    for _ in range(count):
+        key = (rng.randint(1, skus), 1)
+        stock[key] -= rng.randint(1, 3)
+        per_thread[key[0] % threads].append((key[0], key[1], stock[key]))
+    return per_thread
+
+
+def _latest(per_thread: list) -> dict:
+    return {(product, store): stock for updates in per_thread for product, store, stock in updates}
+
+
+def _run_packers(packer, per_thread: list):
+    threads = [threading.Thread(target=packer, args=(updates,)) for updates in per_thread]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--skus", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--window-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = StubServer(args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = InventoryServiceClient(host=f"http://127.0.0.1:{server.server_address[1]}")
+    per_thread = _updates(random.Random(args.seed), args.updates, args.skus, args.threads)
+    latest = _latest(per_thread)
+    print(
+        f"{args.updates} updates over {args.skus} SKUs from {args.threads} threads in {args.seconds} s, "
+        f"stub latency {args.latency_ms} ms, window {args.window_ms} ms"
+    )
+
+    # One call per update, like the outbox sent them before
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    wait([pool.submit(client.update_inventory, 0, 0, 0) for _ in range(args.concurrency)])
+    server.calls = 0
+    started = time.perf_counter()
+    futures = []
+
+    def direct_packer(updates):
+        for update in updates:
+            futures.append(pool.submit(client.update_inventory, *update))
+            time.sleep(args.seconds / len(updates))
+
+    _run_packers(direct_packer, per_thread)
+    wait(futures)
+    elapsed = time.perf_counter() - started
+    pool.shutdown()
+    print(f"{'per update':<12} {server.calls:>6} calls {elapsed:>7.2f} s")
+
+    server.calls = 0
+    server.stock.clear()
+    batcher = InventoryPushBatcher(client=client, window=args.window_ms / 1000, concurrency=args.concurrency)
+    batcher.start()
+    # Warm up the batcher thread's event loop and connections
+    [future.result() for future in [batcher.submit(-n, 0, 0) for n in range(args.concurrency)]]
+    server.calls = 0
+    server.stock.clear()
+    started = time.perf_counter()
+    results = []
+
+    def packer(updates):
+        futures = []
+        for update in updates:
+            futures.append(batcher.submit(*update))
+            time.sleep(args.seconds / len(updates))
+        results.extend(future.result() for future in futures)
+
+    _run_packers(packer, per_thread)
+    elapsed = time.perf_counter() - started
+    batcher.stop()
+    metrics = batcher.metrics()
+    print(
+        f"{'coalesced':<12} {server.calls:>6} calls {elapsed:>7.2f} s  "
+        f"ratio {(args.updates / server.calls):.1f}, {metrics['flushes_total'] - 1} flushes, "
+        f"last flush {metrics['last_flush_ms']} ms / max {metrics['max_flush_ms']} ms, "
+        f"{results.count(True)}/{len(results)} accepted"
+    )
+    print(f"stub holds the latest stock of every pair: {server.stock == latest}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,529 @@
+"""
+End-to-end load test: webhook bursts, then concurrent pickers, against a local server
+
+Starts a stub of the order, inventory and customer services, and the app
+under uvicorn in its own process on a scratch SQLite database. Then runs two
+phases:
+
+1. webhooks: --bursts bursts --burst-interval seconds apart, each sending
+   product, inventory, customer, order and order update webhooks shaped like
+   the payloads in postman/Picker Webhooks.postman_collection.json (--batch
+   entries per request), --webhook-concurrency requests at a time. The phase
+   ends when every order can be read back, so queued webhooks are included.
+2. picking: --pickers simulated pickers take the ingested orders one by one:
+   start, read the items, one add-item per unit (--scan-interval-ms apart),
+   complete.
+
+Reports p50/p95/p99/max latency, throughput and error rate per endpoint and
+phase, and writes them to --output as JSON, together with the arguments, the
+app settings taken from the environment (DB_PROFILE, WEBHOOK_QUEUE_ENABLED,
+...) and the git commit. --compare takes the output of an earlier run and
+prints how each endpoint's p95, throughput and error rate moved. It exits 1
+when a p95 grew by more than --regression-percent or an error rate went up.
+The payloads are generated from --seed, so runs with the same arguments send
+the same requests.
+
+Usage:
+    python benchmarks/load_test.py [--bursts 5] [--orders 40] [--pickers 8] [--output load_test.json] [--compare previous.json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Id ranges of the generated entities, starting at the ids used in the postman collection
+PRODUCT_BASE = 111294943
+CUSTOMER_BASE = 295373
+ORDER_BASE = 28555
+REFERENCE_BASE = 2346
+STORE_BASE = 6402
+
+BRANDS = ("Regular Choice", "Daily Fresh", "Green Farm", "Golden Harvest", "Home Basics", "Sunrise")
+GOODS = ("Longer Rice", "Basmati Rice", "Toor Dal", "Wheat Flour", "Sunflower Oil", "Sugar", "Tea", "Salt", "Poha", "Rava")
+SIZES = ("500 g", "1 Kg", "2 Kg", "5 Kg", "1 L", "5 L")
+FIRST_NAMES = ("Nipun", "Asha", "Ravi", "Meera", "Karan", "Divya", "Arjun", "Sana", "Vikram", "Priya")
+LAST_NAMES = ("Sharma", "Iyer", "Patel", "Reddy", "Khan", "Menon", "Das", "Gupta")
+
+
+# ==================== Stub upstream services ====================
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        # "METHOD /service/resource" -> calls
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every call to the order, inventory and customer services with 200 after the stub's latency"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _answer(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+        with self.server._lock:
+            self.server.calls[f"{self.command} /{'/'.join(self.path.split('/')[1:3])}"] += 1
+        body = b'{"success": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+# ==================== Payloads ====================
+
+class Workload:
+    """Catalog, customers and the webhook requests of each burst, generated from a seed"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.stores = [STORE_BASE + n for n in range(args.stores)]
+        self.products = [self._product(n) for n in range(args.products)]
+        self.references = []
+
+    def _product(self, n: int) -> dict:
+        name = f"{self.random.choice(BRANDS)} {self.random.choice(GOODS)} - {self.random.choice(SIZES)}"
+        return {
+            "id": PRODUCT_BASE + n,
+            "clientItemId": str(n + 1),
+            "name": name,
+            "status": "ENABLED",
+            "mrp": self.random.choice((45, 60, 99, 120, 180, 240, 390, 560))
+        }
+
+    def _store_data(self, product: dict) -> list:
+        return [
+            {"storeId": store, "stock": self.random.randint(20, 500), "mrp": product["mrp"], "discount": product["mrp"] // 10}
+            for store in self.stores
+        ]
+
+    def _customer(self, customer_id: int) -> dict:
+        first, last = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+        return {
+            "id": customer_id,
+            "name": f"{first} {last}",
+            "defaultEmail": {"email": f"{first.lower()}.{last.lower()}{customer_id % 1000}@example.com"},
+            "defaultPhone": {"phone": f"+9199{customer_id:08d}"[:13]}
+        }
+
+    def _order(self, n: int) -> dict:
+        customer_id = CUSTOMER_BASE + self.random.randrange(self.args.customers)
+        store = self.random.choice(self.stores)
+        items = []
+        amount = discount = 0.0
+        for product in self.random.sample(self.products, self.random.randint(1, min(self.args.max_items, len(self.products)))):
+            quantity = self.random.choice((1, 1, 1, 2, 2, 3))
+            amount += product["mrp"] * quantity
+            discount += product["mrp"] // 10 * quantity
+            items.append({
+                "id": product["id"],
+                "name": product["name"],
+                "orderDetails": {
+                    "orderedQuantity": f"{quantity:.5f}",
+                    "mrp": f"{product['mrp']:.5f}",
+                    "discount": f"{product['mrp'] // 10:.5f}"
+                },
+                "storeSpecificData": [{"storeId": store, "stock": self.random.randint(20, 500), "mrp": product["mrp"], "discount": product["mrp"] // 10}]
+            })
+        return {
+            "id": ORDER_BASE + n,
+            "referenceNumber": str(REFERENCE_BASE + n),
+            "customerId": str(customer_id),
+            "status": "PENDING",
+            "amount": f"{amount:.2f}",
+            "discount": f"{discount:.2f}",
+            "shipping": "0.00",
+            "pickupLocation": {"id": store},
+            "items": items
+        }
+
+    def _batches(self, entries: list, wrap) -> list:
+        size = self.args.batch
+        return [(wrap(entries[i:i + size] if size > 1 else entries[i]), len(entries[i:i + size])) for i in range(0, len(entries), size)]
+
+    def burst(self, number: int) -> list:
+        """(endpoint, path, payload, rows) of one burst's webhook requests"""
+        args = self.args
+        requests = []
+        products = self.random.sample(self.products, min(args.products_per_burst, len(self.products)))
+        for payload, rows in self._batches(
+            [{**{k: v for k, v in p.items() if k != "mrp"}, "storeSpecificData": self._store_data(p)} for p in products],
+            lambda entries: {"product": entries}
+        ):
+            requests.append(("POST /webhook/product", "/webhook/product", payload, rows))
+        stock = [
+            {"productId": self.random.choice(self.products)["id"], "storeId": self.random.choice(self.stores), "stock": self.random.randint(0, 500)}
+            for _ in range(args.inventory_per_burst)
+        ]
+        for payload, rows in self._batches(stock, lambda entries: {"inventory": entries}):
+            requests.append(("POST /webhook/inventory", "/webhook/inventory", payload, rows))
+
+        orders = [self._order(number * args.orders + n) for n in range(args.orders)]
+        customers = [self._customer(customer_id) for customer_id in sorted({int(o["customerId"]) for o in orders})]
+        for payload, rows in self._batches(customers, lambda entries: {"customer": entries}):
+            requests.append(("POST /webhook/customer", "/webhook/customer", payload, rows))
+        for payload, rows in self._batches(orders, lambda entries: {"code": 200, "status": "SUCCESS", "data": {"order": entries if isinstance(entries, list) else [entries]}}):
+            requests.append(("POST /packer-order/create", "/packer-order/create", payload, rows))
+
+        # Upstream resends for orders of earlier bursts; the status stays PENDING so picking is unaffected
+        updates = [
+            {
+                "referenceNumber": reference,
+                "status": "PENDING",
+                "packageMetaData": {"packages": {"label": {"weight": 500, "items": {}}}}
+            }
+            for reference in self.random.sample(self.references, min(args.orders // 4, len(self.references)))
+        ]
+        for payload, rows in self._batches(updates, lambda entries: {"order": entries}):
+            requests.append(("POST /webhook/order/update", "/webhook/order/update", payload, rows))
+        self.references += [o["referenceNumber"] for o in orders]
+        self.random.shuffle(requests)
+        return requests
+
+
+# ==================== Measurement ====================
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Recorder:
+    """Latency, outcome and rows of every request of a phase, by endpoint"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        # endpoint -> [(ms, ok, rows)]
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.started = time.perf_counter()
+        self.finished = None
+
+    async def call(self, endpoint: str, method: str, path: str, rows: int = 1, **kwargs):
+        """Send one request; returns the response, or None when it failed without one"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.samples[endpoint].append(((time.perf_counter() - started) * 1000, response is not None and response.status_code < 400, rows))
+        self.statuses[endpoint][str(status)] += 1
+        return response
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        seconds = (self.finished or time.perf_counter()) - self.started
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = [ms for ms, _, _ in samples]
+            errors = sum(1 for _, ok, _ in samples if not ok)
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "statuses": dict(self.statuses[endpoint]),
+                "throughput_rps": round(len(samples) / seconds, 2),
+                "rows_per_second": round(sum(rows for _, ok, rows in samples if ok) / seconds, 2),
+                "p50_ms": round(_percentile(latencies, 0.5), 2),
+                "p95_ms": round(_percentile(latencies, 0.95), 2),
+                "p99_ms": round(_percentile(latencies, 0.99), 2),
+                "max_ms": round(max(latencies), 2),
+                "mean_ms": round(sum(latencies) / len(latencies), 2)
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        errors = sum(e["errors"] for e in endpoints.values())
+        return {
+            "seconds": round(seconds, 3),
+            "requests": total,
+            "throughput_rps": round(total / seconds, 2) if seconds else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "endpoints": endpoints
+        }
+
+
+# ==================== Phases ====================
+
+async def _webhook_phase(client: httpx.AsyncClient, workload: Workload, args) -> tuple:
+    recorder = Recorder(client)
+    semaphore = asyncio.Semaphore(args.webhook_concurrency)
+
+    async def send(endpoint: str, path: str, payload, rows: int):
+        async with semaphore:
+            await recorder.call(endpoint, "POST", path, rows, json=payload)
+
+    for number in range(args.bursts):
+        if number:
+            await asyncio.sleep(args.burst_interval)
+        await asyncio.gather(*(send(*request) for request in workload.burst(number)))
+    sent = time.perf_counter()
+
+    # Queued webhooks are applied by the server's workers; wait until every order can be read
+    order_ids = await _ingested_orders(client, set(workload.references), args.settle_timeout)
+    recorder.finish()
+    summary = recorder.summary()
+    summary["orders_sent"] = len(workload.references)
+    summary["orders_ingested"] = len(order_ids)
+    summary["ingest_lag_seconds"] = round(recorder.finished - sent, 3)
+    return summary, order_ids
+
+
+async def _ingested_orders(client: httpx.AsyncClient, references: set, timeout: float) -> list:
+    deadline = time.perf_counter() + timeout
+    while True:
+        found = {}
+        skip = 0
+        while True:
+            page = (await client.get("/api/v1/orders", params={"skip": skip, "limit": 500})).json()
+            found.update({order["reference_number"]: order["id"] for order in page if order["reference_number"] in references})
+            if len(page) < 500:
+                break
+            skip += 500
+        if len(found) == len(references) or time.perf_counter() > deadline:
+            return sorted(found.values())
+        await asyncio.sleep(0.2)
+
+
+async def _picking_phase(client: httpx.AsyncClient, order_ids: list, args) -> dict:
+    recorder = Recorder(client)
+    queue = asyncio.Queue()
+    for order_id in order_ids:
+        queue.put_nowait(order_id)
+    completed = 0
+
+    async def picker():
+        nonlocal completed
+        while not queue.empty():
+            order_id = queue.get_nowait()
+            response = await recorder.call("POST /api/v1/picking/start/{order_id}", "POST", f"/api/v1/picking/start/{order_id}")
+            if response is None or response.status_code >= 400:
+                continue
+            response = await recorder.call("GET /api/v1/orders/{order_id}/items", "GET", f"/api/v1/orders/{order_id}/items")
+            if response is None or response.status_code >= 400:
+                continue
+            for item in response.json()["items"]:
+                remaining = item["ordered_quantity"] - item["picked_quantity"]
+                for _ in range(math.ceil(remaining)):
+                    await asyncio.sleep(args.scan_interval_ms / 1000)
+                    await recorder.call(
+                        "POST /api/v1/picking/add-item", "POST", "/api/v1/picking/add-item",
+                        json={"order_id": order_id, "product_id": item["product_id"], "method": "scan", "quantity": min(remaining, 1.0)}
+                    )
+                    remaining -= 1
+            response = await recorder.call("POST /api/v1/picking/complete/{order_id}", "POST", f"/api/v1/picking/complete/{order_id}")
+            if response is not None and response.status_code < 400:
+                completed += 1
+
+    await asyncio.gather(*(picker() for _ in range(args.pickers)))
+    recorder.finish()
+    summary = recorder.summary()
+    summary["orders_completed"] = completed
+    summary["orders_per_second"] = round(completed / summary["seconds"], 2) if summary["seconds"] else 0.0
+    return summary
+
+
+async def _load(base_url: str, args) -> dict:
+    workload = Workload(args)
+    limits = httpx.Limits(max_connections=args.webhook_concurrency + args.pickers + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        webhooks, order_ids = await _webhook_phase(client, workload, args)
+        picking = await _picking_phase(client, order_ids, args)
+    return {"webhooks": webhooks, "picking": picking}
+
+
+# ==================== Server ====================
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    stub = StubServer(args.upstream_latency_ms / 1000)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    port = _free_port()
+    # Loads .env into os.environ, as it will in the server
+    import config
+    with tempfile.TemporaryDirectory() as scratch:
+        # The order, inventory and customer clients all call ORDER_SERVICE_HOST
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{scratch}/load.db", ORDER_SERVICE_HOST=stub_url, DEBUG="False")
+        # App settings the server runs with, recorded with the results
+        settings = {name: env[name] for name in sorted(dir(config)) if name.isupper() and name in env}
+        log_path = Path(scratch) / "server.log"
+        with open(log_path, "w") as log:
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+                cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                deadline = time.monotonic() + 30
+                while True:
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f"Server did not start:\n{log_path.read_text()[-2000:]}")
+                    try:
+                        if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    time.sleep(0.1)
+                phases = asyncio.run(_load(base_url, args))
+                # Let the outbox finish so the upstream call counts are complete
+                time.sleep(args.drain_seconds)
+            finally:
+                server.terminate()
+                try:
+                    server.wait(15)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+    stub.shutdown()
+    return {
+        "run": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "arguments": {name: value for name, value in vars(args).items() if name not in ("output", "compare")},
+            # The scratch database and stub host differ on every run
+            "settings": settings
+        },
+        "phases": phases,
+        "upstream_calls": dict(sorted(stub.calls.items()))
+    }
+
+
+# ==================== Report ====================
+
+def _print_results(results: dict):
+    for name, phase in results["phases"].items():
+        print(
+            f"\n{name}: {phase['requests']} requests in {phase['seconds']:.1f} s, "
+            f"{phase['throughput_rps']:.1f} req/s, {phase['error_rate'] * 100:.2f}% errors"
+        )
+        if name == "webhooks":
+            print(f"  {phase['orders_ingested']}/{phase['orders_sent']} orders ingested, last one {phase['ingest_lag_seconds']:.2f} s after the last webhook answer")
+        else:
+            print(f"  {phase['orders_completed']} orders picked and packed, {phase['orders_per_second']:.2f} orders/s")
+        print(f"  {'endpoint':<42} {'requests':>8} {'req/s':>8} {'rows/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'errors':>7}")
+        for endpoint, e in phase["endpoints"].items():
+            print(
+                f"  {endpoint:<42} {e['requests']:>8} {e['throughput_rps']:>8.1f} {e['rows_per_second']:>8.1f} "
+                f"{e['p50_ms']:>6.1f}ms {e['p95_ms']:>6.1f}ms {e['p99_ms']:>6.1f}ms {e['max_ms']:>6.1f}ms {e['error_rate'] * 100:>6.2f}%"
+            )
+    print(f"\nupstream calls: {results['upstream_calls']}")
+
+
+def compare(previous: dict, current: dict, regression_percent: float) -> bool:
+    """Print each endpoint's p95, throughput and error rate against an earlier run; True when something regressed"""
+    regressed = False
+    print(f"\nagainst {previous['run'].get('git_commit')} ({previous['run'].get('started_at')}):")
+    changed = sorted(
+        name for name in set(previous["run"]["arguments"]) | set(current["run"]["arguments"])
+        if previous["run"]["arguments"].get(name) != current["run"]["arguments"].get(name)
+    )
+    if changed:
+        print(f"  note: the runs used different arguments ({', '.join(changed)}), so the numbers may not be comparable")
+    print(f"  {'endpoint':<52} {'p95 ms':>22} {'req/s':>20} {'errors':>16}")
+    for name, phase in current["phases"].items():
+        before = previous["phases"].get(name, {}).get("endpoints", {})
+        for endpoint, e in phase["endpoints"].items():
+            old = before.get(endpoint)
+            if old is None:
+                print(f"  {name + ' ' + endpoint:<52} (new)")
+                continue
+            change = (e["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+            worse = change > regression_percent or e["error_rate"] > old["error_rate"]
+            regressed |= worse
+            print(
+                f"{'!' if worse else ' '} {name + ' ' + endpoint:<52} {old['p95_ms']:>7.1f} -> {e['p95_ms']:<7.1f}{change:+5.0f}% "
+                f"{old['throughput_rps']:>7.1f} -> {e['throughput_rps']:<7.1f} "
+                f"{old['error_rate'] * 100:>5.2f}% -> {e['error_rate'] * 100:.2f}%"
+            )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-interval", type=float, default=0.5, help="seconds between bursts")
+    parser.add_argument("--orders", type=int, default=40, help="new orders per burst")
+    parser.add_argument("--products", type=int, default=300, help="catalog size")
+    parser.add_argument("--products-per-burst", type=int, default=60)
+    parser.add_argument("--inventory-per-burst", type=int, default=100)
+    parser.add_argument("--customers", type=int, default=150)
+    parser.add_argument("--stores", type=int, default=2)
+    parser.add_argument("--max-items", type=int, default=6, help="most distinct products in one order")
+    parser.add_argument("--batch", type=int, default=10, help="entries per webhook request (1: single-entity payloads)")
+    parser.add_argument("--webhook-concurrency", type=int, default=8)
+    parser.add_argument("--pickers", type=int, default=8)
+    parser.add_argument("--scan-interval-ms", type=float, default=20.0, help="picker pause before each scan")
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0, help="stub service answer time")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--settle-timeout", type=float, default=60.0, help="longest wait for queued orders to be ingested")
+    parser.add_argument("--drain-seconds", type=float, default=1.0, help="wait after picking for outbox deliveries")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="load_test.json", help="where to write the results")
+    parser.add_argument("--compare", help="results of an earlier run to compare against")
+    parser.add_argument("--regression-percent", type=float, default=20.0, help="p95 growth flagged as a regression")
+    args = parser.parse_args()
+
+    print(
+        f"{args.bursts} bursts of {args.orders} orders, {args.pickers} pickers scanning every {args.scan_interval_ms} ms, "
+        f"upstreams answering in {args.upstream_latency_ms} ms ({os.cpu_count()} CPUs)"
+    )
+    results = run(args)
+    _print_results(results)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.compare:
+        with open(args.compare) as previous:
+            regressed = compare(json.load(previous), results, args.regression_percent)
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Scan latency during a login storm, with bcrypt on the event loop and on the hashing pool
+
+Runs the app under uvicorn against a scratch SQLite database, once with
+PASSWORD_HASH_WORKERS=0 (bcrypt inline on the event loop, the previous
+behaviour) and once with --workers hashing threads. In each run --scanners
+clients post add-item scans every --scan-interval-ms, first alone for
+--seconds and then while --logins agents log in at the same time. Reports scan
+p50/p99/max before and during the storm, how long the storm took, login
+latency and logins refused with 503.
+
+Usage:
+    python benchmarks/login_storm.py [--logins 40] [--scanners 10] [--workers N] [--seconds 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PASSWORD = "storm-password"
+
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def _seed(logins: int) -> None:
+    """Agents sharing one password hash, so seeding does not pay for bcrypt per agent"""
+    from models import SessionLocal, create_agent, unit_of_work
+    from utils.auth import hash_password
+    hashed = hash_password(PASSWORD)
+    db = SessionLocal()
+    try:
+        with unit_of_work(db):
+            for n in range(logins):
+                create_agent(db, f"storm-{n}", hashed)
+    finally:
+        db.close()
+
+
+async def _storm(base_url: str, args) -> dict:
+    import httpx
+    limits = httpx.Limits(max_connections=args.logins + args.scanners + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        order = {
+            "id": 1, "referenceNumber": "STORM-1", "pickupLocation": {"id": 1}, "customer": {"id": "c1", "name": "C"},
+            "items": [{"id": 1, "name": "p1", "slug": "p1", "orderDetails": {"orderedQuantity": 10 ** 9}}]
+        }
+        (await client.post("/packer-order/create", json={"code": 200, "status": "SUCCESS", "data": {"order": [order]}})).raise_for_status()
+        order_id = (await client.get("/api/v1/orders")).json()[0]["id"]
+        product_id = (await client.get(f"/api/v1/orders/{order_id}/items")).json()["items"][0]["product_id"]
+        (await client.post(f"/api/v1/picking/start/{order_id}")).raise_for_status()
+
+        phase = {"name": "warmup"}
+        latencies = {"warmup": [], "baseline": [], "storm": []}
+        stop = asyncio.Event()
+
+        async def scanner():
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = await client.post("/api/v1/picking/add-item", json={"order_id": order_id, "product_id": product_id})
+                response.raise_for_status()
+                latencies[phase["name"]].append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(args.scan_interval_ms / 1000)
+
+        async def login(n: int):
+            started = time.perf_counter()
+            response = await client.post("/api/v1/agents/login", data={"username": f"storm-{n}", "password": PASSWORD})
+            return response.status_code, (time.perf_counter() - started) * 1000
+
+        scanners = [asyncio.create_task(scanner()) for _ in range(args.scanners)]
+        await asyncio.sleep(0.5)
+        phase["name"] = "baseline"
+        await asyncio.sleep(args.seconds)
+        phase["name"] = "storm"
+        started = time.perf_counter()
+        logins = await asyncio.gather(*(login(n) for n in range(args.logins)))
+        storm_seconds = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*scanners)
+        hashing = (await client.get("/api/v1/agents/password-hashing/metrics")).json()
+
+    login_ms = [ms for status, ms in logins if status == 200]
+    return {
+        "baseline_p50": _percentile(latencies["baseline"], 0.5),
+        "baseline_p99": _percentile(latencies["baseline"], 0.99),
+        "storm_p50": _percentile(latencies["storm"], 0.5),
+        "storm_p99": _percentile(latencies["storm"], 0.99),
+        "storm_max": max(latencies["storm"], default=0.0),
+        "storm_scans": len(latencies["storm"]),
+        "storm_seconds": storm_seconds,
+        "logins_ok": len(login_ms),
+        "logins_refused": sum(1 for status, _ in logins if status == 503),
+        "login_p50": _percentile(login_ms, 0.5),
+        "login_p99": _percentile(login_ms, 0.99),
+        "queue_ms_p99": hashing["queue_ms_p99"]
+    }
+
+
+def _run(args) -> None:
+    """One measurement in this process, configured by the environment set by main()"""
+    sys.path.insert(0, str(ROOT))
+    os.chdir(ROOT)
+    import logging
+    logging.disable(logging.WARNING)
+    import uvicorn
+    import main as app_main
+    from models import init_db
+
+    init_db()
+    _seed(args.logins)
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        print(json.dumps(asyncio.run(_storm(f"http://127.0.0.1:{port}", args))))
+    finally:
+        server.should_exit = True
+        thread.join(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--scanners", type=int, default=10)
+    parser.add_argument("--scan-interval-ms", type=float, default=20.0)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        _run(args)
+        return
+
+    print(
+        f"{args.logins} logins during scans from {args.scanners} clients every {args.scan_interval_ms} ms "
+        f"({os.cpu_count()} CPUs)"
+    )
+    print(
+        f"{'bcrypt':<16} {'scan p50/p99 before':>20} {'scan p50/p99/max during':>24} {'storm s':>8} "
+        f"{'login p50/p99':>14} {'refused':>8}"
+    )
+    for name, workers in (("on event loop", 0), (f"pool, {args.workers} threads", args.workers)):
+        with tempfile.TemporaryDirectory() as scratch:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{scratch}/storm.db",
+                PASSWORD_HASH_WORKERS=str(workers),
+                WEBHOOK_QUEUE_ENABLED="False", OUTBOX_ENABLED="False", INVENTORY_PUSH_ENABLED="False", DEBUG="False"
+            )
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", *sys.argv[1:]], env=env, check=True, capture_output=True, text=True
+            ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{name:<16} {r['baseline_p50']:>9.1f}/{r['baseline_p99']:<7.1f} ms "
+            f"{r['storm_p50']:>8.1f}/{r['storm_p99']:.1f}/{r['storm_max']:<6.1f} ms {r['storm_seconds']:>8.1f} "
+            f"{r['login_p50'] / 1000:>6.1f}/{r['login_p99'] / 1000:<5.1f} s {r['logins_refused']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
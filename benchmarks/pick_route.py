@@ -0,0 +1,67 @@
+"""
+Pick route length on synthetic stores
+
+Builds stores of --aisles aisles with --racks racks each and draws random orders
+of --items items at random (aisle, rack) locations. Each order is walked in four
+ways: in insertion order (what GET /orders/{id}/items returns), sorted by
+location, serpentine and serpentine + 2-opt (services.pick_route). Reports the
+mean walk length, the reduction against insertion order and the planning time.
+
+Usage:
+    python benchmarks/pick_route.py [--aisles 12] [--racks 20] [--items 5 15 30 60] [--orders 200]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.pick_route import StoreLayout, plan_route, route_length, serpentine  # noqa: E402
+
+
+def _orders(rng: random.Random, aisles: int, racks: int, items: int, orders: int) -> list:
+    return [
+        [(f"A{rng.randint(1, aisles)}", f"R{rng.randint(1, racks)}") for _ in range(items)]
+        for _ in range(orders)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--aisles", type=int, default=12)
+    parser.add_argument("--racks", type=int, default=20)
+    parser.add_argument("--items", type=int, nargs="*", default=[5, 15, 30, 60])
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    layout = StoreLayout([(f"A{a}", f"R{r}") for a in range(1, args.aisles + 1) for r in range(1, args.racks + 1)])
+    print(f"store: {args.aisles} aisles x {args.racks} racks, {args.orders} random orders per size")
+    print(f"{'items':>5} {'insertion':>10} {'sorted':>16} {'serpentine':>16} {'2-opt':>16} {'plan time':>10}")
+    for items in args.items:
+        lengths = {"insertion": [], "sorted": [], "serpentine": [], "2-opt": []}
+        plan_times = []
+        for locations in _orders(rng, args.aisles, args.racks, items, args.orders):
+            points = list(dict.fromkeys(layout.position(aisle, rack) for aisle, rack in locations))
+            lengths["insertion"].append(route_length(points, layout.distance))
+            lengths["sorted"].append(route_length(sorted(points), layout.distance))
+            lengths["serpentine"].append(route_length(serpentine(points), layout.distance))
+            started = time.perf_counter()
+            planned = plan_route(points, layout.distance)
+            plan_times.append(time.perf_counter() - started)
+            lengths["2-opt"].append(route_length(planned, layout.distance))
+
+        base = statistics.mean(lengths["insertion"])
+        cells = [f"{base:>10.1f}"]
+        for name in ("sorted", "serpentine", "2-opt"):
+            mean = statistics.mean(lengths[name])
+            cells.append(f"{mean:>8.1f} ({1 - mean / base:>4.0%})")
+        print(f"{items:>5} {' '.join(cells)} {statistics.mean(plan_times) * 1000:>7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Read/write throughput of each storage profile on SQLite
+
+For every profile in STORAGE_PROFILES a scratch database is seeded with orders,
+then worker threads run a picker-like mix against it for a fixed time: reads
+load an order with its items, writes record a picked quantity and log a picking
+activity (two commits). Reports operations per second, read/write p95 latency
+and the number of operations that failed (e.g. "database is locked").
+
+Usage:
+    python benchmarks/storage_profiles.py [--threads 8] [--duration 5] [--write-ratio 0.3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import models as crud  # noqa: E402
+from models import Order, OrderItem, init_db  # noqa: E402
+from models.database import STORAGE_PROFILES, create_db_engine  # noqa: E402
+
+ORDERS = 200
+ITEMS_PER_ORDER = 5
+
+
+def _seed(Session):
+    db = Session()
+    try:
+        for i in range(1, ORDERS + 1):
+            order = Order(order_id=i, reference_number=f"BENCH-{i}", customer_id=f"c{i}", amount=100)
+            order.items = [OrderItem(ordered_quantity=3, mrp=10) for _ in range(ITEMS_PER_ORDER)]
+            db.add(order)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _p95(values: list) -> float:
+    values = sorted(values) or [0.0]
+    return values[max(int(len(values) * 0.95) - 1, 0)]
+
+
+def _run(profile: str, threads: int, duration: float, write_ratio: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="picker-profile-")
+    engine = create_db_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", profile)
+    init_db(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    _seed(Session)
+
+    reads, writes, errors = [], [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        db = Session()
+        local_reads, local_writes, local_errors = [], [], 0
+        try:
+            while time.perf_counter() < deadline:
+                order_id = rng.randint(1, ORDERS)
+                started = time.perf_counter()
+                try:
+                    if rng.random() < write_ratio:
+                        item_id = (order_id - 1) * ITEMS_PER_ORDER + rng.randint(1, ITEMS_PER_ORDER)
+                        crud.update_order_item_picked_quantity(db, item_id, rng.randint(0, 3))
+                        crud.create_picking_activity(db, order_id, "BARCODE_SCAN", quantity=1)
+                        local_writes.append(time.perf_counter() - started)
+                    else:
+                        crud.get_order(db, order_id)
+                        crud.get_order_items(db, order_id)
+                        db.rollback()  # end the read transaction like a request-scoped session would
+                        local_reads.append(time.perf_counter() - started)
+                except Exception:
+                    db.rollback()
+                    local_errors += 1
+        finally:
+            db.close()
+        with lock:
+            reads.extend(local_reads)
+            writes.extend(local_writes)
+            errors[0] += local_errors
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    engine.dispose()
+
+    return {
+        "ops": (len(reads) + len(writes)) / duration,
+        "read_p95": _p95(reads),
+        "write_p95": _p95(writes),
+        "errors": errors[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--profiles", nargs="*", default=list(STORAGE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads, {args.duration}s per profile, {args.write_ratio:.0%} writes")
+    print(f"{'profile':<12} {'ops/s':>8} {'read p95':>10} {'write p95':>10} {'errors':>7}")
+    for profile in args.profiles:
+        result = _run(profile, args.threads, args.duration, args.write_ratio)
+        print(f"{profile:<12} {result['ops']:>8.0f} {result['read_p95'] * 1000:>7.1f} ms"
+              f" {result['write_p95'] * 1000:>7.1f} ms {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,110 @@ load_dotenv()
 
 # Database
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./picker_app.db")
+# Async driver URL used by the API routes (aiosqlite locally, asyncpg for Postgres); derived from DATABASE_URL by default
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or (
+    DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1) if DATABASE_URL.startswith("sqlite://")
+    else DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+# Storage profile (see STORAGE_PROFILES in models/database.py): legacy, balanced, durable or throughput
+DB_PROFILE = os.getenv("DB_PROFILE", "balanced")
+# Optional overrides of the profile's connection pool sizing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0")) or None
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW")) if os.getenv("DB_MAX_OVERFLOW") else None
 
 # External Services
 ORDER_SERVICE_HOST = os.getenv("ORDER_SERVICE_HOST", "http://localhost:8001")
 ORDER_SERVICE_USER_ID = os.getenv("ORDER_SERVICE_USER_ID", "1")
 ORGANIZATION_ID = os.getenv("ORGANIZATION_ID", "5")
 
+# Shared HTTP transport for the order, inventory and customer service clients
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))  # idle connections kept open
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "False") == "True"  # needs the h2 package
+
+# Retries, circuit breaker and hedging of the service clients (defaults of services.resilience.ServicePolicy)
+SERVICE_RETRY_ATTEMPTS = int(os.getenv("SERVICE_RETRY_ATTEMPTS", "3"))  # tries per idempotent call
+SERVICE_RETRY_BACKOFF_SECONDS = float(os.getenv("SERVICE_RETRY_BACKOFF_SECONDS", "0.2"))
+SERVICE_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("SERVICE_RETRY_BACKOFF_MAX_SECONDS", "2.0"))
+CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))  # failures in a row that open a host's breaker
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))  # until a probe call is let through
+# A GET not answered after this many seconds is sent a second time; 0 disables hedging
+SERVICE_HEDGE_AFTER_SECONDS = float(os.getenv("SERVICE_HEDGE_AFTER_SECONDS", "0"))
+
+# Read-through cache of the service clients' GETs (services/read_cache.py)
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "True") == "True"
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "10000"))  # entries per cached method
+READ_CACHE_STALE_SECONDS = float(os.getenv("READ_CACHE_STALE_SECONDS", "60"))  # served past the TTL while refreshing
+READ_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("READ_CACHE_NEGATIVE_TTL_SECONDS", "30"))  # for 404 answers
+READ_CACHE_REFRESH_WORKERS = int(os.getenv("READ_CACHE_REFRESH_WORKERS", "4"))
+ORDER_CACHE_TTL_SECONDS = float(os.getenv("ORDER_CACHE_TTL_SECONDS", "30"))
+INVENTORY_CACHE_TTL_SECONDS = float(os.getenv("INVENTORY_CACHE_TTL_SECONDS", "5"))
+CUSTOMER_CACHE_TTL_SECONDS = float(os.getenv("CUSTOMER_CACHE_TTL_SECONDS", "300"))
+
+# Webhook queue
+# When enabled, webhook endpoints persist the payload and return 202; background workers do the DB work
+WEBHOOK_QUEUE_ENABLED = os.getenv("WEBHOOK_QUEUE_ENABLED", "True") == "True"
+WEBHOOK_QUEUE_WORKERS = int(os.getenv("WEBHOOK_QUEUE_WORKERS", "2"))
+WEBHOOK_QUEUE_POLL_INTERVAL = float(os.getenv("WEBHOOK_QUEUE_POLL_INTERVAL", "1.0"))  # seconds
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "3"))
+WEBHOOK_QUEUE_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_QUEUE_BACKOFF_BASE_SECONDS", "2.0"))
+WEBHOOK_QUEUE_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_QUEUE_BACKOFF_MAX_SECONDS", "300"))
+# A PROCESSING job whose heartbeat (refreshed every third of this while it runs) is older than this
+# is taken to be abandoned by a dead worker and is requeued
+WEBHOOK_QUEUE_VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_QUEUE_VISIBILITY_TIMEOUT_SECONDS", "300"))
+WEBHOOK_JOB_RETENTION_HOURS = int(os.getenv("WEBHOOK_JOB_RETENTION_HOURS", "72"))
+# Bodies larger than this (or of unknown length) are parsed incrementally and handled in chunks
+WEBHOOK_STREAM_THRESHOLD_BYTES = int(os.getenv("WEBHOOK_STREAM_THRESHOLD_BYTES", str(1024 * 1024)))
+WEBHOOK_STREAM_CHUNK_SIZE = int(os.getenv("WEBHOOK_STREAM_CHUNK_SIZE", "500"))  # items per chunk
+
+# Outbox (order service / inventory service updates delivered in the background)
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "True") == "True"
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))  # seconds
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))  # messages claimed per poll
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))  # then the message is dead-lettered
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "2.0"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "600"))
+# A message SENDING for longer than this is taken to be abandoned by a dead dispatcher and is requeued;
+# keep it well above OUTBOX_DELIVERY_DEADLINE_SECONDS
+OUTBOX_VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_VISIBILITY_TIMEOUT_SECONDS", "120"))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "72"))  # for SENT messages
+# Each batch is sent concurrently (at most this many calls at once), all calls sharing one deadline
+OUTBOX_DELIVERY_CONCURRENCY = int(os.getenv("OUTBOX_DELIVERY_CONCURRENCY", "10"))
+OUTBOX_DELIVERY_DEADLINE_SECONDS = float(os.getenv("OUTBOX_DELIVERY_DEADLINE_SECONDS", "10.0"))
+# When enabled, /picking/complete sends its own messages before answering, within this deadline
+OUTBOX_INLINE_DELIVERY = os.getenv("OUTBOX_INLINE_DELIVERY", "False") == "True"
+OUTBOX_INLINE_DEADLINE_SECONDS = float(os.getenv("OUTBOX_INLINE_DEADLINE_SECONDS", "3.0"))
+
+# Inventory push batching: stock updates for the inventory service are collected for a short
+# window, collapsed to the latest value per (product, store) and sent as one concurrent batch
+INVENTORY_PUSH_ENABLED = os.getenv("INVENTORY_PUSH_ENABLED", "True") == "True"
+INVENTORY_PUSH_WINDOW_SECONDS = float(os.getenv("INVENTORY_PUSH_WINDOW_SECONDS", "0.05"))
+INVENTORY_PUSH_MAX_BATCH = int(os.getenv("INVENTORY_PUSH_MAX_BATCH", "200"))  # pairs that flush before the window ends
+INVENTORY_PUSH_MAX_PENDING = int(os.getenv("INVENTORY_PUSH_MAX_PENDING", "5000"))  # then submitters wait
+INVENTORY_PUSH_CONCURRENCY = int(os.getenv("INVENTORY_PUSH_CONCURRENCY", "10"))
+INVENTORY_PUSH_DEADLINE_SECONDS = float(os.getenv("INVENTORY_PUSH_DEADLINE_SECONDS", "10.0"))
+
+# Wave picking
+WAVE_MAX_ORDERS = int(os.getenv("WAVE_MAX_ORDERS", "50"))  # orders per wave
+PICK_ROUTE_CACHE_SIZE = int(os.getenv("PICK_ROUTE_CACHE_SIZE", "512"))  # cached layouts / routes
+
+# Webhook idempotency
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))  # in-memory LRU entries
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+
+# SQL instrumentation: statement counts and DB time per request and route, N+1 detection
+SQL_INSTRUMENTATION_ENABLED = os.getenv("SQL_INSTRUMENTATION_ENABLED", "True") == "True"
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))  # statements at least this slow are logged
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))  # runs of one statement shape per request
+SQL_SERVER_TIMING = os.getenv("SQL_SERVER_TIMING", "False") == "True"  # add a Server-Timing header to responses
+
+# Metrics at GET /metrics (Prometheus text format): request latency per route, DB pool wait and
+# SQL time; upstream calls, webhook rows and picking counters are recorded regardless
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+
 # Application
 DEBUG = os.getenv("DEBUG", "True") == "True"
 APP_NAME = "Picker App"
@@ -21,6 +119,18 @@ API_VERSION = "1.0.0"
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me-to-a-strong-secret")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(60 * 24)))  # default 24 hours
+# Verified tokens and their agent, so authenticated requests skip the database
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))  # 0 disables the cache
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))  # never past the token's expiry
+# Every this many seconds, drop principals whose agent changed in another process (0 = off, single process)
+PRINCIPAL_CACHE_SYNC_SECONDS = float(os.getenv("PRINCIPAL_CACHE_SYNC_SECONDS", "0"))
+# bcrypt hashing/verification runs on this many threads, off the event loop (0 = inline, on the loop)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "100"))  # waiting beyond the workers; more are refused with 503
+PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", "10"))  # queued longer: refused, not run
+# Bulk agent provisioning: threads hashing a batch's passwords, and the largest batch the API takes
+AGENT_PROVISIONING_WORKERS = int(os.getenv("AGENT_PROVISIONING_WORKERS", str(os.cpu_count() or 1)))
+AGENT_PROVISIONING_MAX_ROWS = int(os.getenv("AGENT_PROVISIONING_MAX_ROWS", "1000"))
 
 # Misc
 FRONTEND_DIR = os.getenv("FRONTEND_DIR", "frontend")
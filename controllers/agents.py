@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from models import (
-    get_db, Agent, create_agent, get_agent_by_username, 
-    get_all_agents, get_agent
-)
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import get_async_db, Agent
+from models.aio import create_agent, get_agent_by_username, get_all_agents, get_agent
 from .schemas import AgentRegister, AgentResponse, TokenResponse
-from utils.auth import create_access_token, verify_password, hash_password, oauth2_scheme, get_current_agent
+from utils.auth import create_access_token, oauth2_scheme, get_current_agent
+from services.password_hasher import password_hasher, PasswordHashBusy
+from services.agent_provisioning import provision_agents_async, parse_agents_csv, parse_agents_json
+from config import AGENT_PROVISIONING_MAX_ROWS
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 import logging
@@ -14,15 +15,26 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1/agents", tags=["agents"])
 
 
+def _hashing_busy(e: PasswordHashBusy) -> HTTPException:
+    logger.warning(f"Password hashing refused: {str(e)}")
+    return HTTPException(status_code=503, detail="Too many logins in progress, try again shortly", headers={"Retry-After": "1"})
+
+
 @router.post("/register", response_model=AgentResponse)
-async def register_agent(agent_data: AgentRegister, db: Session = Depends(get_db)):
+async def register_agent(agent_data: AgentRegister, db: AsyncSession = Depends(get_async_db)):
     """Register a new picker agent"""
-    existing = get_agent_by_username(db, agent_data.username)
+    existing = await get_agent_by_username(db, agent_data.username)
     if existing:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = hash_password(agent_data.password)
-    db_agent = create_agent(
+    # bcrypt runs on the hashing pool so the event loop keeps serving other requests; the
+    # session's connection goes back to the pool meanwhile
+    await db.commit()
+    try:
+        hashed_password = await password_hasher.hash(agent_data.password)
+    except PasswordHashBusy as e:
+        raise _hashing_busy(e)
+    db_agent = await create_agent(
         db,
         agent_data.username,
         hashed_password,
@@ -33,11 +45,36 @@ async def register_agent(agent_data: AgentRegister, db: Session = Depends(get_db
     return db_agent
 
 
+@router.post("/bulk")
+async def provision_agents_bulk(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Register many agents in one transaction
+
+    Body: a JSON list of agents (or {"agents": [...]}), or CSV with a header row
+    when the content type is text/csv. Returns the outcome of every row.
+    """
+    body = await request.body()
+    try:
+        body = body.decode("utf-8-sig")
+        rows = parse_agents_csv(body) if "csv" in request.headers.get("content-type", "") else parse_agents_json(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid agent list: {str(e)}")
+    if len(rows) > AGENT_PROVISIONING_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {AGENT_PROVISIONING_MAX_ROWS} agents per request")
+    return await provision_agents_async(db, rows)
+
+
 @router.post("/login", response_model=TokenResponse)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """Authenticate picker agent and return JWT token"""
-    agent = get_agent_by_username(db, form_data.username)
-    if not agent or not verify_password(form_data.password, agent.password_hash):
+    agent = await get_agent_by_username(db, form_data.username)
+    # Do not hold a pooled connection while waiting for a hashing worker
+    await db.commit()
+    try:
+        verified = agent is not None and await password_hasher.verify(form_data.password, agent.password_hash)
+    except PasswordHashBusy as e:
+        raise _hashing_busy(e)
+    if not verified:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     
     access_token_expires = timedelta(minutes=60*24)
@@ -51,19 +88,16 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 
 
 @router.get("/", response_model=list[AgentResponse])
-async def list_agents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def list_agents(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
     """List all agents"""
-    agents = get_all_agents(db, skip=skip, limit=limit)
+    agents = await get_all_agents(db, skip=skip, limit=limit)
     return agents
 
 
-@router.get("/{agent_id}", response_model=AgentResponse)
-async def get_agent_by_id(agent_id: int, db: Session = Depends(get_db)):
-    """Get agent by ID"""
-    agent = get_agent(db, agent_id)
-    if not agent:
-        raise HTTPException(status_code=404, detail="Agent not found")
-    return agent
+@router.get("/password-hashing/metrics")
+async def password_hashing_metrics():
+    """Occupancy, refusals and queue time of the password hashing pool"""
+    return password_hasher.metrics()
 
 
 @router.get("/me", response_model=AgentResponse)
@@ -71,3 +105,13 @@ async def read_current_agent(current_agent=Depends(get_current_agent)):
     """Get current authenticated agent info"""
     return current_agent
 
+
+@router.get("/{agent_id}", response_model=AgentResponse)
+async def get_agent_by_id(agent_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get agent by ID"""
+    agent = await get_agent(db, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return agent
+
+
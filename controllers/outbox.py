@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import get_async_db
+from models import aio as crud
+from services.outbox_dispatcher import outbox_dispatcher
+from services.inventory_push import inventory_push
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/v1", tags=["outbox"])
+
+
+@router.get("/outbox/metrics")
+async def get_outbox_metrics(db: AsyncSession = Depends(get_async_db)):
+    """Outbox depth, delivery lag and dispatcher counters"""
+    return await crud.run_sync(db, outbox_dispatcher.metrics)
+
+
+@router.get("/outbox/inventory-push/metrics")
+async def get_inventory_push_metrics():
+    """Pending stock updates, coalescing ratio and flush latency of the inventory push batcher"""
+    return inventory_push.metrics()
+
+
+@router.get("/outbox/messages")
+async def list_outbox_messages(status: Optional[str] = None, topic: Optional[str] = None, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    """List outbox messages, newest first (e.g. status=DEAD for the dead letters)"""
+    messages = await crud.get_outbox_messages(db, status=status, topic=topic, skip=skip, limit=limit)
+    return [
+        {
+            "id": message.id, "topic": message.topic, "key": message.message_key, "status": message.status,
+            "attempts": message.attempts, "last_error": message.last_error, "payload": message.payload,
+            "created_at": message.created_at, "next_attempt_at": message.next_attempt_at, "sent_at": message.sent_at
+        }
+        for message in messages
+    ]
+
+
+@router.post("/outbox/messages/retry")
+async def retry_dead_outbox_messages(message_ids: Optional[List[int]] = None, db: AsyncSession = Depends(get_async_db)):
+    """Re-drive dead-lettered messages: the given IDs, or all of them when no body is sent"""
+    async with crud.unit_of_work(db):
+        requeued = await crud.retry_dead_outbox_messages(db, message_ids)
+    outbox_dispatcher.wakeup()
+    return {"status": "success", "requeued": requeued}
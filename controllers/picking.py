@@ -1,29 +1,51 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from models import get_db
-from .schemas import AddItemRequest, PickingCompleteResponse
-from services import OrderServiceClient
-import models as crud
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import get_async_db
+from sqlalchemy.exc import IntegrityError
+from .schemas import AddItemRequest, AddItemsRequest, AddItemsResponse, PickingCompleteResponse
+from services.scan_batch import apply_scans
+from services.pick_route import plan_order_route_async
+from services.outbox_dispatcher import outbox_dispatcher, ORDER_STATUS, INVENTORY
+from models import aio as crud
+from config import OUTBOX_INLINE_DELIVERY, OUTBOX_INLINE_DEADLINE_SECONDS
 import logging
 from datetime import datetime
 from utils.auth import get_current_agent
+from utils.idempotency import idempotency_store
+from utils.metrics import registry
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1", tags=["picking"])
-order_client = OrderServiceClient()
+
+picking_scans = registry.counter(
+    "picking_scans_total", "Scans recorded, by route (add-item, add-items, wave) and outcome (picked, duplicate, rejected)",
+    ("source", "outcome")
+)
+picks_completed = registry.counter("picks_completed_total", "Orders whose picking completed and which were packed")
+pick_to_pack = registry.histogram(
+    "pick_to_pack_seconds", "Time from the start of an order's picking to its packing",
+    buckets=(30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 14400)
+)
+
+
+def count_scans(source: str, results: list):
+    """Record the outcomes of a batch of scans (results with a PICKED, DUPLICATE or REJECTED status)"""
+    for status in ("PICKED", "DUPLICATE", "REJECTED"):
+        picking_scans.inc(sum(1 for result in results if result["status"] == status), source=source, outcome=status.lower())
 
 
 @router.post("/picking/start/{order_id}")
-async def start_picking(order_id: int, db: Session = Depends(get_db)):
+async def start_picking(order_id: int, db: AsyncSession = Depends(get_async_db)):
     """Start picking for an order"""
     try:
-        order = crud.get_order(db, order_id)
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
-        if order.picking_status != "NOT_STARTED":
-            raise HTTPException(status_code=400, detail="Picking already started or completed")
-        order = crud.update_order_picking_status(db, order_id, "IN_PROGRESS")
-        crud.create_picking_activity(db, order_id, "PICKING_STARTED")
+        async with crud.unit_of_work(db):
+            order = await crud.get_order(db, order_id)
+            if not order:
+                raise HTTPException(status_code=404, detail="Order not found")
+            if order.picking_status != "NOT_STARTED":
+                raise HTTPException(status_code=400, detail="Picking already started or completed")
+            order = await crud.update_order_picking_status(db, order_id, "IN_PROGRESS")
+            await crud.create_picking_activity(db, order_id, "PICKING_STARTED")
         return {"status": "success", "message": "Picking started", "order_id": order_id, "reference_number": order.reference_number}
     except HTTPException:
         raise
@@ -33,36 +55,25 @@ async def start_picking(order_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/picking/add-item")
-async def add_item_to_picking(request: AddItemRequest, db: Session = Depends(get_db)):
+async def add_item_to_picking(request: AddItemRequest, db: AsyncSession = Depends(get_async_db)):
     """Add item to picking"""
     try:
-        order = crud.get_order(db, request.order_id)
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
-        if order.picking_status != "IN_PROGRESS":
-            raise HTTPException(status_code=400, detail="Order picking not in progress")
-        
-        items = crud.get_order_items(db, request.order_id)
-        order_item = next((item for item in items if item.product_id == request.product_id), None)
-        if not order_item:
-            raise HTTPException(status_code=404, detail="Product not in this order")
-        
         quantity = request.quantity or 1.0
-        new_quantity = order_item.picked_quantity + quantity
-        if new_quantity > order_item.ordered_quantity:
-            raise HTTPException(status_code=400, detail=f"Picked quantity ({new_quantity}) exceeds ordered quantity ({order_item.ordered_quantity})")
-        
-        crud.update_order_item_picked_quantity(db, order_item.id, new_quantity)
-        crud.create_picking_activity(db, request.order_id, f"ITEM_PICKED", details={"product_id": request.product_id, "method": request.method, "quantity": quantity})
+        async with crud.unit_of_work(db):
+            picked = await crud.increment_picked_quantity(db, request.order_id, request.product_id, quantity)
+            if picked is None:
+                await _raise_rejected_scan(db, request.order_id, request.product_id, quantity)
+            await crud.create_picking_activity(db, request.order_id, f"ITEM_PICKED", details={"product_id": request.product_id, "method": request.method, "quantity": quantity})
+        picking_scans.inc(source="add-item", outcome="picked")
         
         return {
             "status": "success",
             "message": "Item added to picking",
             "order_id": request.order_id,
             "product_id": request.product_id,
-            "picked_quantity": new_quantity,
-            "ordered_quantity": order_item.ordered_quantity,
-            "remaining": order_item.ordered_quantity - new_quantity
+            "picked_quantity": float(picked.picked_quantity),
+            "ordered_quantity": float(picked.ordered_quantity),
+            "remaining": float(picked.ordered_quantity - picked.picked_quantity)
         }
     except HTTPException:
         raise
@@ -71,66 +82,128 @@ async def add_item_to_picking(request: AddItemRequest, db: Session = Depends(get
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/picking/add-items", response_model=AddItemsResponse)
+async def add_items_to_picking(request: AddItemsRequest, db: AsyncSession = Depends(get_async_db)):
+    """Apply an ordered batch of scans across one or more orders in one transaction (offline scanner flush)"""
+    try:
+        scans = [scan.model_dump() for scan in request.scans]
+        try:
+            async with crud.unit_of_work(db):
+                results = await crud.run_sync(db, apply_scans, scans)
+        except IntegrityError:
+            # A concurrent flush recorded one of these scan ids first; rerun so it shows as a duplicate
+            async with crud.unit_of_work(db):
+                results = await crud.run_sync(db, apply_scans, scans)
+        count_scans("add-items", results)
+        statuses = [result["status"] for result in results]
+        return {
+            "status": "success",
+            "picked": statuses.count("PICKED"),
+            "duplicates": statuses.count("DUPLICATE"),
+            "rejected": statuses.count("REJECTED"),
+            "results": results
+        }
+    except Exception as e:
+        logger.error(f"Error adding items: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _raise_rejected_scan(db: AsyncSession, order_id: int, product_id: int, quantity: float):
+    """Re-read the order to report why a guarded increment matched no row"""
+    picking_scans.inc(source="add-item", outcome="rejected")
+    order = await crud.get_order(db, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order.picking_status != "IN_PROGRESS":
+        raise HTTPException(status_code=400, detail="Order picking not in progress")
+    items = await crud.get_order_items(db, order_id)
+    order_item = next((item for item in items if item.product_id == product_id), None)
+    if not order_item:
+        raise HTTPException(status_code=404, detail="Product not in this order")
+    new_quantity = order_item.picked_quantity + quantity
+    raise HTTPException(status_code=400, detail=f"Picked quantity ({new_quantity}) exceeds ordered quantity ({order_item.ordered_quantity})")
+
+
 @router.post("/picking/complete/{order_id}", response_model=PickingCompleteResponse)
-async def complete_picking(order_id: int, db: Session = Depends(get_db)):
+async def complete_picking(order_id: int, db: AsyncSession = Depends(get_async_db)):
     """Complete picking and pack order"""
     try:
-        order = crud.get_order(db, order_id)
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
-        if order.picking_status != "IN_PROGRESS":
-            raise HTTPException(status_code=400, detail="Order not in picking progress")
-        
-        items = crud.get_order_items(db, order_id)
-        unpicked_items = [item for item in items if item.picked_quantity < item.ordered_quantity]
-        if unpicked_items:
-            raise HTTPException(status_code=400, detail=f"{len(unpicked_items)} items not fully picked")
-        
-        # Create crate label
-        items_dict = {str(item.product_id): int(item.picked_quantity) for item in items}
-        crud.create_crate_label(db, order_id, f"CRATE-{order.reference_number}", weight=None, items_data=items_dict)
-        
-        # Update order status to PACKED
-        crud.update_order_status(db, order_id, "PACKED")
-        crud.update_order_picking_status(db, order_id, "COMPLETED")
-        crud.create_picking_activity(db, order_id, "PICKING_COMPLETED")
-        
-        # Send update to order service
-        crates_list = [f"CRATE-{order.reference_number}"]
-        package_metadata = {
-            "packages": {
-                f"CRATE-{order.reference_number}": {
-                    "weight": 0,
-                    "items": items_dict
+        # All local changes and the outbox messages announcing them commit together
+        async with crud.unit_of_work(db):
+            order = await crud.get_order(db, order_id)
+            if not order:
+                raise HTTPException(status_code=404, detail="Order not found")
+            if order.picking_status != "IN_PROGRESS":
+                raise HTTPException(status_code=400, detail="Order not in picking progress")
+            
+            items = await crud.get_order_items(db, order_id)
+            unpicked_items = [item for item in items if item.picked_quantity < item.ordered_quantity]
+            if unpicked_items:
+                raise HTTPException(status_code=400, detail=f"{len(unpicked_items)} items not fully picked")
+            
+            # Create crate label
+            items_dict = {str(item.product_id): int(item.picked_quantity) for item in items}
+            await crud.create_crate_label(db, order_id, f"CRATE-{order.reference_number}", weight=None, items_data=items_dict)
+            
+            # Update order status to PACKED
+            await crud.pack_order(db, order_id)
+            await crud.create_picking_activity(db, order_id, "PICKING_COMPLETED")
+            
+            # Take the picked quantities out of the store's stock in one UPDATE
+            quantities = {}
+            for item in items:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.picked_quantity
+            stock_updates = await crud.decrement_inventory_stock(db, order.pickup_location_id, quantities)
+            # Local stock changed, so an identical upstream resend must be applied again
+            product_ids = [update["product_id"] for update in stock_updates]
+            await crud.run_sync(db, idempotency_store.forget, "inventory", [f"{pid}:{order.pickup_location_id}" for pid in product_ids])
+            await crud.run_sync(db, idempotency_store.forget, "product", product_ids)
+            
+            # The order and inventory services are updated by the outbox dispatcher
+            package_metadata = {
+                "packages": {
+                    f"CRATE-{order.reference_number}": {
+                        "weight": 0,
+                        "items": items_dict
+                    }
                 }
             }
-        }
-        
-        order_service_success = order_client.update_order_status(
-            order.reference_number,
-            "PACKED",
-            crates_list,
-            package_metadata
-        )
+            messages = [{
+                "topic": ORDER_STATUS,
+                "key": f"order:{order.reference_number}",
+                "payload": {
+                    "reference_number": order.reference_number,
+                    "status": "PACKED",
+                    "crates": [f"CRATE-{order.reference_number}"],
+                    "package_metadata": package_metadata
+                }
+            }]
+            messages += [
+                {"topic": INVENTORY, "key": f"inventory:{update['product_id']}:{update['store_id']}", "payload": update}
+                for update in stock_updates
+            ]
+            # Sent inline below: kept from the dispatcher until the inline deadline has passed
+            hold_seconds = OUTBOX_INLINE_DEADLINE_SECONDS + 1 if OUTBOX_INLINE_DELIVERY else 0
+            message_ids = await crud.run_sync(db, outbox_dispatcher.publish, messages, hold_seconds)
+        picks_completed.inc()
+        # Orders started before picking_started_at was recorded have no start time
+        if order.picking_started_at and order.packed_at:
+            pick_to_pack.observe((order.packed_at - order.picking_started_at).total_seconds())
         
-        # Update inventory
-        for item in items:
-            try:
-                product = crud.get_product_by_external_id(db, item.product_id)
-                if product:
-                    inventory = crud.get_inventory(db, product.product_id, order.pickup_location_id)
-                    if inventory:
-                        new_stock = max(0, inventory.stock - item.picked_quantity)
-                        crud.update_inventory_stock(db, product.product_id, order.pickup_location_id, new_stock)
-                        order_client.update_inventory(product.product_id, order.pickup_location_id, new_stock)
-            except Exception as e:
-                logger.error(f"Error updating inventory for item {item.product_id}: {str(e)}")
+        delivery = None
+        message = "Order packed; order service update queued"
+        if OUTBOX_INLINE_DELIVERY:
+            # All calls run concurrently within one deadline; anything undelivered stays queued
+            delivery = await outbox_dispatcher.deliver_now(db, message_ids, OUTBOX_INLINE_DEADLINE_SECONDS)
+            if delivery["results"] and all(result["status"] == "OK" for result in delivery["results"]):
+                message = "Order packed and sent to order service"
         
         return PickingCompleteResponse(
             status="PACKED",
-            message="Order packed and sent to order service",
+            message=message,
             order_id=order_id,
-            reference_number=order.reference_number
+            reference_number=order.reference_number,
+            delivery=delivery
         )
     except HTTPException:
         raise
@@ -140,10 +213,22 @@ async def complete_picking(order_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/picking/{order_id}/activities")
-async def get_picking_activities(order_id: int, db: Session = Depends(get_db)):
+async def get_picking_activities(order_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get picking activities for an order"""
-    order = crud.get_order(db, order_id)
+    order = await crud.get_order(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    activities = crud.get_picking_activities(db, order_id)
+    activities = await crud.get_picking_activities(db, order_id)
     return {"order_id": order_id, "reference_number": order.reference_number, "activities": activities}
+
+
+@router.get("/picking/{order_id}/route")
+async def get_picking_route(order_id: int, include_picked: bool = False, db: AsyncSession = Depends(get_async_db)):
+    """Get the order's items grouped into stops in a short walking order through its pickup store"""
+    order = await crud.get_order(db, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order.pickup_location_id is None:
+        raise HTTPException(status_code=400, detail="Order has no pickup location")
+    route = await plan_order_route_async(db, order, include_picked)
+    return {"reference_number": order.reference_number, **route}
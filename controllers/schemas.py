@@ -107,11 +107,59 @@ class AddItemRequest(BaseModel):
     quantity: Optional[float] = None
 
 
+class ScanItem(AddItemRequest):
+    # Client-generated id; a scan replayed with the same id is reported as a duplicate and not applied
+    scan_id: Optional[str] = None
+
+
+class AddItemsRequest(BaseModel):
+    scans: List[ScanItem]
+
+
+class ScanResult(BaseModel):
+    scan_id: Optional[str] = None
+    order_id: int
+    product_id: int
+    status: str
+    picked_quantity: Optional[float] = None
+    ordered_quantity: Optional[float] = None
+    remaining: Optional[float] = None
+    error: Optional[str] = None
+
+
+class AddItemsResponse(BaseModel):
+    status: str
+    picked: int
+    duplicates: int
+    rejected: int
+    results: List[ScanResult]
+
+
 class PickingCompleteResponse(BaseModel):
     status: str
     message: str
     order_id: int
     reference_number: str
+    # Per-call outcome and timing of the order/inventory service updates when they are sent inline
+    delivery: Optional[Dict[str, Any]] = None
+
+
+# ==================== Wave Schemas ====================
+class CreateWaveRequest(BaseModel):
+    pickup_location_id: int
+    order_ids: List[int]
+    agent_id: Optional[int] = None
+
+
+class WavePick(BaseModel):
+    product_id: int
+    quantity: Optional[float] = None
+    method: str = "manual"
+    scan_id: Optional[str] = None
+
+
+class WavePickRequest(BaseModel):
+    picks: List[WavePick]
 
 
 # ==================== Webhook Schemas ====================
@@ -0,0 +1,119 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import get_async_db
+from .schemas import CreateWaveRequest, WavePickRequest
+from models import aio as crud
+from services.wave_picking import start_wave, build_pick_list, pick_wave, finish_wave
+from services.pick_route import plan_wave_route_async
+from .picking import count_scans
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/v1", tags=["waves"])
+
+
+def _wave_summary(wave, order_ids, pick_list) -> dict:
+    return {
+        "wave_id": wave.id,
+        "status": wave.status,
+        "pickup_location_id": wave.pickup_location_id,
+        "picker_agent_id": wave.picker_agent_id,
+        "order_ids": order_ids,
+        "pick_list": pick_list
+    }
+
+
+@router.post("/waves")
+async def create_wave(request: CreateWaveRequest, db: AsyncSession = Depends(get_async_db)):
+    """Create a wave from several orders of one store, start picking them and return the combined pick list"""
+    try:
+        async with crud.unit_of_work(db):
+            wave = await crud.run_sync(db, start_wave, request.pickup_location_id, request.order_ids, request.agent_id)
+            pick_list = await crud.run_sync(db, build_pick_list, wave)
+        return _wave_summary(wave, list(dict.fromkeys(request.order_ids)), pick_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating wave: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/waves")
+async def list_waves(status: Optional[str] = None, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    """List waves, newest first"""
+    waves = await crud.get_waves(db, status=status, skip=skip, limit=limit)
+    return [
+        {
+            "wave_id": wave.id, "status": wave.status, "pickup_location_id": wave.pickup_location_id,
+            "picker_agent_id": wave.picker_agent_id, "created_at": wave.created_at, "completed_at": wave.completed_at
+        }
+        for wave in waves
+    ]
+
+
+@router.get("/waves/{wave_id}")
+async def get_wave(wave_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get a wave with its pick list, sorted by location, and the progress of each line"""
+    wave = await crud.get_wave(db, wave_id)
+    if not wave:
+        raise HTTPException(status_code=404, detail="Wave not found")
+    orders = await crud.get_wave_orders(db, wave_id)
+    pick_list = await crud.run_sync(db, build_pick_list, wave)
+    return _wave_summary(wave, [order.id for order in orders], pick_list)
+
+
+@router.get("/waves/{wave_id}/route")
+async def get_wave_route(wave_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get the wave's unpicked pick list lines grouped into stops in a short walking order"""
+    wave = await crud.get_wave(db, wave_id)
+    if not wave:
+        raise HTTPException(status_code=404, detail="Wave not found")
+    return await plan_wave_route_async(db, wave)
+
+
+@router.post("/waves/{wave_id}/pick")
+async def pick_wave_items(wave_id: int, request: WavePickRequest, db: AsyncSession = Depends(get_async_db)):
+    """Record picked quantities of wave lines (one or many per call); each is split across the wave's orders"""
+    try:
+        async with crud.unit_of_work(db):
+            wave = await crud.get_wave(db, wave_id)
+            if not wave:
+                raise HTTPException(status_code=404, detail="Wave not found")
+            if wave.status != "IN_PROGRESS":
+                raise HTTPException(status_code=400, detail="Wave not in progress")
+            results = await crud.run_sync(db, pick_wave, wave, [pick.model_dump() for pick in request.picks])
+        count_scans("wave", results)
+        statuses = [result["status"] for result in results]
+        return {
+            "status": "success",
+            "wave_id": wave_id,
+            "picked": statuses.count("PICKED"),
+            "duplicates": statuses.count("DUPLICATE"),
+            "rejected": statuses.count("REJECTED"),
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error picking wave {wave_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/waves/{wave_id}/complete")
+async def complete_wave(wave_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Close a wave; fully picked orders are listed as ready for packing, the rest stay in progress"""
+    try:
+        async with crud.unit_of_work(db):
+            wave = await crud.get_wave(db, wave_id)
+            if not wave:
+                raise HTTPException(status_code=404, detail="Wave not found")
+            if wave.status != "IN_PROGRESS":
+                raise HTTPException(status_code=400, detail="Wave not in progress")
+            summary = await crud.run_sync(db, finish_wave, wave)
+        return summary
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error completing wave {wave_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,18 +1,214 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models import get_db
+from models import get_async_db, aio
 from .schemas import WebhookOrderPayload
+from config import WEBHOOK_QUEUE_ENABLED, WEBHOOK_STREAM_THRESHOLD_BYTES, WEBHOOK_STREAM_CHUNK_SIZE
+from services.order_ingestion import ingest_orders, inventory_payload_from_store_data
+from services.webhook_queue import webhook_queue
+from services import read_cache
+from utils.idempotency import idempotency_store
+from utils.json_stream import JsonItemStream, JsonStreamError
+from utils.metrics import registry
 import models as crud
+import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Callable, Optional
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["webhooks"])
 
+# Entries handled per kind, whether sent inline, streamed or queued; rate() gives rows per second
+webhook_rows = registry.counter(
+    "webhook_rows_total", "Webhook entries handled, by kind and outcome (processed, failed, skipped)", ("kind", "outcome")
+)
 
-@router.post("/packer-order/create")
-async def receive_order(payload: WebhookOrderPayload, db: Session = Depends(get_db)):
+
+def _count_rows(kind: str, results: List[Dict[str, Any]], skipped: int):
+    """Record the outcome of a processed batch in webhook_rows_total"""
+    failed = sum(1 for result in results if "error" in result or result.get("status") == "FAILED")
+    webhook_rows.inc(len(results) - failed, kind=kind, outcome="processed")
+    webhook_rows.inc(failed, kind=kind, outcome="failed")
+    webhook_rows.inc(skipped, kind=kind, outcome="skipped")
+
+
+def _as_list(entries) -> list:
+    """Normalise a single entry or a list of entries to a list"""
+    if isinstance(entries, list):
+        return entries
+    return [entries]
+
+
+async def _idempotent(db: AsyncSession, route: str, idempotency_key: Optional[str], body: Any, handler: Callable[[Session], Any]):
+    """
+    Run `handler` once per Idempotency-Key; replays of the key get the stored response back
+
+    The handler gets a sync Session bound to the async driver and runs through run_sync.
+    Its writes and the stored response are committed together as one unit of work.
+    """
+    return await aio.run_sync(db, _run_idempotent, route, idempotency_key, body, handler)
+
+
+def _run_idempotent(db: Session, route: str, idempotency_key: Optional[str], body: Any, handler: Callable[[Session], Any]):
+    if not idempotency_key:
+        with crud.unit_of_work(db):
+            return handler(db)
+    try:
+        stored = idempotency_store.get_response(db, route, idempotency_key, body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if stored is not None:
+        return JSONResponse(status_code=stored["status_code"], content=stored["content"], headers={"Idempotent-Replayed": "true"})
+
+    with crud.unit_of_work(db):
+        response = handler(db)
+        _save_response(db, route, idempotency_key, response, body=body)
+    return response
+
+
+def _save_response(db: Session, route: str, idempotency_key: str, response, body: Any = None, digest: Optional[str] = None):
+    if isinstance(response, JSONResponse):
+        status_code, content = response.status_code, json.loads(response.body)
+    else:
+        status_code, content = 200, jsonable_encoder(response)
+    idempotency_store.save_response(db, route, idempotency_key, body, status_code, content, digest=digest)
+
+
+def _accepted(db: Session, kind: str, payload) -> JSONResponse:
+    """Persist the payload on the webhook queue and acknowledge with 202"""
+    job_id = webhook_queue.enqueue(db, kind, payload)
+    return JSONResponse(status_code=202, content={"status": "accepted", "job_id": job_id, "status_url": f"/webhook/jobs/{job_id}"})
+
+
+# ==================== Streaming ====================
+
+def _should_stream(request: Request) -> bool:
+    """Bodies above WEBHOOK_STREAM_THRESHOLD_BYTES, or of unknown length, are parsed incrementally"""
+    try:
+        return int(request.headers["content-length"]) > WEBHOOK_STREAM_THRESHOLD_BYTES
+    except (KeyError, ValueError):
+        return True
+
+
+async def _idempotent_stream(db: AsyncSession, route: str, idempotency_key: Optional[str], stream: JsonItemStream, handler):
+    """
+    Streaming counterpart of `_idempotent`
+
+    Requests are identified by the SHA-256 of their raw bytes; a replayed key only
+    hashes the body, it is never parsed.
+    """
+    if idempotency_key and await aio.run_sync(db, idempotency_store.has_response, route, idempotency_key):
+        digest = await stream.drain()
+        try:
+            stored = await aio.run_sync(db, idempotency_store.get_response, route, idempotency_key, digest=digest)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if stored is None:
+            raise HTTPException(status_code=409, detail="Idempotency-Key expired while the request was read, retry it")
+        return JSONResponse(status_code=stored["status_code"], content=stored["content"], headers={"Idempotent-Replayed": "true"})
+
+    try:
+        response = await handler()
+    except JsonStreamError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if idempotency_key:
+        await aio.run_sync(db, _save_response, route, idempotency_key, response, digest=stream.digest)
+    return response
+
+
+def _merge_summary(total: Dict[str, Any], part: Dict[str, Any]):
+    """Add up the counters of a processed chunk; only failed results are kept"""
+    for key, value in part.items():
+        if key == "results":
+            total.setdefault("results", []).extend(r for r in value if "error" in r)
+        elif isinstance(value, bool) or not isinstance(value, (int, dict)):
+            total.setdefault(key, value)
+        elif isinstance(value, dict):
+            _merge_summary(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+async def _consume_stream(db: AsyncSession, stream: JsonItemStream, kind: str, process, whole_as_item: bool = True, ready=None):
+    """
+    Feed streamed items to the queue or to `process` in WEBHOOK_STREAM_CHUNK_SIZE batches
+
+    Chunks are only flushed once `ready(envelope)` holds, so an envelope that is
+    validated before any item is written may arrive after the items.
+
+    Returns:
+        (summary of the processed chunks, queued job ids, item count), or None when
+        `ready` never held or no item was found and `whole_as_item` is False
+    """
+    ready = ready or (lambda envelope: True)
+    summary, job_ids, chunk, count = {}, [], [], 0
+
+    async def flush(items):
+        if WEBHOOK_QUEUE_ENABLED:
+            job_ids.append(await aio.run_sync(db, webhook_queue.enqueue, kind, items))
+        else:
+            async with aio.unit_of_work(db):
+                _merge_summary(summary, await aio.run_sync(db, process, items))
+
+    async for item in stream.items():
+        chunk.append(item)
+        count += 1
+        if len(chunk) >= WEBHOOK_STREAM_CHUNK_SIZE and ready(stream.envelope):
+            await flush(chunk)
+            chunk = []
+    if not stream.found:
+        if not whole_as_item:
+            return None
+        # A bare object body is a single item
+        chunk, count = [stream.envelope], 1
+    if not ready(stream.envelope):
+        return None
+    if chunk or not (summary or job_ids):
+        await flush(chunk)
+    return summary, job_ids, count
+
+
+async def _stream_entities(request: Request, db: AsyncSession, route: str, kind: str, key: str, process, idempotency_key: Optional[str]):
+    """Stream a list-of-entities webhook body (a list, {key: [...]}, {key: {...}} or a bare entity)"""
+    stream = JsonItemStream(request.stream(), paths=[(key,)])
+
+    async def handle():
+        summary, job_ids, count = await _consume_stream(db, stream, kind, process)
+        if WEBHOOK_QUEUE_ENABLED:
+            return JSONResponse(status_code=202, content={
+                "status": "accepted", "job_id": job_ids[0], "job_ids": job_ids,
+                "status_url": f"/webhook/jobs/{job_ids[0]}"
+            })
+        return summary
+
+    return await _idempotent_stream(db, route, idempotency_key, stream, handle)
+
+
+# ==================== Webhooks ====================
+
+@router.post(
+    "/packer-order/create",
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {"schema": WebhookOrderPayload.model_json_schema()}}}}
+)
+async def receive_order(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Receive order from order service via webhook"""
+    if _should_stream(request):
+        return await _stream_orders(request, db, idempotency_key)
+    try:
+        payload = WebhookOrderPayload.model_validate(await request.json())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+
     try:
         if payload.code != 200 or payload.status != "SUCCESS":
             return {"code": 400, "status": "INVALID_PAYLOAD", "message": "Webhook payload is invalid"}
@@ -25,186 +221,126 @@ async def receive_order(payload: WebhookOrderPayload, db: Session = Depends(get_
         else:
             return {"code": 400, "status": "INVALID_PAYLOAD", "message": "Webhook payload missing order data"}
 
-        orders = orders_container
-        if not isinstance(orders, list):
-            orders = [orders]
+        orders = _as_list(orders_container)
 
-        results = []
-        for order_data in orders:
-            try:
-                result = _process_order(db, order_data)
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Error processing order: {str(e)}")
-                results.append({"order_id": order_data.get("id"), "status": "FAILED", "error": str(e)})
+        def handle(db: Session):
+            if WEBHOOK_QUEUE_ENABLED:
+                job_id = webhook_queue.enqueue(db, "order", orders)
+                return JSONResponse(status_code=202, content={
+                    "code": 202, "status": "ACCEPTED", "message": f"Queued {len(orders)} orders",
+                    "job_id": job_id, "status_url": f"/webhook/jobs/{job_id}"
+                })
+            return process_orders(db, orders)
 
-        return {"code": 200, "status": "SUCCESS", "message": f"Processed {len(results)} orders", "results": results}
+        return await _idempotent(db, "/packer-order/create", idempotency_key, payload.model_dump(), handle)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook processing error: {str(e)}")
         return {"code": 500, "status": "ERROR", "message": str(e)}
 
 
-def _process_order(db: Session, order_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Process a single order from webhook"""
-    order_id = order_data.get("id")
-    reference_number = order_data.get("referenceNumber")
-
-    # Check if order already exists
-    existing = crud.get_order_by_external_id(db, order_id)
-    if existing:
-        return {"order_id": order_id, "reference_number": reference_number, "status": "ALREADY_EXISTS"}
+async def _stream_orders(request: Request, db: AsyncSession, idempotency_key: Optional[str]):
+    """Streaming variant of receive_order: orders are read from data.order (or data.data.order) as they arrive"""
+    stream = JsonItemStream(request.stream(), paths=[("data", "order"), ("data", "data", "order")])
 
-    # Extract order/customer details
-    customer_id = order_data.get("customerId") or order_data.get("customer", {}).get("id")
-    customer_name = order_data.get("customer", {}).get("name", "")
+    def valid(envelope):
+        return envelope.get("code") == 200 and envelope.get("status") == "SUCCESS"
 
-    # Prepare order-level payload dict matching models.create_order
-    try:
-        amount = float(order_data.get("amount") or 0)
-    except Exception:
-        amount = 0.0
-    try:
-        discount = float(order_data.get("discount") or 0)
-    except Exception:
-        discount = 0.0
-    try:
-        shipping = float(order_data.get("shipping") or 0)
-    except Exception:
-        shipping = 0.0
-
-    order_payload = {
-        "order_id": order_id,
-        "reference_number": reference_number,
-        "customer_id": customer_id,
-        "customer_name": customer_name,
-        "amount": amount,
-        "discount": discount,
-        "shipping": shipping,
-        "status": order_data.get("status", "PENDING"),
-        "order_type": order_data.get("type", {}).get("name") if isinstance(order_data.get("type"), dict) else order_data.get("type"),
-        "pickup_location_id": (order_data.get("pickupLocation", {}).get("id") if isinstance(order_data.get("pickupLocation"), dict) else order_data.get("pickupLocationId")),
-        "preferred_date": order_data.get("preferredDate"),
-        "slot_type": order_data.get("slotType"),
-        "slot_start_time": order_data.get("slotStartTime"),
-        "slot_end_time": order_data.get("slotEndTime"),
-        "raw_payload": order_data
+    async def handle():
+        consumed = await _consume_stream(db, stream, "order", process_orders, whole_as_item=False, ready=valid)
+        if consumed is None:
+            if not valid(stream.envelope):
+                return {"code": 400, "status": "INVALID_PAYLOAD", "message": "Webhook payload is invalid"}
+            return {"code": 400, "status": "INVALID_PAYLOAD", "message": "Webhook payload missing order data"}
+        summary, job_ids, count = consumed
+        if WEBHOOK_QUEUE_ENABLED:
+            return JSONResponse(status_code=202, content={
+                "code": 202, "status": "ACCEPTED", "message": f"Queued {count} orders",
+                "job_id": job_ids[0], "job_ids": job_ids, "status_url": f"/webhook/jobs/{job_ids[0]}"
+            })
+        summary["message"] = f"Processed {count - summary.get('skipped', 0)} orders"
+        return summary
+
+    return await _idempotent_stream(db, "/packer-order/create", idempotency_key, stream, handle)
+
+
+def process_orders(db: Session, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ingest a batch of webhook orders, skipping exact replays of already ingested orders"""
+    changed, skipped = idempotency_store.filter_unchanged(
+        db, "order", [(o.get("id") if isinstance(o, dict) else None, o) for o in orders]
+    )
+    results = ingest_orders(db, [o for _, _, o in changed])
+    idempotency_store.remember(db, "order", {
+        key: digest for (key, digest, _), result in zip(changed, results)
+        if result.get("status") in ("SUCCESS", "ALREADY_EXISTS")
+    })
+    read_cache.invalidate("order", [r["reference_number"] for r in results if r.get("reference_number")])
+    _count_rows("order", results, skipped)
+    return {
+        "code": 200, "status": "SUCCESS", "message": f"Processed {len(results)} orders",
+        "skipped": skipped, "results": results
     }
 
-    # Create order in DB
-    db_order = crud.create_order(db, order_payload)
-
-    # Process items and create products if needed
-    items_list = []
-    for item_data in order_data.get("items", []):
-        try:
-            ordered_qty = float(item_data.get("orderDetails", {}).get("orderedQuantity", 0) or 0)
-            mrp = float(item_data.get("orderDetails", {}).get("mrp", 0) or 0)
-            discount_item = float(item_data.get("orderDetails", {}).get("discount", 0) or 0)
-
-            # Create or get product
-            product = _get_or_create_product(db, item_data)
-            if product:
-                items_list.append({
-                    "product_id": product.product_id,
-                    "ordered_quantity": ordered_qty,
-                    "mrp": mrp,
-                    "discount": discount_item
-                })
-        except Exception as e:
-            logger.error(f"Error processing item {item_data.get('id')}: {str(e)}")
 
-    if not items_list:
-        # If there are no valid items, rollback the created order to avoid orphan rows
-        try:
-            db.delete(db_order)
-            db.commit()
-        except Exception:
-            pass
-        raise ValueError("Order has no valid items")
-
-    # Create order items
-    for item_info in items_list:
-        try:
-            crud.create_order_item(db, db_order.id, item_info)
-        except Exception as e:
-            logger.error(f"Error creating order item: {str(e)}")
+def _process_order(db: Session, order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Process a single order from webhook in its own transaction"""
+    result = ingest_orders(db, [order_data])[0]
+    if result.get("status") == "FAILED":
+        raise ValueError(result.get("error"))
+    return result
 
-    return {
-        "order_id": order_id,
-        "reference_number": reference_number,
-        "status": "SUCCESS",
-        "items_count": len(items_list)
-    }
 
+def _product_key(p) -> Optional[str]:
+    """Idempotency key of a product webhook entry"""
+    if not isinstance(p, dict):
+        return None
+    return p.get("id") or p.get("product_id")
 
-def _get_or_create_product(db: Session, item_data: Dict[str, Any]):
-    """Get or create a product from item data"""
-    product_id = item_data.get("id")
-
-    # Check if product already exists
-    existing = crud.get_product_by_external_id(db, product_id)
-    if existing:
-        return existing
-
-    # Create new product dict matching models.create_product
-    product_payload = {
-        "product_id": product_id,
-        "client_item_id": item_data.get("clientItemId") or item_data.get("client_item_id"),
-        "name": item_data.get("name"),
-        "slug": item_data.get("slug"),
-        "images": item_data.get("images") or item_data.get("imagesExtra"),
-        "status": item_data.get("status", "ENABLED"),
-        "average_rating": float(item_data.get("averageRating") or 0),
-        "total_reviews": int(item_data.get("totalReviews") or 0),
-        "sold_by_weight": bool(item_data.get("soldByWeight") or False)
-    }
 
-    try:
-        product = crud.create_product(db, product_payload)
-
-        # Create inventory entries from store-specific data (if provided)
-        store_data_list = item_data.get("storeSpecificData", []) or []
-        for store_data in store_data_list:
-            try:
-                store_id = store_data.get("storeId") or store_data.get("store_id") or 0
-                inventory_payload = {
-                    "product_id": product_id,
-                    "store_id": store_id,
-                    "stock": float(store_data.get("stock", 0) or 0),
-                    "tax": store_data.get("tax"),
-                    "mrp": float(store_data.get("mrp", 0) or 0),
-                    "discount": float(store_data.get("discount", 0) or 0),
-                    "aisle": (store_data.get("location") or {}).get("aisle") if isinstance(store_data.get("location"), dict) else store_data.get("aisle"),
-                    "rack": (store_data.get("location") or {}).get("rack") if isinstance(store_data.get("location"), dict) else store_data.get("rack"),
-                    "shelf": (store_data.get("location") or {}).get("position") if isinstance(store_data.get("location"), dict) else store_data.get("shelf"),
-                    "unit": store_data.get("unit", 1),
-                    "status": store_data.get("status", "ENABLED"),
-                    "location_data": store_data.get("location")
-                }
-                crud.create_or_update_inventory(db, inventory_payload)
-            except Exception as e:
-                logger.warning(f"Error creating inventory for product {product_id}: {str(e)}")
-
-        return product
-    except Exception as e:
-        logger.error(f"Error creating product {product_id}: {str(e)}")
+def _inventory_key(it) -> Optional[str]:
+    """Idempotency key of an inventory webhook entry: external product id and store id"""
+    if not isinstance(it, dict):
         return None
+    product_id = it.get("product_id") or it.get("productId") or it.get("id")
+    store_id = it.get("store_id") or it.get("storeId") or it.get("store") or 0
+    return f"{product_id}:{store_id}" if product_id is not None else None
 
 
 @router.post("/webhook/product")
-async def webhook_product(request: Request, db: Session = Depends(get_db)):
+async def webhook_product(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Create or update product(s) via webhook. Accepts a product dict, {'product': {...}} wrapper or a list."""
+    if _should_stream(request):
+        return await _stream_entities(request, db, "/webhook/product", "product", "product", process_products, idempotency_key)
     payload = await request.json()
     if isinstance(payload, dict) and payload.get("product"):
-        products = payload.get("product")
+        products = _as_list(payload.get("product"))
     elif isinstance(payload, list):
         products = payload
     else:
         products = [payload]
 
-    results = []
-    for p in products:
+    if WEBHOOK_QUEUE_ENABLED:
+        return await _idempotent(db, "/webhook/product", idempotency_key, payload, lambda session: _accepted(session, "product", products))
+    return await _idempotent(db, "/webhook/product", idempotency_key, payload, lambda session: process_products(session, products))
+
+
+def process_products(db: Session, products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Create or update each product and its store-specific inventory
+
+    Products and inventory rows whose content hash matches the stored one are
+    left untouched, so re-sending an unchanged catalog issues no writes.
+    """
+    changed, skipped = idempotency_store.filter_unchanged(db, "product", [(_product_key(p), p) for p in products])
+    results = [None] * len(changed)
+    pending = []
+    for i, (key, digest, p) in enumerate(changed):
         try:
             product_payload = {
                 "product_id": p.get("id") or p.get("product_id"),
@@ -217,44 +353,87 @@ async def webhook_product(request: Request, db: Session = Depends(get_db)):
                 "total_reviews": p.get("totalReviews", 0),
                 "sold_by_weight": p.get("soldByWeight", False)
             }
-            db_product = crud.create_product(db, product_payload)
-            results.append({"product_id": db_product.product_id, "id": db_product.id})
-
+            pending.append((i, key, digest, p, product_payload))
+        except Exception as e:
+            logger.error(f"Error processing product webhook entry: {str(e)}")
+            results[i] = {"error": str(e), "payload": p}
+
+    # Entities skipped by the fingerprint cache are unchanged as well
+    counts = {"created": 0, "updated": 0, "unchanged": skipped}
+    written = {}
+    inventory_rows = []
+    upserted = crud.bulk_upsert_products(db, [payload for _, _, _, _, payload in pending])
+    for (i, key, digest, p, _), result in zip(pending, upserted):
+        if "error" in result:
+            logger.error(f"Error processing product webhook entry: {result['error']}")
+            result["payload"] = p
+        else:
+            counts[result["status"].lower()] += 1
+            written[key] = digest
             # Optionally process store-specific inventory if provided
             for store_data in p.get("storeSpecificData", []) or []:
                 try:
-                    inv = {
-                        "product_id": p.get("id"),
-                        "store_id": store_data.get("storeId") or store_data.get("store_id") or 0,
-                        "stock": float(store_data.get("stock", 0) or 0),
-                        "tax": store_data.get("tax"),
-                        "mrp": float(store_data.get("mrp", 0) or 0),
-                        "discount": float(store_data.get("discount", 0) or 0),
-                        "aisle": (store_data.get("location") or {}).get("aisle") if isinstance(store_data.get("location"), dict) else store_data.get("aisle"),
-                        "rack": (store_data.get("location") or {}).get("rack") if isinstance(store_data.get("location"), dict) else store_data.get("rack"),
-                        "shelf": (store_data.get("location") or {}).get("position") if isinstance(store_data.get("location"), dict) else store_data.get("shelf"),
-                        "unit": store_data.get("unit", 1),
-                        "status": store_data.get("status", "ENABLED"),
-                        "location_data": store_data.get("location")
-                    }
-                    crud.create_or_update_inventory(db, inv)
+                    inventory_rows.append(inventory_payload_from_store_data(p.get("id"), store_data))
                 except Exception as e:
                     logger.warning(f"Error creating inventory for product webhook: {str(e)}")
+        results[i] = result
 
+    inventory_counts = {"created": 0, "updated": 0, "unchanged": 0}
+    touched_inventory = []
+    if inventory_rows:
+        try:
+            with crud.atomic(db):
+                upserted_inventory = crud.bulk_upsert_inventory(db, inventory_rows)
+            for inv, result in zip(inventory_rows, upserted_inventory):
+                if "error" in result:
+                    logger.warning(f"Error creating inventory for product webhook: {result['error']}")
+                    continue
+                inventory_counts[result["status"].lower()] += 1
+                if result["status"] != "UNCHANGED":
+                    touched_inventory.append(f"{inv['product_id']}:{inv['store_id']}")
         except Exception as e:
-            logger.error(f"Error processing product webhook entry: {str(e)}")
-            results.append({"error": str(e), "payload": p})
-
-    return {"status": "ok", "processed": len(results), "results": results}
+            logger.warning(f"Error creating inventory for product webhook: {str(e)}")
+
+    idempotency_store.remember(db, "product", written)
+    # Store rows written here make earlier /webhook/inventory hashes stale (and vice versa)
+    idempotency_store.forget(db, "inventory", touched_inventory)
+    # Newer than what the inventory service answered before
+    read_cache.invalidate("inventory", touched_inventory)
+    read_cache.invalidate("inventory_by_product", {key.split(":")[0] for key in touched_inventory})
+    _count_rows("product", results, skipped)
+    return {
+        "status": "ok",
+        "processed": len(results),
+        "skipped": skipped,
+        **counts,
+        "inventory": inventory_counts,
+        "results": results
+    }
 
 
 @router.post("/webhook/inventory")
-async def webhook_inventory(request: Request, db: Session = Depends(get_db)):
+async def webhook_inventory(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Create or update inventory via webhook. Accepts JSON payload for single or multiple inventory items."""
+    if _should_stream(request):
+        return await _stream_entities(request, db, "/webhook/inventory", "inventory", "inventory", process_inventory, idempotency_key)
     payload = await request.json()
-    items = payload if isinstance(payload, list) else (payload.get("inventory") or [payload])
-    results = []
-    for it in items:
+    items = payload if isinstance(payload, list) else _as_list(payload.get("inventory") or payload)
+
+    if WEBHOOK_QUEUE_ENABLED:
+        return await _idempotent(db, "/webhook/inventory", idempotency_key, payload, lambda session: _accepted(session, "inventory", items))
+    return await _idempotent(db, "/webhook/inventory", idempotency_key, payload, lambda session: process_inventory(session, items))
+
+
+def process_inventory(db: Session, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Create or update all inventory rows with one bulk upsert"""
+    changed, skipped = idempotency_store.filter_unchanged(db, "inventory", [(_inventory_key(it), it) for it in items])
+    results = [None] * len(changed)
+    pending = []
+    for i, (key, digest, it) in enumerate(changed):
         try:
             inv_payload = {
                 "product_id": it.get("product_id") or it.get("productId") or it.get("id"),
@@ -270,21 +449,61 @@ async def webhook_inventory(request: Request, db: Session = Depends(get_db)):
                 "status": it.get("status", "ENABLED"),
                 "location_data": it.get("location")
             }
-            db_inv = crud.create_or_update_inventory(db, inv_payload)
-            results.append({"product_id": it.get("product_id") or it.get("productId") or it.get("id"), "store_id": db_inv.store_id, "stock": db_inv.stock})
+            pending.append((i, key, digest, it, inv_payload))
         except Exception as e:
             logger.error(f"Error processing inventory webhook entry: {str(e)}")
-            results.append({"error": str(e), "payload": it})
-    return {"status": "ok", "processed": len(results), "results": results}
+            results[i] = {"error": str(e), "payload": it}
+
+    written = {}
+    try:
+        with crud.atomic(db):
+            upserted = crud.bulk_upsert_inventory(db, [inv for _, _, _, _, inv in pending])
+        for (i, key, digest, it, _), result in zip(pending, upserted):
+            if "error" in result:
+                logger.error(f"Error processing inventory webhook entry: {result['error']}")
+                result["payload"] = it
+            else:
+                written[key] = digest
+            results[i] = result
+    except Exception as e:
+        logger.error(f"Error upserting inventory webhook batch: {str(e)}")
+        for i, _, _, it, _ in pending:
+            results[i] = {"error": str(e), "payload": it}
+
+    idempotency_store.remember(db, "inventory", written)
+    idempotency_store.forget(db, "product", {key.split(":")[0] for key in written})
+    # Newer than what the inventory service answered before
+    read_cache.invalidate("inventory", written)
+    read_cache.invalidate("inventory_by_product", {key.split(":")[0] for key in written})
+    _count_rows("inventory", results, skipped)
+    return {"status": "ok", "processed": len(results), "skipped": skipped, "results": results}
 
 
 @router.post("/webhook/customer")
-async def webhook_customer(request: Request, db: Session = Depends(get_db)):
+async def webhook_customer(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Create or update customer via webhook. Accepts single customer dict or list."""
+    if _should_stream(request):
+        return await _stream_entities(request, db, "/webhook/customer", "customer", "customer", process_customers, idempotency_key)
     payload = await request.json()
-    customers = payload if isinstance(payload, list) else (payload.get("customer") or [payload])
+    customers = payload if isinstance(payload, list) else _as_list(payload.get("customer") or payload)
+
+    if WEBHOOK_QUEUE_ENABLED:
+        return await _idempotent(db, "/webhook/customer", idempotency_key, payload, lambda session: _accepted(session, "customer", customers))
+    return await _idempotent(db, "/webhook/customer", idempotency_key, payload, lambda session: process_customers(session, customers))
+
+
+def process_customers(db: Session, customers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Create or update each customer"""
+    changed, skipped = idempotency_store.filter_unchanged(
+        db, "customer", [((c.get("id") or c.get("customerId") or c.get("customer_id")) if isinstance(c, dict) else None, c) for c in customers]
+    )
     results = []
-    for c in customers:
+    written = {}
+    for key, digest, c in changed:
         try:
             cust_payload = {
                 "customer_id": c.get("id") or c.get("customerId") or c.get("customer_id"),
@@ -296,22 +515,46 @@ async def webhook_customer(request: Request, db: Session = Depends(get_db)):
                 "pincode": (c.get("defaultAddress") or {}).get("pincode"),
                 "customer_metadata": c.get("metaData") or c.get("meta_data")
             }
-            db_cust = crud.create_customer(db, cust_payload)
+            with crud.atomic(db):
+                db_cust = crud.create_customer(db, cust_payload)
             results.append({"customer_id": db_cust.customer_id, "id": db_cust.id})
+            written[key] = digest
         except Exception as e:
             logger.error(f"Error processing customer webhook entry: {str(e)}")
             results.append({"error": str(e), "payload": c})
-    return {"status": "ok", "processed": len(results), "results": results}
+    idempotency_store.remember(db, "customer", written)
+    read_cache.invalidate("customer", written)
+    _count_rows("customer", results, skipped)
+    return {"status": "ok", "processed": len(results), "skipped": skipped, "results": results}
 
 
 @router.post("/webhook/order/update")
-async def webhook_order_update(request: Request, db: Session = Depends(get_db)):
+async def webhook_order_update(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Update an order partially (status/details) via webhook."""
+    if _should_stream(request):
+        return await _stream_entities(request, db, "/webhook/order/update", "order_update", "order", process_order_updates, idempotency_key)
     payload = await request.json()
     # Accept either {"order": {...}} or list or direct dict
-    orders = payload if isinstance(payload, list) else (payload.get("order") or [payload])
+    orders = payload if isinstance(payload, list) else _as_list(payload.get("order") or payload)
+
+    if WEBHOOK_QUEUE_ENABLED:
+        return await _idempotent(db, "/webhook/order/update", idempotency_key, payload, lambda session: _accepted(session, "order_update", orders))
+    return await _idempotent(db, "/webhook/order/update", idempotency_key, payload, lambda session: process_order_updates(session, orders))
+
+
+def process_order_updates(db: Session, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply partial status/details updates to existing orders"""
+    changed, skipped = idempotency_store.filter_unchanged(
+        db, "order_update",
+        [((o.get("referenceNumber") or o.get("reference_number") or o.get("reference") or o.get("id")) if isinstance(o, dict) else None, o) for o in orders]
+    )
     results = []
-    for o in orders:
+    written = {}
+    for key, digest, o in changed:
         try:
             ref = o.get("referenceNumber") or o.get("reference_number") or o.get("reference")
             # Try find by reference or external id
@@ -336,13 +579,59 @@ async def webhook_order_update(request: Request, db: Session = Depends(get_db)):
 
             # Apply updates
             if update_fields:
-                for k, v in update_fields.items():
-                    setattr(order_obj, k, v)
-                db.add(order_obj)
-                db.commit()
-                db.refresh(order_obj)
+                with crud.atomic(db):
+                    for k, v in update_fields.items():
+                        setattr(order_obj, k, v)
+                    db.add(order_obj)
+                    crud.commit(db)
             results.append({"reference": order_obj.reference_number, "id": order_obj.order_id, "status": order_obj.status})
+            written[key] = digest
         except Exception as e:
             logger.error(f"Error processing order update webhook entry: {str(e)}")
             results.append({"error": str(e), "payload": o})
-    return {"status": "ok", "processed": len(results), "results": results}
+    idempotency_store.remember(db, "order_update", written)
+    read_cache.invalidate("order", [r["reference"] for r in results if "reference" in r])
+    _count_rows("order_update", results, skipped)
+    return {"status": "ok", "processed": len(results), "skipped": skipped, "results": results}
+
+
+# Kinds touching the same rows share an ordering key so their jobs apply in arrival order
+webhook_queue.register("order", process_orders, ordering_key="order")
+webhook_queue.register("order_update", process_order_updates, ordering_key="order")
+webhook_queue.register("product", process_products, ordering_key="catalog")
+webhook_queue.register("inventory", process_inventory, ordering_key="catalog")
+webhook_queue.register("customer", process_customers)
+
+
+# ==================== Webhook Queue ====================
+
+@router.get("/webhook/jobs/{job_id}")
+async def get_webhook_job_status(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get the status (and result once processed) of a queued webhook job"""
+    job = await aio.get_webhook_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Webhook job not found")
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "next_attempt_at": job.next_attempt_at,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result": job.result,
+        "error": job.error
+    }
+
+
+@router.get("/webhook/queue/metrics")
+async def get_webhook_queue_metrics(db: AsyncSession = Depends(get_async_db)):
+    """Queue depth, lag and worker counters for the webhook queue"""
+    return await aio.run_sync(db, webhook_queue.metrics)
+
+
+@router.get("/webhook/idempotency/stats")
+async def get_webhook_idempotency_stats():
+    """Replay cache size and the number of writes skipped as exact replays"""
+    return idempotency_store.stats()
@@ -2,18 +2,33 @@ import logging
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from pathlib import Path
 from fastapi.templating import Jinja2Templates
 
-from config import APP_NAME, API_VERSION, DEBUG, DATABASE_URL
-from models import Base, engine, Product, Inventory, Order, OrderItem, PickingActivity, CrateLabel, Agent as AgentModel, Customer
+from config import (
+    APP_NAME, API_VERSION, DEBUG, DATABASE_URL, WEBHOOK_QUEUE_ENABLED, OUTBOX_ENABLED, INVENTORY_PUSH_ENABLED,
+    SQL_INSTRUMENTATION_ENABLED, METRICS_ENABLED
+)
+from models import Base, engine, async_engine, init_db, Product, Inventory, Order, OrderItem, PickingActivity, CrateLabel, Agent as AgentModel, Customer
 from controllers.schemas import HealthResponse
 import controllers.products as controllers_products
 import controllers.orders as controllers_orders
 import controllers.picking as controllers_picking
 import controllers.webhooks as controllers_webhooks
 import controllers.agents as controllers_agents
+import controllers.waves as controllers_waves
+import controllers.outbox as controllers_outbox
+from services.webhook_queue import webhook_queue
+from services.outbox_dispatcher import outbox_dispatcher
+from services.inventory_push import inventory_push
+from services.password_hasher import password_hasher
+from services.http_transport import http_transport
+from services.resilience import resilience_metrics
+from services.read_cache import read_cache_metrics
+from utils.auth import principal_cache
+from utils.sql_instrumentation import SQLInstrumentationMiddleware, instrument_engine, route_stats
+from utils.metrics import MetricsMiddleware, registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Configure logging
 logging.basicConfig(
@@ -28,14 +43,31 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     logger.info(f"Starting {APP_NAME} v{API_VERSION}")
-    # Create tables
-    Base.metadata.create_all(bind=engine)
+    # Create tables and apply new columns/indexes to existing ones
+    init_db()
     logger.info("Database tables initialized")
+    if WEBHOOK_QUEUE_ENABLED:
+        webhook_queue.start()
+    if INVENTORY_PUSH_ENABLED:
+        inventory_push.start()
+    if OUTBOX_ENABLED:
+        outbox_dispatcher.start()
     
     yield
     
     # Shutdown
     logger.info(f"Shutting down {APP_NAME}")
+    webhook_queue.stop()
+    outbox_dispatcher.stop()
+    # Push the stock updates still waiting in the batcher
+    inventory_push.stop()
+    password_hasher.stop()
+    # Close the shared HTTP connection pools of the service clients
+    await http_transport.aclose()
+    http_transport.close()
+    # Close pooled connections; aiosqlite connections run on threads that would block exit
+    await async_engine.dispose()
+    engine.dispose()
 
 
 # Create FastAPI app
@@ -55,12 +87,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Statement counts, DB time and N+1 suspects per request and route (GET /health/sql)
+if SQL_INSTRUMENTATION_ENABLED or METRICS_ENABLED:
+    instrument_engine(engine)
+    instrument_engine(async_engine)
+if SQL_INSTRUMENTATION_ENABLED:
+    app.add_middleware(SQLInstrumentationMiddleware)
+
+# Request latency per route and requests in flight (GET /metrics); outermost, so it times the whole stack
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers from controllers
 app.include_router(controllers_products.router)
 app.include_router(controllers_orders.router)
 app.include_router(controllers_picking.router)
+app.include_router(controllers_waves.router)
 app.include_router(controllers_webhooks.router)
 app.include_router(controllers_agents.router)
+app.include_router(controllers_outbox.router)
 
 # Mount static and templates folders
 from fastapi.staticfiles import StaticFiles
@@ -98,6 +143,33 @@ async def health_check():
     )
 
 
+@app.get("/health/upstreams")
+async def upstream_health():
+    """Circuit breaker state per external service host and the clients' retry/hedging counters"""
+    return resilience_metrics()
+
+
+@app.get("/health/caches")
+async def cache_health():
+    """Hit ratios of the read-through caches of the service clients and of the principal cache"""
+    return {"read": read_cache_metrics(), "principal": principal_cache.metrics()}
+
+
+@app.get("/health/sql")
+async def sql_health(reset: bool = False):
+    """Statements and DB time per route, heaviest first, with the N+1 suspects seen on each"""
+    routes = route_stats.snapshot()
+    if reset:
+        route_stats.reset()
+    return routes
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Request, database, upstream, webhook and picking metrics in the Prometheus text format"""
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 # ===== Exception Handlers =====
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -106,7 +178,7 @@ async def http_exception_handler(request, exc):
         "code": exc.status_code,
         "status": "ERROR",
         "message": exc.detail
-    })
+    }, headers=exc.headers)
 
 
 @app.exception_handler(Exception)
@@ -1,40 +1,88 @@
 """
 Database models and CRUD operations
 """
-from .database import Base, SessionLocal, engine, get_db
-from .product import Product, create_product, get_product, get_product_by_external_id, get_all_products, delete_product
-from .inventory import Inventory, create_or_update_inventory, get_inventory, update_inventory_stock
+from .database import (
+    Base, SessionLocal, engine, get_db, init_db, AsyncSessionLocal, async_engine, get_async_db,
+    STORAGE_PROFILES, create_db_engine, create_async_db_engine,
+    commit, atomic, unit_of_work, in_unit_of_work
+)
+from .product import (
+    Product, create_product, get_product, get_product_by_external_id, get_products_by_external_ids,
+    bulk_upsert_products, get_existing_product_slugs, get_all_products, delete_product
+)
+from .inventory import (
+    Inventory, create_or_update_inventory, bulk_upsert_inventory, get_inventory, update_inventory_stock,
+    decrement_inventory_stock, get_store_layout_version, get_store_locations, get_item_locations
+)
 from .customer import Customer, create_customer, get_customer, get_customer_by_external_id, get_all_customers, delete_customer
 from .order import (
     Order, OrderItem, create_order, get_order, get_order_by_external_id, 
-    get_order_by_reference, get_all_orders, get_orders_by_status, 
+    get_order_by_reference, get_existing_order_ids, get_existing_order_references, get_orders_by_ids, get_all_orders, get_orders_by_status, 
     update_order_status, update_order_picking_status, pack_order,
-    create_order_item, get_order_items, get_order_item, update_order_item_picked_quantity
+    create_order_item, get_order_items, get_order_items_for_orders, get_order_item, update_order_item_picked_quantity,
+    increment_picked_quantity
 )
 from .picking import (
-    PickingActivity, CrateLabel, create_picking_activity, get_picking_activities,
+    PickingActivity, CrateLabel, create_picking_activity, create_picking_activities, get_recorded_scan_ids,
+    get_picking_activities,
     create_crate_label, get_crate_labels, get_crate_label_by_label
 )
-from .agent import Agent, create_agent, get_agent, get_agent_by_username, get_all_agents, update_agent_status, update_agent_password
+from .wave import PickWave, create_wave, get_wave, get_waves, get_wave_orders, get_wave_item_rows, complete_wave
+from .agent import (
+    Agent, create_agent, create_agents, get_agent, get_agent_by_username, get_existing_usernames, get_all_agents,
+    update_agent_status, update_agent_password, on_agent_change, get_agent_versions
+)
+from .webhook_job import (
+    WebhookJob, enqueue_webhook_job, get_webhook_job, claim_next_webhook_job, complete_webhook_job,
+    fail_webhook_job, touch_webhook_jobs, requeue_stale_webhook_jobs, purge_finished_webhook_jobs, get_webhook_queue_stats
+)
+from .outbox import (
+    OutboxMessage, add_outbox_messages, supersede_outbox_messages, claim_outbox_batch, mark_outbox_sent, retry_outbox_message,
+    release_outbox_messages, dead_letter_outbox_message, retry_dead_outbox_messages, requeue_stale_outbox_messages,
+    purge_sent_outbox_messages, get_outbox_messages, get_outbox_stats
+)
+from .idempotency import (
+    IdempotencyRecord, get_idempotency_records, save_idempotency_records, delete_idempotency_records,
+    purge_idempotency_records
+)
 
 __all__ = [
     # Database
-    "Base", "SessionLocal", "engine", "get_db",
+    "Base", "SessionLocal", "engine", "get_db", "init_db", "AsyncSessionLocal", "async_engine", "get_async_db",
+    "STORAGE_PROFILES", "create_db_engine", "create_async_db_engine",
+    "commit", "atomic", "unit_of_work", "in_unit_of_work",
     # Product
-    "Product", "create_product", "get_product", "get_product_by_external_id", "get_all_products", "delete_product",
+    "Product", "create_product", "get_product", "get_product_by_external_id", "get_products_by_external_ids",
+    "bulk_upsert_products", "get_existing_product_slugs", "get_all_products", "delete_product",
     # Inventory
-    "Inventory", "create_or_update_inventory", "get_inventory", "update_inventory_stock",
+    "Inventory", "create_or_update_inventory", "bulk_upsert_inventory", "get_inventory", "update_inventory_stock",
+    "decrement_inventory_stock", "get_store_layout_version", "get_store_locations", "get_item_locations",
     # Customer
     "Customer", "create_customer", "get_customer", "get_customer_by_external_id", "get_all_customers", "delete_customer",
     # Order
     "Order", "OrderItem", "create_order", "get_order", "get_order_by_external_id", 
-    "get_order_by_reference", "get_all_orders", "get_orders_by_status", 
+    "get_order_by_reference", "get_existing_order_ids", "get_existing_order_references", "get_orders_by_ids", "get_all_orders", "get_orders_by_status", 
     "update_order_status", "update_order_picking_status", "pack_order",
-    "create_order_item", "get_order_items", "get_order_item", "update_order_item_picked_quantity",
+    "create_order_item", "get_order_items", "get_order_items_for_orders", "get_order_item", "update_order_item_picked_quantity",
+    "increment_picked_quantity",
     # Picking
-    "PickingActivity", "CrateLabel", "create_picking_activity", "get_picking_activities",
+    "PickingActivity", "CrateLabel", "create_picking_activity", "create_picking_activities", "get_recorded_scan_ids",
+    "get_picking_activities",
     "create_crate_label", "get_crate_labels", "get_crate_label_by_label",
+    # Wave
+    "PickWave", "create_wave", "get_wave", "get_waves", "get_wave_orders", "get_wave_item_rows", "complete_wave",
     # Agent
-    "Agent", "create_agent", "get_agent", "get_agent_by_username", "get_all_agents", "update_agent_status", "update_agent_password",
+    "Agent", "create_agent", "create_agents", "get_agent", "get_agent_by_username", "get_existing_usernames", "get_all_agents",
+    "update_agent_status", "update_agent_password", "on_agent_change", "get_agent_versions",
+    # Webhook queue
+    "WebhookJob", "enqueue_webhook_job", "get_webhook_job", "claim_next_webhook_job", "complete_webhook_job",
+    "fail_webhook_job", "touch_webhook_jobs", "requeue_stale_webhook_jobs", "purge_finished_webhook_jobs",
+    "get_webhook_queue_stats",
+    # Outbox
+    "OutboxMessage", "add_outbox_messages", "supersede_outbox_messages", "claim_outbox_batch", "mark_outbox_sent", "retry_outbox_message",
+    "release_outbox_messages", "dead_letter_outbox_message", "retry_dead_outbox_messages", "requeue_stale_outbox_messages",
+    "purge_sent_outbox_messages", "get_outbox_messages", "get_outbox_stats",
+    # Idempotency
+    "IdempotencyRecord", "get_idempotency_records", "save_idempotency_records", "delete_idempotency_records",
+    "purge_idempotency_records",
 ]
-
@@ -1,10 +1,11 @@
 """
 Agent Model for Picker/Packer agents
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, event, insert
 from sqlalchemy.orm import Session
 from datetime import datetime
-from .database import Base
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+from .database import Base, commit, in_unit_of_work
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +25,35 @@ class Agent(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped when the status or password changes; NULL on rows created before it existed
+    version = Column(Integer, default=1)
+
+
+# Callbacks run with the username of an agent whose status or password changed
+_change_listeners: List[Callable[[str], None]] = []
+
+
+def on_agent_change(listener: Callable[[str], None]):
+    """Register a callback run when an agent's status or password changes, e.g. to drop cached principals"""
+    _change_listeners.append(listener)
+
+
+def _agent_changed(db: Session, agent: Agent):
+    """Bump the agent's version and notify the listeners now and, inside a unit of work, again after commit"""
+    agent.version = (agent.version or 0) + 1
+    username = agent.username
+
+    def notify(session=None):
+        for listener in _change_listeners:
+            try:
+                listener(username)
+            except Exception as e:
+                logger.error(f"Agent change listener failed for {username}: {str(e)}")
+
+    notify()
+    if in_unit_of_work(db):
+        # Until the commit other sessions still read the old row and may cache it again
+        event.listen(db, "after_commit", notify, once=True)
 
 
 # ==================== CRUD Operations ====================
@@ -40,11 +70,32 @@ def create_agent(db: Session, username: str, hashed_password: str, full_name: st
         status="ACTIVE"
     )
     db.add(agent)
-    db.commit()
-    db.refresh(agent)
+    commit(db)
     return agent
 
 
+def create_agents(db: Session, agents: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert many agents ({"username", "password_hash", "full_name", "email", "phone"}) with one
+    multi-row INSERT and return their IDs in the same order
+    """
+    if not agents:
+        return []
+    now = datetime.utcnow()
+    # Unsorted RETURNING keeps this one statement (SQLite cannot sort it); usernames map the IDs back
+    result = db.execute(insert(Agent).returning(Agent.username, Agent.id), [
+        {
+            "username": agent["username"], "password_hash": agent["password_hash"],
+            "full_name": agent.get("full_name"), "email": agent.get("email"), "phone": agent.get("phone"),
+            "status": "ACTIVE", "is_active": True, "version": 1, "created_at": now, "updated_at": now
+        }
+        for agent in agents
+    ])
+    agent_ids = dict(result.all())
+    commit(db)
+    return [agent_ids[agent["username"]] for agent in agents]
+
+
 def get_agent(db: Session, agent_id: int) -> Agent:
     """Get an agent by ID"""
     return db.query(Agent).filter(Agent.id == agent_id).first()
@@ -55,6 +106,17 @@ def get_agent_by_username(db: Session, username: str) -> Agent:
     return db.query(Agent).filter(Agent.username == username).first()
 
 
+def get_existing_usernames(db: Session, usernames: Iterable[str]) -> Set[str]:
+    """Return the subset of usernames that are already taken"""
+    usernames = list(set(usernames))
+    existing = set()
+    # Chunked so very large batches stay under the driver's bound-parameter limit
+    for i in range(0, len(usernames), 500):
+        rows = db.query(Agent.username).filter(Agent.username.in_(usernames[i:i + 500])).all()
+        existing.update(row[0] for row in rows)
+    return existing
+
+
 def get_all_agents(db: Session, skip: int = 0, limit: int = 100) -> list:
     """Get all agents with pagination"""
     return db.query(Agent).offset(skip).limit(limit).all()
@@ -66,8 +128,8 @@ def update_agent_status(db: Session, agent_id: int, status: str) -> Agent:
     if agent:
         agent.status = status
         agent.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(agent)
+        _agent_changed(db, agent)
+        commit(db)
     return agent
 
 
@@ -77,7 +139,14 @@ def update_agent_password(db: Session, agent_id: int, hashed_password: str) -> A
     if agent:
         agent.password_hash = hashed_password
         agent.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(agent)
+        _agent_changed(db, agent)
+        commit(db)
     return agent
 
+
+def get_agent_versions(db: Session, since: datetime) -> List[Tuple[str, int]]:
+    """(username, version) of the agents updated at or after `since`"""
+    return [
+        (username, version or 0)
+        for username, version in db.query(Agent.username, Agent.version).filter(Agent.updated_at >= since).all()
+    ]
@@ -0,0 +1,163 @@
+"""
+Async CRUD operations
+
+Each function mirrors the synchronous CRUD function of the same name and takes
+an AsyncSession instead of a Session. The ORM code runs through
+AsyncSession.run_sync on the async driver (aiosqlite / asyncpg), so a slow
+query or a locked SQLite file suspends only the calling request instead of the
+whole event loop.
+"""
+import asyncio
+import functools
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Callable
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import agent, customer, idempotency, inventory, order, outbox, picking, product, wave, webhook_job
+from .database import begin_unit_of_work, end_unit_of_work, in_unit_of_work
+
+
+async def run_sync(db: AsyncSession, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run any function taking a sync Session as its first argument, e.g. a service-level batch job"""
+    return await db.run_sync(fn, *args, **kwargs)
+
+
+# One writer lock per event loop; see unit_of_work
+_sqlite_writers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def unit_of_work(db: AsyncSession):
+    """
+    Async counterpart of models.unit_of_work: CRUD calls in the block only flush, one commit at the end
+
+    SQLite allows one writer at a time. Units of work from this process queue on an
+    asyncio lock in arrival order instead of in SQLite's busy handler, which polls
+    with growing sleeps, so bursts of writes neither stall nor time out.
+    """
+    if in_unit_of_work(db.sync_session) or db.bind.dialect.name != "sqlite":
+        async with _unit_of_work(db):
+            yield db
+        return
+    loop = asyncio.get_running_loop()
+    writer = _sqlite_writers.get(loop)
+    if writer is None:
+        writer = _sqlite_writers[loop] = asyncio.Lock()
+    async with writer:
+        async with _unit_of_work(db):
+            yield db
+
+
+@asynccontextmanager
+async def _unit_of_work(db: AsyncSession):
+    outermost = await db.run_sync(begin_unit_of_work)
+    try:
+        yield db
+        if outermost:
+            await db.commit()
+    except BaseException:
+        if outermost:
+            await db.rollback()
+        raise
+    finally:
+        end_unit_of_work(db.sync_session)
+
+
+def _async(fn: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+
+# ==================== Product ====================
+create_product = _async(product.create_product)
+bulk_upsert_products = _async(product.bulk_upsert_products)
+get_product = _async(product.get_product)
+get_product_by_external_id = _async(product.get_product_by_external_id)
+get_products_by_external_ids = _async(product.get_products_by_external_ids)
+get_existing_product_slugs = _async(product.get_existing_product_slugs)
+get_all_products = _async(product.get_all_products)
+delete_product = _async(product.delete_product)
+
+# ==================== Inventory ====================
+create_or_update_inventory = _async(inventory.create_or_update_inventory)
+bulk_upsert_inventory = _async(inventory.bulk_upsert_inventory)
+get_inventory = _async(inventory.get_inventory)
+update_inventory_stock = _async(inventory.update_inventory_stock)
+decrement_inventory_stock = _async(inventory.decrement_inventory_stock)
+get_store_layout_version = _async(inventory.get_store_layout_version)
+get_store_locations = _async(inventory.get_store_locations)
+get_item_locations = _async(inventory.get_item_locations)
+
+# ==================== Customer ====================
+create_customer = _async(customer.create_customer)
+get_customer = _async(customer.get_customer)
+get_customer_by_external_id = _async(customer.get_customer_by_external_id)
+get_all_customers = _async(customer.get_all_customers)
+delete_customer = _async(customer.delete_customer)
+
+# ==================== Order ====================
+create_order = _async(order.create_order)
+get_order = _async(order.get_order)
+get_order_by_external_id = _async(order.get_order_by_external_id)
+get_order_by_reference = _async(order.get_order_by_reference)
+get_existing_order_ids = _async(order.get_existing_order_ids)
+get_existing_order_references = _async(order.get_existing_order_references)
+get_orders_by_ids = _async(order.get_orders_by_ids)
+get_all_orders = _async(order.get_all_orders)
+get_orders_by_status = _async(order.get_orders_by_status)
+update_order_status = _async(order.update_order_status)
+update_order_picking_status = _async(order.update_order_picking_status)
+pack_order = _async(order.pack_order)
+create_order_item = _async(order.create_order_item)
+get_order_items = _async(order.get_order_items)
+get_order_items_for_orders = _async(order.get_order_items_for_orders)
+get_order_item = _async(order.get_order_item)
+update_order_item_picked_quantity = _async(order.update_order_item_picked_quantity)
+increment_picked_quantity = _async(order.increment_picked_quantity)
+
+# ==================== Picking ====================
+create_picking_activity = _async(picking.create_picking_activity)
+create_picking_activities = _async(picking.create_picking_activities)
+get_recorded_scan_ids = _async(picking.get_recorded_scan_ids)
+get_picking_activities = _async(picking.get_picking_activities)
+create_crate_label = _async(picking.create_crate_label)
+get_crate_labels = _async(picking.get_crate_labels)
+get_crate_label_by_label = _async(picking.get_crate_label_by_label)
+
+# ==================== Wave ====================
+create_wave = _async(wave.create_wave)
+get_wave = _async(wave.get_wave)
+get_waves = _async(wave.get_waves)
+get_wave_orders = _async(wave.get_wave_orders)
+get_wave_item_rows = _async(wave.get_wave_item_rows)
+complete_wave = _async(wave.complete_wave)
+
+# ==================== Agent ====================
+create_agent = _async(agent.create_agent)
+create_agents = _async(agent.create_agents)
+get_agent = _async(agent.get_agent)
+get_agent_by_username = _async(agent.get_agent_by_username)
+get_existing_usernames = _async(agent.get_existing_usernames)
+get_all_agents = _async(agent.get_all_agents)
+update_agent_status = _async(agent.update_agent_status)
+update_agent_password = _async(agent.update_agent_password)
+get_agent_versions = _async(agent.get_agent_versions)
+
+# ==================== Webhook Jobs ====================
+enqueue_webhook_job = _async(webhook_job.enqueue_webhook_job)
+get_webhook_job = _async(webhook_job.get_webhook_job)
+get_webhook_queue_stats = _async(webhook_job.get_webhook_queue_stats)
+
+# ==================== Outbox ====================
+add_outbox_messages = _async(outbox.add_outbox_messages)
+retry_dead_outbox_messages = _async(outbox.retry_dead_outbox_messages)
+get_outbox_messages = _async(outbox.get_outbox_messages)
+get_outbox_stats = _async(outbox.get_outbox_stats)
+
+# ==================== Idempotency ====================
+get_idempotency_records = _async(idempotency.get_idempotency_records)
+save_idempotency_records = _async(idempotency.save_idempotency_records)
+delete_idempotency_records = _async(idempotency.delete_idempotency_records)
@@ -4,7 +4,7 @@ Customer Model
 from sqlalchemy import Column, Integer, String, DateTime, JSON
 from sqlalchemy.orm import Session
 from datetime import datetime
-from .database import Base
+from .database import Base, commit
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,8 +39,7 @@ def create_customer(db: Session, customer_data: dict) -> Customer:
     else:
         db_customer = Customer(**customer_data)
     db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
+    commit(db)
     return db_customer
 
 
@@ -64,6 +63,6 @@ def delete_customer(db: Session, customer_id: int) -> bool:
     customer = db.query(Customer).filter(Customer.id == customer_id).first()
     if customer:
         db.delete(customer)
-        db.commit()
+        commit(db)
         return True
     return False
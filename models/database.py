@@ -1,19 +1,183 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
-from config import DATABASE_URL
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from contextlib import contextmanager
+from config import DATABASE_URL, ASYNC_DATABASE_URL, DB_PROFILE, DB_POOL_SIZE, DB_MAX_OVERFLOW, METRICS_ENABLED
+from utils.metrics import registry
+import hashlib
+import json
+import logging
+import time
 
-# Create engine
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+logger = logging.getLogger(__name__)
+
+# ==================== Storage Profiles ====================
+# Named engine settings, selected with DB_PROFILE. Pragmas only apply to SQLite; pool sizing
+# only to pooled (file or server) databases; the statement cache size is passed to the driver
+# (sqlite3 `cached_statements`, asyncpg `prepared_statement_cache_size`) and to SQLAlchemy's
+# compiled-query cache.
+STORAGE_PROFILES = {
+    # Driver defaults: rollback journal, no pre-ping; what the app used before profiles existed
+    "legacy": {
+        "pragmas": {},
+        "pool_size": 5, "max_overflow": 10, "pool_pre_ping": False, "statement_cache_size": 128
+    },
+    # WAL lets readers proceed while a picker writes; NORMAL sync is crash-safe under WAL
+    "balanced": {
+        "pragmas": {
+            "journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000,
+            "cache_size": -16000, "mmap_size": 64 * 1024 * 1024
+        },
+        "pool_size": 10, "max_overflow": 20, "pool_pre_ping": True, "statement_cache_size": 500
+    },
+    # Every commit is fsynced; for deployments that cannot lose the last transactions on power loss
+    "durable": {
+        "pragmas": {
+            "journal_mode": "WAL", "synchronous": "FULL", "busy_timeout": 10000,
+            "cache_size": -16000, "mmap_size": 0
+        },
+        "pool_size": 10, "max_overflow": 20, "pool_pre_ping": True, "statement_cache_size": 500
+    },
+    # Larger caches and pool, no pre-ping round trip; for a dedicated host with memory to spare
+    "throughput": {
+        "pragmas": {
+            "journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000,
+            "cache_size": -65536, "mmap_size": 256 * 1024 * 1024, "temp_store": "MEMORY"
+        },
+        "pool_size": 20, "max_overflow": 40, "pool_pre_ping": False, "statement_cache_size": 1000
+    }
+}
+
+
+# ==================== Pool Metrics ====================
+pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time to get a pooled database connection, including opening a new one",
+    ("engine",), buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
 )
+pool_connections_in_use = registry.gauge("db_pool_connections_in_use", "Pooled database connections checked out", ("engine",))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited for a connection"""
+    engine_label = "sync"
+    # Log as the parent class, which SQLAlchemy keeps at WARNING unless echo_pool is set
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.QueuePool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started, engine=self.engine_label)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool recording how long each checkout waited for a connection"""
+    engine_label = "async"
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.AsyncAdaptedQueuePool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started, engine=self.engine_label)
+
+
+def _count_checkouts(engine, label: str):
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checked_out(dbapi_connection, connection_record, connection_proxy):
+        pool_connections_in_use.inc(engine=label)
+
+    @event.listens_for(sync_engine, "checkin")
+    def _checked_in(dbapi_connection, connection_record):
+        pool_connections_in_use.dec(engine=label)
+
+
+def engine_options(url: str, profile: str = DB_PROFILE) -> dict:
+    """
+    Keyword arguments for create_engine / create_async_engine for a storage profile
+
+    Args:
+        url: Database URL (sync or async driver)
+        profile: Name of a profile in STORAGE_PROFILES
+
+    Returns:
+        Engine keyword arguments
+    """
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile}; expected one of {', '.join(STORAGE_PROFILES)}")
+    settings = STORAGE_PROFILES[profile]
+    options = {
+        "pool_pre_ping": settings["pool_pre_ping"],
+        "query_cache_size": settings["statement_cache_size"]
+    }
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False, "cached_statements": settings["statement_cache_size"]}
+        # In-memory databases use a single-connection pool that takes no sizing
+        if ":memory:" in url or url.split("://", 1)[1] in ("", "/"):
+            return options
+    elif "+asyncpg" in url:
+        options["connect_args"] = {"prepared_statement_cache_size": settings["statement_cache_size"]}
+    options["pool_size"] = DB_POOL_SIZE or settings["pool_size"]
+    options["max_overflow"] = settings["max_overflow"] if DB_MAX_OVERFLOW is None else DB_MAX_OVERFLOW
+    if METRICS_ENABLED:
+        options["poolclass"] = TimedAsyncQueuePool if "+aiosqlite" in url or "+asyncpg" in url else TimedQueuePool
+    return options
+
+
+def apply_sqlite_pragmas(engine, profile: str = DB_PROFILE):
+    """Run the profile's pragmas on every new SQLite connection of a (sync or async) engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    pragmas = STORAGE_PROFILES[profile]["pragmas"]
+    if sync_engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def create_db_engine(url: str = DATABASE_URL, profile: str = DB_PROFILE):
+    """Create a sync engine configured for a storage profile"""
+    engine = create_engine(url, **engine_options(url, profile))
+    apply_sqlite_pragmas(engine, profile)
+    if METRICS_ENABLED:
+        _count_checkouts(engine, "sync")
+    return engine
+
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, profile: str = DB_PROFILE):
+    """Create an async engine configured for a storage profile"""
+    engine = create_async_engine(url, **engine_options(url, profile))
+    apply_sqlite_pragmas(engine, profile)
+    if METRICS_ENABLED:
+        _count_checkouts(engine, "async")
+    return engine
+
+
+# Create engine
+engine = create_db_engine()
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and session factory for the API routes; the driver runs queries off the event loop
+async_engine = create_async_db_engine()
+# Objects stay loaded after commit so routes can read them without another round trip
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -25,3 +189,135 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Get async database session for dependency injection"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ==================== Unit of Work ====================
+# Session.info key counting the units of work open on a session
+UNIT_OF_WORK = "unit_of_work_depth"
+
+
+def in_unit_of_work(db: Session) -> bool:
+    """Whether CRUD calls on this session are part of an open unit of work"""
+    return db.info.get(UNIT_OF_WORK, 0) > 0
+
+
+def commit(db: Session):
+    """
+    Commit the session, or only flush it while a unit of work is open
+
+    CRUD functions call this instead of db.commit(). Nothing is refreshed:
+    the flush fills in ids and Python-side defaults, and expired attributes
+    reload on first access.
+    """
+    if in_unit_of_work(db):
+        db.flush()
+    else:
+        db.commit()
+
+
+@contextmanager
+def atomic(db: Session):
+    """
+    Undo the block's changes if it raises
+
+    Inside a unit of work this is a savepoint, so earlier work in the same
+    transaction survives. Otherwise the whole transaction is rolled back.
+    """
+    if in_unit_of_work(db):
+        with db.begin_nested():
+            yield
+    else:
+        try:
+            yield
+        except Exception:
+            db.rollback()
+            raise
+
+
+def begin_unit_of_work(db: Session) -> bool:
+    """Open a (possibly nested) unit of work; returns True for the outermost one"""
+    depth = db.info.get(UNIT_OF_WORK, 0)
+    if depth == 0 and db.bind.dialect.name == "sqlite":
+        # pysqlite only emits BEGIN before DML, so a SAVEPOINT could otherwise open (and its
+        # RELEASE commit) the transaction. IMMEDIATE also takes the write lock up front, so
+        # reads made inside the unit of work cannot go stale before its writes.
+        connection = db.connection()
+        if not connection.connection.driver_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    db.info[UNIT_OF_WORK] = depth + 1
+    return depth == 0
+
+
+def end_unit_of_work(db: Session):
+    """Close the innermost unit of work opened with begin_unit_of_work"""
+    db.info[UNIT_OF_WORK] -= 1
+
+
+@contextmanager
+def unit_of_work(db: Session):
+    """
+    Run a block of CRUD calls as one transaction
+
+    While the block runs, CRUD functions only flush. The outermost unit of
+    work commits once when the block exits and rolls everything back if it
+    raises. Nested units of work join the outer one.
+    """
+    outermost = begin_unit_of_work(db)
+    try:
+        yield db
+        if outermost:
+            db.commit()
+    except BaseException:
+        if outermost:
+            db.rollback()
+        raise
+    finally:
+        end_unit_of_work(db)
+
+
+def content_hash(values: dict) -> str:
+    """Fingerprint of a row's canonical column values, used to skip no-op updates"""
+    canonical = json.dumps(values, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def init_db(bind=None):
+    """
+    Create tables and bring existing ones up to date with the models
+
+    `create_all` only creates missing tables, so columns and indexes added to a
+    model after its table was created are added here. New columns must be
+    nullable or have a scalar default.
+    """
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+            if column.default is not None and column.default.is_scalar:
+                ddl += f" DEFAULT {column.default.arg!r}"
+            with bind.begin() as conn:
+                conn.execute(text(ddl))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+    # Unique indexes cannot be created over duplicate rows
+    from .inventory import deduplicate_inventory
+    with bind.begin() as conn:
+        removed = deduplicate_inventory(conn)
+        if removed:
+            logger.warning(f"Removed {removed} duplicate inventory rows")
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
@@ -0,0 +1,100 @@
+"""
+Idempotency Record Model - persisted fingerprints of processed webhook entities and requests
+"""
+from sqlalchemy import Column, Integer, String, DateTime, JSON, UniqueConstraint
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime
+from .database import Base, atomic, commit
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyRecord(Base):
+    """Idempotency record table"""
+    __tablename__ = "idempotency_records"
+    __table_args__ = (UniqueConstraint("scope", "key", name="uq_idempotency_scope_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    digest = Column(String, nullable=False)
+    response = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+# ==================== CRUD Operations ====================
+
+def get_idempotency_records(db: Session, scope: str, keys, since: datetime) -> dict:
+    """Get records of a scope created after `since`, keyed by key, with a single IN query"""
+    keys = list(keys)
+    records = {}
+    # Chunked so very large payloads stay under the driver's bound-parameter limit
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        rows = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.scope == scope,
+            IdempotencyRecord.key.in_(chunk),
+            IdempotencyRecord.created_at >= since
+        ).all()
+        records.update({r.key: r for r in rows})
+    return records
+
+
+def save_idempotency_records(db: Session, scope: str, digests: dict, responses: dict = None) -> None:
+    """Insert or refresh the digest (and optional stored response) for each key of a scope"""
+    if not digests:
+        return
+    responses = responses or {}
+    now = datetime.utcnow()
+    rows = [
+        {"scope": scope, "key": key, "digest": digest, "response": responses.get(key), "created_at": now}
+        for key, digest in digests.items()
+    ]
+    dialect = db.bind.dialect.name
+    try:
+        with atomic(db):
+            if dialect in ("sqlite", "postgresql"):
+                if dialect == "sqlite":
+                    from sqlalchemy.dialects.sqlite import insert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert
+                stmt = insert(IdempotencyRecord)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[IdempotencyRecord.scope, IdempotencyRecord.key],
+                    set_={col: stmt.excluded[col] for col in ("digest", "response", "created_at")}
+                )
+                db.execute(stmt, rows)
+            else:
+                existing = get_idempotency_records(db, scope, digests.keys(), datetime.min)
+                for row in rows:
+                    record = existing.get(row["key"])
+                    if record:
+                        record.digest, record.response, record.created_at = row["digest"], row["response"], now
+                    else:
+                        db.add(IdempotencyRecord(**row))
+            commit(db)
+    except IntegrityError:
+        # Another worker recorded the same key concurrently; its record is just as good
+        pass
+
+
+def delete_idempotency_records(db: Session, scope: str, keys) -> int:
+    """Delete the records of the given keys"""
+    keys = list(keys)
+    if not keys:
+        return 0
+    count = db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.scope == scope,
+        IdempotencyRecord.key.in_(keys)
+    ).delete(synchronize_session=False)
+    commit(db)
+    return count
+
+
+def purge_idempotency_records(db: Session, before: datetime) -> int:
+    """Delete records created before the given time"""
+    count = db.query(IdempotencyRecord).filter(IdempotencyRecord.created_at < before).delete(synchronize_session=False)
+    commit(db)
+    return count
@@ -1,10 +1,11 @@
 """
 Inventory Model
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Index, case, delete, func, select, tuple_, update
 from sqlalchemy.orm import relationship, Session
 from datetime import datetime
-from .database import Base
+from typing import List, Dict, Any
+from .database import Base, commit, content_hash
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,9 @@ logger = logging.getLogger(__name__)
 class Inventory(Base):
     """Inventory table"""
     __tablename__ = "inventories"
+    __table_args__ = (
+        Index("uq_inventory_product_store", "product_id", "store_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), index=True)
@@ -27,8 +31,11 @@ class Inventory(Base):
     shelf = Column(String, nullable=True)
     status = Column(String, default="ENABLED")
     location_data = Column(JSON, nullable=True)
+    content_hash = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Only moves when aisle or rack change, so stock updates leave the store layout version alone
+    layout_updated_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     product = relationship("Product", back_populates="inventories")
@@ -36,8 +43,16 @@ class Inventory(Base):
 
 # ==================== CRUD Operations ====================
 
+LAYOUT_COLUMNS = ("aisle", "rack")
+
+
+def _layout_changed(stored: tuple, values: dict) -> bool:
+    """Whether values set an aisle or rack different from the stored (aisle, rack)"""
+    return any(column in values and values[column] != current for column, current in zip(LAYOUT_COLUMNS, stored))
+
+
 def create_or_update_inventory(db: Session, inventory_data: dict) -> Inventory:
-    """Create or update inventory"""
+    """Create or update inventory; an unchanged payload is not written"""
     from .product import get_product_by_external_id
     
     product_id = inventory_data.get("product_id")
@@ -52,17 +67,25 @@ def create_or_update_inventory(db: Session, inventory_data: dict) -> Inventory:
         Inventory.store_id == store_id
     ).first()
     
+    fingerprint = content_hash(inventory_data)
     if db_inventory:
+        if db_inventory.content_hash == fingerprint:
+            return db_inventory
+        if _layout_changed((db_inventory.aisle, db_inventory.rack), inventory_data):
+            db_inventory.layout_updated_at = datetime.utcnow()
         for key, value in inventory_data.items():
             if key != 'product_id':
                 setattr(db_inventory, key, value)
         db_inventory.product_id = product.id
+        db_inventory.content_hash = fingerprint
     else:
-        db_inventory = Inventory(product_id=product.id, **{k: v for k, v in inventory_data.items() if k != 'product_id'})
+        db_inventory = Inventory(
+            product_id=product.id, content_hash=fingerprint,
+            **{k: v for k, v in inventory_data.items() if k != 'product_id'}
+        )
     
     db.add(db_inventory)
-    db.commit()
-    db.refresh(db_inventory)
+    commit(db)
     return db_inventory
 
 
@@ -97,7 +120,210 @@ def update_inventory_stock(db: Session, product_id: int, store_id: int, new_stoc
         raise ValueError(f"Inventory not found for product {product_id} and store {store_id}")
     
     inventory.stock = new_stock
+    # The row no longer matches the last synced payload
+    inventory.content_hash = None
     inventory.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(inventory)
+    commit(db)
     return inventory
+
+
+# External ids per IN query; keeps every statement under SQLite's bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+
+def get_store_layout_version(db: Session, store_id: int) -> tuple:
+    """
+    Cheap fingerprint of a store's layout (row count, newest aisle/rack change, highest id)
+
+    Changes when rows are added or removed or an aisle or rack is moved; stock,
+    price and other updates leave it alone.
+    """
+    count, layout_updated_at, max_id = db.query(
+        func.count(Inventory.id), func.max(Inventory.layout_updated_at), func.max(Inventory.id)
+    ).filter(Inventory.store_id == store_id).one()
+    return (count, str(layout_updated_at), max_id)
+
+
+def get_store_locations(db: Session, store_id: int) -> List[tuple]:
+    """Distinct (aisle, rack) pairs stocked in a store"""
+    return db.query(Inventory.aisle, Inventory.rack).filter(
+        Inventory.store_id == store_id, Inventory.aisle.isnot(None)
+    ).distinct().all()
+
+
+def get_item_locations(db: Session, store_id: int, product_ids: List[int]) -> Dict[int, tuple]:
+    """Map internal product IDs to their (aisle, rack, shelf, location_data) in a store"""
+    locations = {}
+    product_ids = list(set(product_ids))
+    for i in range(0, len(product_ids), UPSERT_CHUNK_SIZE):
+        rows = db.query(
+            Inventory.product_id, Inventory.aisle, Inventory.rack, Inventory.shelf, Inventory.location_data
+        ).filter(
+            Inventory.store_id == store_id, Inventory.product_id.in_(product_ids[i:i + UPSERT_CHUNK_SIZE])
+        ).all()
+        locations.update({row[0]: tuple(row[1:]) for row in rows})
+    return locations
+
+
+def bulk_upsert_inventory(db: Session, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Create or update many inventory rows keyed on (product, store) in one transaction
+
+    External product ids are resolved with one IN query and rows are written with
+    INSERT ... ON CONFLICT (product_id, store_id) DO UPDATE on SQLite and Postgres.
+    When the same (product, store) appears more than once, the last row wins and
+    each repeat is reported against the row before it, so only the first is CREATED.
+    Rows whose content hash matches the stored one are not written, and nothing
+    is committed when every row is unchanged.
+
+    Args:
+        db: Database session
+        rows: Inventory dicts whose product_id is the external product id
+
+    Returns:
+        One result per input row, in input order: {"product_id", "store_id", "stock", "status"}
+        with status CREATED, UPDATED or UNCHANGED, or {"error", "payload"} when the
+        product is unknown
+    """
+    from .product import get_products_by_external_ids
+
+    product_pks = {}
+    external_ids = list({row.get("product_id") for row in rows})
+    for i in range(0, len(external_ids), UPSERT_CHUNK_SIZE):
+        products = get_products_by_external_ids(db, external_ids[i:i + UPSERT_CHUNK_SIZE])
+        product_pks.update({pid: p.id for pid, p in products.items()})
+
+    # Only the (product, store) pairs of this batch, so the lookup does not grow with the table
+    stored_hashes = {}
+    stored_layouts = {}
+    pairs = list({(product_pks[row.get("product_id")], row.get("store_id")) for row in rows if row.get("product_id") in product_pks})
+    for i in range(0, len(pairs), UPSERT_CHUNK_SIZE):
+        stored = db.query(
+            Inventory.product_id, Inventory.store_id, Inventory.content_hash, Inventory.aisle, Inventory.rack
+        ).filter(
+            tuple_(Inventory.product_id, Inventory.store_id).in_(pairs[i:i + UPSERT_CHUNK_SIZE])
+        ).all()
+        for pk, store_id, digest, aisle, rack in stored:
+            stored_hashes[(pk, store_id)] = digest
+            stored_layouts[(pk, store_id)] = (aisle, rack)
+
+    results = []
+    latest = {}
+    for row in rows:
+        product_pk = product_pks.get(row.get("product_id"))
+        if product_pk is None:
+            results.append({"error": f"Product {row.get('product_id')} not found", "payload": row})
+            continue
+        key = (product_pk, row.get("store_id"))
+        fingerprint = content_hash(row)
+        if key not in stored_hashes:
+            status = "CREATED"
+        elif stored_hashes[key] == fingerprint:
+            status = "UNCHANGED"
+        else:
+            status = "UPDATED"
+        if status != "UNCHANGED":
+            now = datetime.utcnow()
+            value = {**row, "product_id": product_pk, "content_hash": fingerprint, "updated_at": now}
+            # Only the last row of a pair is written, so each is compared with the stored layout
+            if key in stored_layouts and _layout_changed(stored_layouts[key], row):
+                value["layout_updated_at"] = now
+            latest[key] = value
+            # A repeat of the pair later in the batch is compared with what this row writes
+            stored_hashes[key] = fingerprint
+        results.append({
+            "product_id": row.get("product_id"), "store_id": row.get("store_id"),
+            "stock": row.get("stock"), "status": status
+        })
+
+    values = list(latest.values())
+    if not values:
+        return results
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        # Rows are grouped by column set so each statement has a uniform parameter set
+        by_columns = {}
+        for value in values:
+            by_columns.setdefault(tuple(sorted(value)), []).append(value)
+        for columns, group in by_columns.items():
+            stmt = insert(Inventory)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Inventory.product_id, Inventory.store_id],
+                set_={col: stmt.excluded[col] for col in columns if col not in ("product_id", "store_id")}
+            )
+            # executemany form: compiled once, batched into multi-row statements by the driver layer
+            db.execute(stmt, group)
+    else:
+        for value in values:
+            db_inventory = db.query(Inventory).filter(
+                Inventory.product_id == value["product_id"],
+                Inventory.store_id == value.get("store_id")
+            ).first()
+            if db_inventory:
+                for key, val in value.items():
+                    setattr(db_inventory, key, val)
+            else:
+                db.add(Inventory(**value))
+        db.flush()
+
+    commit(db)
+    return results
+
+
+def decrement_inventory_stock(db: Session, store_id: int, quantities: Dict[int, float]) -> List[Dict[str, Any]]:
+    """
+    Take picked quantities out of a store's stock with one set-based UPDATE ... RETURNING
+
+    Stock is clamped at zero. The rows lose their content hash, so an identical
+    upstream resend is applied again. Nothing is committed outside a unit of work's
+    own commit, so the decrement lands together with the caller's other changes.
+
+    Args:
+        db: Database session
+        store_id: Store whose stock is decremented
+        quantities: Internal product ID -> quantity to take out
+
+    Returns:
+        {"product_id" (external), "store_id", "stock"} per decremented row;
+        products without an inventory row in the store are left out
+    """
+    from .product import Product
+
+    quantities = {pk: qty for pk, qty in quantities.items() if pk is not None and qty}
+    if not quantities:
+        return []
+    updated = []
+    product_pks = list(quantities)
+    for i in range(0, len(product_pks), UPSERT_CHUNK_SIZE):
+        chunk = product_pks[i:i + UPSERT_CHUNK_SIZE]
+        remaining = Inventory.stock - case({pk: quantities[pk] for pk in chunk}, value=Inventory.product_id, else_=0)
+        stmt = update(Inventory).where(
+            Inventory.store_id == store_id,
+            Inventory.product_id.in_(chunk)
+        ).values(
+            stock=case((remaining > 0, remaining), else_=0),
+            content_hash=None,
+            updated_at=datetime.utcnow()
+        ).returning(Inventory.product_id, Inventory.stock)
+        updated.extend(db.execute(stmt, execution_options={"synchronize_session": False}).all())
+
+    external_ids = {}
+    pks = [pk for pk, _ in updated]
+    for i in range(0, len(pks), UPSERT_CHUNK_SIZE):
+        external_ids.update(db.query(Product.id, Product.product_id).filter(Product.id.in_(pks[i:i + UPSERT_CHUNK_SIZE])).all())
+    commit(db)
+    return [
+        {"product_id": external_ids.get(pk), "store_id": store_id, "stock": float(stock)}
+        for pk, stock in updated
+    ]
+
+
+def deduplicate_inventory(conn) -> int:
+    """Delete all but the newest row of each (product, store) pair; returns rows removed"""
+    keep = select(func.max(Inventory.id)).group_by(Inventory.product_id, Inventory.store_id)
+    result = conn.execute(delete(Inventory).where(Inventory.id.notin_(keep.scalar_subquery())))
+    return result.rowcount
@@ -1,10 +1,11 @@
 """
 Order and OrderItem Models
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Row, func, select, update
 from sqlalchemy.orm import relationship, Session
 from datetime import datetime
-from .database import Base
+from typing import Optional
+from .database import Base, commit
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,6 +33,8 @@ class Order(Base):
     slot_start_time = Column(String, nullable=True)
     slot_end_time = Column(String, nullable=True)
     picking_status = Column(String, default="NOT_STARTED")
+    picking_started_at = Column(DateTime, nullable=True)
+    wave_id = Column(Integer, ForeignKey("pick_waves.id"), nullable=True, index=True)
     packed_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -41,6 +44,7 @@ class Order(Base):
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     picking_activities = relationship("PickingActivity", back_populates="order", cascade="all, delete-orphan")
     crate_labels = relationship("CrateLabel", back_populates="order", cascade="all, delete-orphan")
+    wave = relationship("PickWave", back_populates="orders")
 
 
 class OrderItem(Base):
@@ -71,8 +75,7 @@ def create_order(db: Session, order_data: dict) -> Order:
     """Create a new order"""
     db_order = Order(**order_data)
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+    commit(db)
     return db_order
 
 
@@ -91,6 +94,33 @@ def get_order_by_reference(db: Session, reference_number: str) -> Order:
     return db.query(Order).filter(Order.reference_number == reference_number).first()
 
 
+def get_existing_order_ids(db: Session, external_order_ids) -> set:
+    """Return the subset of external order_ids already stored"""
+    ids = {oid for oid in external_order_ids if oid is not None}
+    if not ids:
+        return set()
+    return {row[0] for row in db.query(Order.order_id).filter(Order.order_id.in_(ids)).all()}
+
+
+def get_existing_order_references(db: Session, reference_numbers) -> set:
+    """Return the subset of reference numbers already stored"""
+    refs = {ref for ref in reference_numbers if ref is not None}
+    if not refs:
+        return set()
+    return {row[0] for row in db.query(Order.reference_number).filter(Order.reference_number.in_(refs)).all()}
+
+
+def get_orders_by_ids(db: Session, order_ids, for_update: bool = False) -> dict:
+    """Get orders by database ID with a single IN query, keyed by ID (optionally locking the rows)"""
+    ids = list({oid for oid in order_ids if oid is not None})
+    if not ids:
+        return {}
+    query = db.query(Order).filter(Order.id.in_(ids))
+    if for_update:
+        query = query.with_for_update()
+    return {order.id: order for order in query.all()}
+
+
 def get_all_orders(db: Session, skip: int = 0, limit: int = 100, status: str = None) -> list:
     """Get all orders with optional status filter"""
     query = db.query(Order)
@@ -110,19 +140,19 @@ def update_order_status(db: Session, order_id: int, status: str) -> Order:
     if order:
         order.status = status
         order.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(order)
+        commit(db)
     return order
 
 
 def update_order_picking_status(db: Session, order_id: int, picking_status: str) -> Order:
-    """Update order picking status"""
+    """Update order picking status; moving to IN_PROGRESS records when picking started"""
     order = db.query(Order).filter(Order.id == order_id).first()
     if order:
         order.picking_status = picking_status
         order.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(order)
+        if picking_status == "IN_PROGRESS":
+            order.picking_started_at = order.updated_at
+        commit(db)
     return order
 
 
@@ -134,8 +164,7 @@ def pack_order(db: Session, order_id: int) -> Order:
         order.picking_status = "COMPLETED"
         order.packed_at = datetime.utcnow()
         order.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(order)
+        commit(db)
     return order
 
 
@@ -159,8 +188,7 @@ def create_order_item(db: Session, order_id: int, item_data: dict) -> OrderItem:
         discount=item_data.get("discount", 0)
     )
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    commit(db)
     return db_item
 
 
@@ -169,6 +197,23 @@ def get_order_items(db: Session, order_id: int) -> list:
     return db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
 
 
+def get_order_items_for_orders(db: Session, order_ids, for_update: bool = False) -> list:
+    """
+    Get the items of several orders with a single IN query
+
+    With for_update the rows are locked (SELECT ... FOR UPDATE) until the
+    transaction ends, so quantities read here stay valid for the writes that
+    follow; SQLite ignores it and relies on the unit of work's write lock.
+    """
+    ids = list({oid for oid in order_ids if oid is not None})
+    if not ids:
+        return []
+    query = db.query(OrderItem).filter(OrderItem.order_id.in_(ids)).order_by(OrderItem.id)
+    if for_update:
+        query = query.with_for_update()
+    return query.all()
+
+
 def get_order_item(db: Session, order_item_id: int) -> OrderItem:
     """Get a specific order item"""
     return db.query(OrderItem).filter(OrderItem.id == order_item_id).first()
@@ -180,6 +225,42 @@ def update_order_item_picked_quantity(db: Session, order_item_id: int, picked_qu
     if item:
         item.picked_quantity = picked_quantity
         item.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(item)
+        commit(db)
     return item
+
+
+def increment_picked_quantity(db: Session, order_id: int, product_id: int, quantity: float) -> Optional[Row]:
+    """
+    Add to an item's picked quantity with one guarded UPDATE ... RETURNING
+
+    The increment happens in the database and only applies while the order is
+    IN_PROGRESS and the new quantity stays within the ordered quantity, so
+    concurrent scans of the same item can neither lose an update nor over-pick.
+
+    Args:
+        db: Database session
+        order_id: Internal order ID
+        product_id: Internal product ID of the scanned item
+        quantity: Quantity to add
+
+    Returns:
+        (id, picked_quantity, ordered_quantity) after the increment, or None when
+        a guard failed (the caller re-reads the order to tell which)
+    """
+    # The first item of the order for this product, as when items are matched in Python
+    item_id = select(func.min(OrderItem.id)).where(
+        OrderItem.order_id == order_id,
+        OrderItem.product_id == product_id
+    ).scalar_subquery()
+    in_progress = select(Order.id).where(Order.id == order_id, Order.picking_status == "IN_PROGRESS")
+    stmt = update(OrderItem).where(
+        OrderItem.id == item_id,
+        OrderItem.order_id.in_(in_progress),
+        OrderItem.picked_quantity + quantity <= OrderItem.ordered_quantity
+    ).values(
+        picked_quantity=OrderItem.picked_quantity + quantity,
+        updated_at=datetime.utcnow()
+    ).returning(OrderItem.id, OrderItem.picked_quantity, OrderItem.ordered_quantity)
+    row = db.execute(stmt, execution_options={"synchronize_session": False}).first()
+    commit(db)
+    return row
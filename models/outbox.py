@@ -0,0 +1,231 @@
+"""
+Outbox Message Model - calls to external services recorded in the transaction that caused them
+"""
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, Index, func, insert, select, update, exists, or_
+from sqlalchemy.orm import Session, aliased
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .database import Base, commit
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxMessage(Base):
+    """Outbox message table"""
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        Index("ix_outbox_messages_key_status", "message_key", "status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String, index=True, nullable=False)
+    # Messages with the same key are delivered one at a time in insertion order
+    message_key = Column(String, nullable=False)
+    status = Column(String, default="PENDING", index=True)  # PENDING, SENDING, SENT, SUPERSEDED or DEAD
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    claimed_at = Column(DateTime, nullable=True)  # when a dispatcher last moved it to SENDING
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+# ==================== CRUD Operations ====================
+
+def add_outbox_messages(db: Session, messages: List[Dict[str, Any]], not_before: datetime = None) -> List[int]:
+    """
+    Record outgoing messages ({"topic", "key", "payload"}) with one multi-row INSERT and return their IDs
+
+    Joins an open unit of work, so the messages exist exactly when the changes
+    they announce have committed. Messages are due at once, or from not_before.
+    """
+    if not messages:
+        return []
+    now = datetime.utcnow()
+    due = not_before or now
+    # Unsorted RETURNING keeps this one statement (SQLite cannot sort it). Rows of one INSERT get
+    # ascending IDs in insertion order, so each (topic, key) takes its IDs in ascending order.
+    result = db.execute(insert(OutboxMessage).returning(OutboxMessage.id, OutboxMessage.topic, OutboxMessage.message_key), [
+        {
+            "topic": message["topic"], "message_key": message["key"], "payload": message["payload"],
+            "status": "PENDING", "attempts": 0, "next_attempt_at": due, "created_at": now
+        }
+        for message in messages
+    ])
+    ids_by_key: Dict[tuple, deque] = {}
+    for message_id, topic, message_key in sorted(result.all()):
+        ids_by_key.setdefault((topic, message_key), deque()).append(message_id)
+    commit(db)
+    return [ids_by_key[(message["topic"], message["key"])].popleft() for message in messages]
+
+
+def supersede_outbox_messages(db: Session, topic: str, message_keys: List[str]) -> int:
+    """
+    Mark the PENDING messages of a topic with the given keys as SUPERSEDED
+
+    For topics whose payload is the latest state of the key (e.g. a stock
+    level), a newer message makes the undelivered older ones redundant.
+    Messages already being sent are left alone.
+    """
+    if not message_keys:
+        return 0
+    count = db.query(OutboxMessage).filter(
+        OutboxMessage.topic == topic,
+        OutboxMessage.message_key.in_(set(message_keys)),
+        OutboxMessage.status == "PENDING"
+    ).update({
+        OutboxMessage.status: "SUPERSEDED",
+        OutboxMessage.sent_at: datetime.utcnow()
+    }, synchronize_session=False)
+    commit(db)
+    return count
+
+
+def claim_outbox_batch(db: Session, limit: int, message_ids: List[int] = None) -> List[OutboxMessage]:
+    """
+    Atomically move up to `limit` due messages from PENDING to SENDING
+
+    Only the oldest unfinished message of each key is due, so a key's messages
+    go out in order. The conditional UPDATE ... RETURNING only hands a message
+    to one dispatcher, even across processes. Given message_ids, only those are
+    claimed, whether or not their next attempt time has come.
+    """
+    earlier = aliased(OutboxMessage)
+    head_of_key = ~exists().where(
+        earlier.message_key == OutboxMessage.message_key,
+        earlier.id < OutboxMessage.id,
+        earlier.status.in_(("PENDING", "SENDING"))
+    )
+    query = select(OutboxMessage.id).where(OutboxMessage.status == "PENDING", head_of_key)
+    if message_ids is not None:
+        query = query.where(OutboxMessage.id.in_(message_ids))
+    else:
+        query = query.where(OutboxMessage.next_attempt_at <= datetime.utcnow())
+    candidates = [row[0] for row in db.execute(query.order_by(OutboxMessage.id).limit(limit))]
+    if not candidates:
+        db.rollback()
+        return []
+    claimed = [row[0] for row in db.execute(
+        update(OutboxMessage).where(
+            OutboxMessage.id.in_(candidates),
+            OutboxMessage.status == "PENDING"
+        ).values(
+            status="SENDING",
+            attempts=OutboxMessage.attempts + 1,
+            claimed_at=datetime.utcnow()
+        ).returning(OutboxMessage.id),
+        execution_options={"synchronize_session": False}
+    )]
+    db.commit()
+    if not claimed:
+        return []
+    return db.query(OutboxMessage).filter(OutboxMessage.id.in_(claimed)).order_by(OutboxMessage.id).all()
+
+
+def mark_outbox_sent(db: Session, message_ids: List[int]) -> int:
+    """Mark delivered messages as SENT with one UPDATE"""
+    if not message_ids:
+        return 0
+    count = db.query(OutboxMessage).filter(OutboxMessage.id.in_(message_ids)).update({
+        OutboxMessage.status: "SENT",
+        OutboxMessage.last_error: None,
+        OutboxMessage.sent_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.commit()
+    return count
+
+
+def retry_outbox_message(db: Session, message_id: int, error: str, next_attempt_at: datetime) -> None:
+    """Record a failed delivery and schedule the next attempt"""
+    db.query(OutboxMessage).filter(OutboxMessage.id == message_id).update({
+        OutboxMessage.status: "PENDING",
+        OutboxMessage.last_error: error,
+        OutboxMessage.next_attempt_at: next_attempt_at
+    }, synchronize_session=False)
+    db.commit()
+
+
+def release_outbox_messages(db: Session, message_ids: List[int]) -> int:
+    """Return claimed but unattempted messages to PENDING without counting an attempt"""
+    if not message_ids:
+        return 0
+    count = db.query(OutboxMessage).filter(
+        OutboxMessage.id.in_(message_ids), OutboxMessage.status == "SENDING"
+    ).update({
+        OutboxMessage.status: "PENDING",
+        OutboxMessage.attempts: OutboxMessage.attempts - 1
+    }, synchronize_session=False)
+    db.commit()
+    return count
+
+
+def dead_letter_outbox_message(db: Session, message_id: int, error: str) -> None:
+    """Give up on a message; it stays in the table as DEAD until retried by hand"""
+    db.query(OutboxMessage).filter(OutboxMessage.id == message_id).update({
+        OutboxMessage.status: "DEAD",
+        OutboxMessage.last_error: error
+    }, synchronize_session=False)
+    db.commit()
+
+
+def retry_dead_outbox_messages(db: Session, message_ids: List[int] = None) -> int:
+    """Put DEAD messages (all, or the given ones) back in the queue with a fresh attempt budget"""
+    query = db.query(OutboxMessage).filter(OutboxMessage.status == "DEAD")
+    if message_ids is not None:
+        query = query.filter(OutboxMessage.id.in_(message_ids))
+    count = query.update({
+        OutboxMessage.status: "PENDING",
+        OutboxMessage.attempts: 0,
+        OutboxMessage.next_attempt_at: datetime.utcnow()
+    }, synchronize_session=False)
+    commit(db)
+    return count
+
+
+def requeue_stale_outbox_messages(db: Session, claimed_before: datetime) -> int:
+    """
+    Return messages stuck in SENDING since before the given time to the queue
+
+    Only messages claimed before claimed_before are touched, so the ones a live
+    dispatcher (in this or another process) is still sending keep their claim.
+    """
+    count = db.query(OutboxMessage).filter(
+        OutboxMessage.status == "SENDING",
+        or_(OutboxMessage.claimed_at.is_(None), OutboxMessage.claimed_at < claimed_before)
+    ).update(
+        {OutboxMessage.status: "PENDING"}, synchronize_session=False
+    )
+    db.commit()
+    return count
+
+
+def purge_sent_outbox_messages(db: Session, before: datetime) -> int:
+    """Delete SENT and SUPERSEDED messages finished before the given time"""
+    count = db.query(OutboxMessage).filter(
+        OutboxMessage.status.in_(("SENT", "SUPERSEDED")),
+        OutboxMessage.sent_at < before
+    ).delete(synchronize_session=False)
+    db.commit()
+    return count
+
+
+def get_outbox_messages(db: Session, status: str = None, topic: str = None, skip: int = 0, limit: int = 100) -> List[OutboxMessage]:
+    """Get outbox messages, newest first, with optional status and topic filters"""
+    query = db.query(OutboxMessage)
+    if status:
+        query = query.filter(OutboxMessage.status == status)
+    if topic:
+        query = query.filter(OutboxMessage.topic == topic)
+    return query.order_by(OutboxMessage.id.desc()).offset(skip).limit(limit).all()
+
+
+def get_outbox_stats(db: Session) -> dict:
+    """Get message counts per status and the creation time of the oldest unsent message"""
+    counts = dict(db.query(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status).all())
+    oldest_pending: Optional[datetime] = db.query(func.min(OutboxMessage.created_at)).filter(
+        OutboxMessage.status.in_(("PENDING", "SENDING"))
+    ).scalar()
+    return {"counts": counts, "oldest_pending_at": oldest_pending}
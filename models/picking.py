@@ -1,10 +1,11 @@
 """
 Picking Activity and Crate Label Models
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, insert
 from sqlalchemy.orm import relationship, Session
 from datetime import datetime
-from .database import Base
+from typing import List, Dict, Any
+from .database import Base, commit
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,8 @@ class PickingActivity(Base):
     picking_method = Column(String)
     picker_agent_id = Column(String, nullable=True)
     details = Column(JSON, nullable=True)
+    # Client-generated id of the scan that produced this entry; makes replayed scans no-ops
+    scan_id = Column(String, unique=True, index=True, nullable=True)
     picked_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -63,11 +66,29 @@ def create_picking_activity(
         details=details or {}
     )
     db.add(activity)
-    db.commit()
-    db.refresh(activity)
+    commit(db)
     return activity
 
 
+def create_picking_activities(db: Session, activities: List[Dict[str, Any]]) -> None:
+    """Insert many picking activity rows (PickingActivity column values) with one executemany INSERT"""
+    if not activities:
+        return
+    db.execute(insert(PickingActivity), activities)
+    commit(db)
+
+
+def get_recorded_scan_ids(db: Session, scan_ids) -> set:
+    """Return the subset of scan ids that already have a picking activity"""
+    scan_ids = list({scan_id for scan_id in scan_ids if scan_id is not None})
+    recorded = set()
+    # Chunked so very large flushes stay under the driver's bound-parameter limit
+    for i in range(0, len(scan_ids), 500):
+        rows = db.query(PickingActivity.scan_id).filter(PickingActivity.scan_id.in_(scan_ids[i:i + 500])).all()
+        recorded.update(row[0] for row in rows)
+    return recorded
+
+
 def get_picking_activities(db: Session, order_id: int) -> list:
     """Get all picking activities for an order"""
     return db.query(PickingActivity).filter(PickingActivity.order_id == order_id).all()
@@ -90,8 +111,7 @@ def create_crate_label(
         items_data=items_data or {}
     )
     db.add(label)
-    db.commit()
-    db.refresh(label)
+    commit(db)
     return label
 
 
@@ -1,10 +1,11 @@
 """
 Product Model
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Boolean, insert
 from sqlalchemy.orm import relationship, Session
 from datetime import datetime
-from .database import Base
+from typing import List, Dict, Any
+from .database import Base, atomic, commit, content_hash
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +25,7 @@ class Product(Base):
     average_rating = Column(Float, default=0)
     total_reviews = Column(Integer, default=0)
     sold_by_weight = Column(Boolean, default=False)
+    content_hash = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -35,20 +37,95 @@ class Product(Base):
 # ==================== CRUD Operations ====================
 
 def create_product(db: Session, product_data: dict) -> Product:
-    """Create or update a product"""
+    """Create or update a product; an unchanged payload is not written"""
+    fingerprint = content_hash(product_data)
     db_product = db.query(Product).filter(Product.product_id == product_data.get("product_id")).first()
     if db_product:
+        if db_product.content_hash == fingerprint:
+            return db_product
         for key, value in product_data.items():
             setattr(db_product, key, value)
+        db_product.content_hash = fingerprint
         db_product.updated_at = datetime.utcnow()
     else:
-        db_product = Product(**product_data)
+        db_product = Product(**product_data, content_hash=fingerprint)
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    commit(db)
     return db_product
 
 
+def bulk_upsert_products(db: Session, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Create or update many products, skipping those whose content hash is unchanged
+
+    Existing products are loaded with one IN query and all changes are committed
+    once; when nothing changed no write or commit is issued. If the batch fails
+    (e.g. a slug conflict) products are retried one by one so a bad row only
+    fails itself.
+
+    Args:
+        db: Database session
+        products: Product dicts keyed by external product_id
+
+    Returns:
+        One result per input product, in input order: {"product_id", "id", "status"}
+        with status CREATED, UPDATED or UNCHANGED, or {"error", "payload"}; a product
+        repeated in the batch is compared with its earlier payload, so only the first is CREATED
+    """
+    try:
+        with atomic(db):
+            results = _upsert_products(db, products)
+            if any(r["status"] != "UNCHANGED" for r in results):
+                commit(db)
+        return results
+    except Exception as e:
+        if len(products) == 1:
+            return [{"error": str(e), "payload": products[0]}]
+        logger.warning(f"Bulk product upsert of {len(products)} rows failed, retrying per row: {str(e)}")
+        results = []
+        for product_data in products:
+            results.extend(bulk_upsert_products(db, [product_data]))
+        return results
+
+
+def _upsert_products(db: Session, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    existing = {}
+    external_ids = list({p.get("product_id") for p in products})
+    for i in range(0, len(external_ids), 500):
+        existing.update(get_products_by_external_ids(db, external_ids[i:i + 500]))
+
+    statuses = []
+    new_rows = {}
+    for product_data in products:
+        fingerprint = content_hash(product_data)
+        product_id = product_data.get("product_id")
+        db_product = existing.get(product_id)
+        if product_id in new_rows:
+            # Repeated ids within the batch: the last payload wins
+            status = "UNCHANGED" if new_rows[product_id]["content_hash"] == fingerprint else "UPDATED"
+            new_rows[product_id] = {**product_data, "content_hash": fingerprint}
+        elif db_product is None:
+            new_rows[product_id] = {**product_data, "content_hash": fingerprint}
+            status = "CREATED"
+        elif db_product.content_hash == fingerprint:
+            status = "UNCHANGED"
+        else:
+            for key, value in product_data.items():
+                setattr(db_product, key, value)
+            db_product.content_hash = fingerprint
+            db_product.updated_at = datetime.utcnow()
+            status = "UPDATED"
+        statuses.append((product_id, status))
+
+    db.flush()
+    pks = {product_id: p.id for product_id, p in existing.items()}
+    if new_rows:
+        # Core INSERT ... RETURNING batches the new rows instead of one INSERT per object
+        rows = db.execute(insert(Product).returning(Product.id, Product.product_id), list(new_rows.values()))
+        pks.update({product_id: pk for pk, product_id in rows})
+    return [{"product_id": product_id, "id": pks[product_id], "status": status} for product_id, status in statuses]
+
+
 def get_product(db: Session, product_id: int) -> Product:
     """Get a product by database ID"""
     return db.query(Product).filter(Product.id == product_id).first()
@@ -59,6 +136,22 @@ def get_product_by_external_id(db: Session, external_product_id: int) -> Product
     return db.query(Product).filter(Product.product_id == external_product_id).first()
 
 
+def get_products_by_external_ids(db: Session, external_product_ids) -> dict:
+    """Get products keyed by external product_id with a single IN query"""
+    ids = {pid for pid in external_product_ids if pid is not None}
+    if not ids:
+        return {}
+    return {p.product_id: p for p in db.query(Product).filter(Product.product_id.in_(ids)).all()}
+
+
+def get_existing_product_slugs(db: Session, slugs) -> set:
+    """Return the subset of slugs already used by a product"""
+    slugs = {slug for slug in slugs if slug}
+    if not slugs:
+        return set()
+    return {row[0] for row in db.query(Product.slug).filter(Product.slug.in_(slugs)).all()}
+
+
 def get_all_products(db: Session, skip: int = 0, limit: int = 100) -> list:
     """Get all products with pagination"""
     return db.query(Product).offset(skip).limit(limit).all()
@@ -69,6 +162,6 @@ def delete_product(db: Session, product_id: int) -> bool:
     product = db.query(Product).filter(Product.id == product_id).first()
     if product:
         db.delete(product)
-        db.commit()
+        commit(db)
         return True
     return False
@@ -0,0 +1,105 @@
+"""
+Pick Wave Model - several orders of one store picked together in a single walk
+"""
+from sqlalchemy import Column, Integer, String, DateTime, update
+from sqlalchemy.orm import relationship, Session
+from datetime import datetime
+from typing import List
+from .database import Base, commit
+from .inventory import Inventory
+from .order import Order, OrderItem
+from .product import Product
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PickWave(Base):
+    """Pick wave table"""
+    __tablename__ = "pick_waves"
+
+    id = Column(Integer, primary_key=True, index=True)
+    pickup_location_id = Column(Integer, index=True)
+    status = Column(String, default="IN_PROGRESS", index=True)
+    picker_agent_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    orders = relationship("Order", back_populates="wave")
+
+
+# ==================== CRUD Operations ====================
+
+def create_wave(db: Session, pickup_location_id: int, order_ids: List[int], agent_id: int = None) -> PickWave:
+    """Create a wave, assign the orders to it and start their picking with one UPDATE"""
+    wave = PickWave(pickup_location_id=pickup_location_id, status="IN_PROGRESS", picker_agent_id=agent_id)
+    db.add(wave)
+    db.flush()
+    now = datetime.utcnow()
+    db.execute(
+        update(Order).where(Order.id.in_(order_ids)).values(
+            wave_id=wave.id, picking_status="IN_PROGRESS", picking_started_at=now, updated_at=now
+        ),
+        execution_options={"synchronize_session": "fetch"}
+    )
+    commit(db)
+    return wave
+
+
+def get_wave(db: Session, wave_id: int) -> PickWave:
+    """Get a wave by ID"""
+    return db.query(PickWave).filter(PickWave.id == wave_id).first()
+
+
+def get_waves(db: Session, status: str = None, skip: int = 0, limit: int = 100) -> list:
+    """Get waves, newest first, with an optional status filter"""
+    query = db.query(PickWave)
+    if status:
+        query = query.filter(PickWave.status == status)
+    return query.order_by(PickWave.id.desc()).offset(skip).limit(limit).all()
+
+
+def get_wave_orders(db: Session, wave_id: int) -> list:
+    """Get the orders of a wave, oldest first"""
+    return db.query(Order).filter(Order.wave_id == wave_id).order_by(Order.id).all()
+
+
+def get_wave_item_rows(db: Session, wave: PickWave, product_id: int = None, for_update: bool = False) -> list:
+    """
+    Get every item of a wave's orders with its product and store location in one query
+
+    Args:
+        db: Database session
+        wave: The wave
+        product_id: Only items of this internal product ID
+        for_update: Lock the item rows until the transaction ends (ignored by SQLite)
+
+    Returns:
+        (OrderItem, Order, Product, aisle, rack, shelf) rows, oldest order first
+    """
+    query = db.query(
+        OrderItem, Order, Product, Inventory.aisle, Inventory.rack, Inventory.shelf
+    ).join(
+        Order, Order.id == OrderItem.order_id
+    ).outerjoin(
+        Product, Product.id == OrderItem.product_id
+    ).outerjoin(
+        Inventory, (Inventory.product_id == OrderItem.product_id) & (Inventory.store_id == wave.pickup_location_id)
+    ).filter(Order.wave_id == wave.id)
+    if product_id is not None:
+        query = query.filter(OrderItem.product_id == product_id)
+    query = query.order_by(Order.id, OrderItem.id)
+    if for_update:
+        query = query.with_for_update(of=OrderItem)
+    return query.all()
+
+
+def complete_wave(db: Session, wave_id: int) -> PickWave:
+    """Mark a wave as completed"""
+    wave = db.query(PickWave).filter(PickWave.id == wave_id).first()
+    if wave:
+        wave.status = "COMPLETED"
+        wave.completed_at = datetime.utcnow()
+        commit(db)
+    return wave
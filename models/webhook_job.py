@@ -0,0 +1,192 @@
+"""
+Webhook Job Model - durable local queue for webhook payloads
+"""
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, case, exists, func, or_
+from sqlalchemy.orm import Session, aliased
+from datetime import datetime
+from typing import List, Optional
+from .database import Base, commit
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookJob(Base):
+    """Webhook job table"""
+    __tablename__ = "webhook_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True, nullable=False)
+    ordering_key = Column(String, index=True, nullable=True)
+    status = Column(String, default="PENDING", index=True)
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=True, index=True)  # set while a failed job waits to be retried
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    # Refreshed by the worker while the job runs; a job whose heartbeat stops is requeued
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# ==================== CRUD Operations ====================
+
+def enqueue_webhook_job(db: Session, kind: str, payload, ordering_key: str = None) -> WebhookJob:
+    """Persist a webhook payload as a pending job"""
+    job = WebhookJob(kind=kind, ordering_key=ordering_key or kind, payload=payload, status="PENDING", attempts=0)
+    db.add(job)
+    # Joins an open unit of work, so the job only exists if the request's other writes do;
+    # state transitions below always commit at once
+    commit(db)
+    return job
+
+
+def get_webhook_job(db: Session, job_id: int) -> WebhookJob:
+    """Get a webhook job by ID"""
+    return db.query(WebhookJob).filter(WebhookJob.id == job_id).first()
+
+
+def _head_of_idle_key():
+    """No job with the same ordering key is PROCESSING or waiting ahead of this one"""
+    other = aliased(WebhookJob)
+    return ~exists().where(
+        other.ordering_key == WebhookJob.ordering_key,
+        or_(
+            other.status == "PROCESSING",
+            (other.status == "PENDING") & (other.id < WebhookJob.id)
+        )
+    )
+
+
+def claim_next_webhook_job(db: Session) -> Optional[WebhookJob]:
+    """
+    Atomically move the oldest claimable pending job to PROCESSING
+
+    Jobs sharing an ordering key run one at a time in enqueue order, so a later
+    payload for the same entities is never applied before an earlier one; a job
+    waiting out its retry backoff holds back the rest of its key. The
+    conditional UPDATE re-checks both the job's status and its ordering key in
+    the same statement, so only one worker can claim a job and no two workers
+    run jobs of the same key, whatever happened since the candidate was read.
+    """
+    while True:
+        candidate = db.query(WebhookJob.id).filter(
+            WebhookJob.status == "PENDING",
+            or_(WebhookJob.next_attempt_at.is_(None), WebhookJob.next_attempt_at <= datetime.utcnow()),
+            _head_of_idle_key()
+        ).order_by(WebhookJob.id).first()
+        if candidate is None:
+            db.rollback()
+            return None
+        now = datetime.utcnow()
+        claimed = db.query(WebhookJob).filter(
+            WebhookJob.id == candidate.id,
+            WebhookJob.status == "PENDING",
+            _head_of_idle_key()
+        ).update({
+            WebhookJob.status: "PROCESSING",
+            # Also identifies this claim; see complete_webhook_job
+            WebhookJob.started_at: now,
+            WebhookJob.heartbeat_at: now,
+            WebhookJob.attempts: WebhookJob.attempts + 1
+        }, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return get_webhook_job(db, candidate.id)
+
+
+def _holding_claim(job_id: int, started_at: Optional[datetime]) -> list:
+    """Filter for a job still PROCESSING under the claim made at started_at (any job when None)"""
+    conditions = [WebhookJob.id == job_id]
+    if started_at is not None:
+        conditions += [WebhookJob.status == "PROCESSING", WebhookJob.started_at == started_at]
+    return conditions
+
+
+def complete_webhook_job(db: Session, job_id: int, result, started_at: datetime = None) -> bool:
+    """
+    Mark a job as done and store its result
+
+    Joins an open unit of work, so a job's own writes and its completion commit
+    together. Given the started_at of the worker's claim, nothing is written and
+    False is returned when the job no longer holds that claim (it was requeued).
+    """
+    count = db.query(WebhookJob).filter(*_holding_claim(job_id, started_at)).update({
+        WebhookJob.status: "DONE",
+        WebhookJob.result: result,
+        WebhookJob.error: None,
+        WebhookJob.next_attempt_at: None,
+        WebhookJob.finished_at: datetime.utcnow()
+    }, synchronize_session=False)
+    commit(db)
+    return count > 0
+
+
+def fail_webhook_job(
+    db: Session, job_id: int, error: str, max_attempts: int, next_attempt_at: datetime = None, started_at: datetime = None
+) -> Optional[WebhookJob]:
+    """
+    Record a failed attempt; the job is retried from next_attempt_at until max_attempts is reached
+
+    Given the started_at of the worker's claim, nothing is written and None is
+    returned when the job no longer holds that claim.
+    """
+    exhausted = WebhookJob.attempts >= max_attempts
+    count = db.query(WebhookJob).filter(*_holding_claim(job_id, started_at)).update({
+        WebhookJob.error: error,
+        WebhookJob.status: case((exhausted, "FAILED"), else_="PENDING"),
+        WebhookJob.finished_at: case((exhausted, datetime.utcnow()), else_=None),
+        WebhookJob.next_attempt_at: case((exhausted, None), else_=next_attempt_at)
+    }, synchronize_session=False)
+    db.commit()
+    return get_webhook_job(db, job_id) if count else None
+
+
+def touch_webhook_jobs(db: Session, job_ids: List[int]) -> int:
+    """Refresh the heartbeat of running jobs, so they are not requeued as abandoned"""
+    if not job_ids:
+        return 0
+    count = db.query(WebhookJob).filter(
+        WebhookJob.id.in_(job_ids),
+        WebhookJob.status == "PROCESSING"
+    ).update({WebhookJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return count
+
+
+def requeue_stale_webhook_jobs(db: Session, alive_after: datetime) -> int:
+    """
+    Return PROCESSING jobs with no heartbeat since the given time to the queue
+
+    Workers refresh the heartbeat of their running jobs, so jobs that live
+    workers (in this or another process) are running, however long, keep
+    their claim. Jobs claimed before heartbeats existed fall back to started_at.
+    """
+    last_seen = func.coalesce(WebhookJob.heartbeat_at, WebhookJob.started_at)
+    count = db.query(WebhookJob).filter(
+        WebhookJob.status == "PROCESSING",
+        or_(last_seen.is_(None), last_seen < alive_after)
+    ).update(
+        {WebhookJob.status: "PENDING", WebhookJob.next_attempt_at: None}, synchronize_session=False
+    )
+    db.commit()
+    return count
+
+
+def purge_finished_webhook_jobs(db: Session, before: datetime) -> int:
+    """Delete DONE jobs that finished before the given time"""
+    count = db.query(WebhookJob).filter(
+        WebhookJob.status == "DONE",
+        WebhookJob.finished_at < before
+    ).delete(synchronize_session=False)
+    db.commit()
+    return count
+
+
+def get_webhook_queue_stats(db: Session) -> dict:
+    """Get job counts per status and the creation time of the oldest pending job"""
+    counts = dict(db.query(WebhookJob.status, func.count(WebhookJob.id)).group_by(WebhookJob.status).all())
+    oldest_pending = db.query(func.min(WebhookJob.created_at)).filter(WebhookJob.status == "PENDING").scalar()
+    return {"counts": counts, "oldest_pending_at": oldest_pending}
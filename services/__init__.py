@@ -1,5 +1,5 @@
 """
-Services package - contains all external service integrations
+Services package - external service integrations and business logic
 """
 from .order_client import OrderServiceClient
 from .inventory_client import InventoryServiceClient
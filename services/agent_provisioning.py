@@ -0,0 +1,201 @@
+"""
+Bulk agent provisioning from a CSV or JSON list
+
+Onboarding a store creates hundreds of agents. Instead of one register call
+(one bcrypt hash, one commit) per agent, a batch is:
+
+1. checked row by row (username and password present, no repeated username)
+2. checked against existing usernames with one query
+3. hashed in parallel on AGENT_PROVISIONING_WORKERS threads (bcrypt releases the GIL)
+4. inserted with one multi-row INSERT in a single transaction
+
+Every row gets an outcome: CREATED, ALREADY_EXISTS, DUPLICATE or INVALID.
+
+Command line:
+    python -m services.agent_provisioning agents.csv [--format csv|json]
+
+CSV files need a header row with username and password columns; full_name,
+email and phone are optional. JSON files hold a list of objects with the same
+keys. "-" reads from stdin.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from config import AGENT_PROVISIONING_WORKERS
+import models as crud
+from models import aio
+from utils.auth import hash_password
+
+logger = logging.getLogger(__name__)
+
+CREATED = "CREATED"
+ALREADY_EXISTS = "ALREADY_EXISTS"
+DUPLICATE = "DUPLICATE"
+INVALID = "INVALID"
+
+FIELDS = ("username", "password", "full_name", "email", "phone")
+
+
+def parse_agents_csv(text: str) -> List[Dict[str, Any]]:
+    """Rows of a CSV with a header line; empty cells become None, passwords are taken as they are"""
+    return [
+        {field: row.get(field) if field == "password" else (row.get(field) or "").strip() or None for field in FIELDS}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+
+def parse_agents_json(text: str) -> List[Dict[str, Any]]:
+    """A JSON list of agents, or {"agents": [...]}"""
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("agents")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON list of agents or {\"agents\": [...]}")
+    return data
+
+
+def hash_passwords(passwords: List[str], workers: int = AGENT_PROVISIONING_WORKERS) -> List[str]:
+    """bcrypt hashes of the passwords, in order, computed on up to `workers` threads"""
+    if len(passwords) <= 1 or workers <= 1:
+        return [hash_password(password) for password in passwords]
+    with ThreadPoolExecutor(max_workers=min(workers, len(passwords)), thread_name_prefix="agent-provisioning") as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def _check_rows(rows: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Outcome per row (filled in for invalid and repeated rows) and the rows that may be created"""
+    results = []
+    candidates = []
+    seen = set()
+    for index, row in enumerate(rows):
+        username = row.get("username") if isinstance(row, dict) else None
+        username = username.strip() if isinstance(username, str) else None
+        result = {"row": index, "username": username}
+        results.append(result)
+        if not username or not isinstance(row.get("password"), str) or not row["password"]:
+            result.update(status=INVALID, error="username and password are required")
+        elif username in seen:
+            result.update(status=DUPLICATE, error="username repeated in this batch")
+        else:
+            seen.add(username)
+            candidates.append({
+                "row": index, "username": username, "password": row["password"],
+                "full_name": row.get("full_name"), "email": row.get("email"), "phone": row.get("phone")
+            })
+    return results, candidates
+
+
+def _drop_existing(results: List[Dict[str, Any]], candidates: List[Dict[str, Any]], existing: set) -> List[Dict[str, Any]]:
+    for candidate in candidates:
+        if candidate["username"] in existing:
+            results[candidate["row"]]["status"] = ALREADY_EXISTS
+    return [candidate for candidate in candidates if candidate["username"] not in existing]
+
+
+def _record_created(results: List[Dict[str, Any]], candidates: List[Dict[str, Any]], agent_ids: List[int]):
+    for candidate, agent_id in zip(candidates, agent_ids):
+        results[candidate["row"]].update(status=CREATED, agent_id=agent_id)
+
+
+def _summary(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    counts = {status: 0 for status in (CREATED, ALREADY_EXISTS, DUPLICATE, INVALID)}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "status": "ok",
+        "total": len(results),
+        "created": counts[CREATED],
+        "already_exists": counts[ALREADY_EXISTS],
+        "duplicate": counts[DUPLICATE],
+        "invalid": counts[INVALID],
+        "results": results
+    }
+
+
+def provision_agents(db: Session, rows: List[Any], workers: int = AGENT_PROVISIONING_WORKERS) -> Dict[str, Any]:
+    """
+    Create the agents of a batch in one transaction and report the outcome of every row
+
+    Hashing happens before the transaction opens, so the write lock is held
+    only for the INSERT. If another request takes one of the usernames in the
+    meantime, the existing usernames are checked again and the INSERT retried once.
+    """
+    results, candidates = _check_rows(rows)
+    candidates = _drop_existing(results, candidates, crud.get_existing_usernames(db, [c["username"] for c in candidates]))
+    for candidate, hashed in zip(candidates, hash_passwords([c["password"] for c in candidates], workers)):
+        candidate["password_hash"] = hashed
+    for attempt in range(2):
+        try:
+            with crud.unit_of_work(db):
+                agent_ids = crud.create_agents(db, candidates)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+            candidates = _drop_existing(results, candidates, crud.get_existing_usernames(db, [c["username"] for c in candidates]))
+    _record_created(results, candidates, agent_ids)
+    return _summary(results)
+
+
+async def provision_agents_async(db: AsyncSession, rows: List[Any], workers: int = AGENT_PROVISIONING_WORKERS) -> Dict[str, Any]:
+    """provision_agents for async routes: the hashing runs off the event loop"""
+    results, candidates = _check_rows(rows)
+    existing = await aio.get_existing_usernames(db, [c["username"] for c in candidates])
+    candidates = _drop_existing(results, candidates, existing)
+    # Do not hold a pooled connection while hashing
+    await db.commit()
+    hashes = await asyncio.to_thread(hash_passwords, [c["password"] for c in candidates], workers)
+    for candidate, hashed in zip(candidates, hashes):
+        candidate["password_hash"] = hashed
+    for attempt in range(2):
+        try:
+            async with aio.unit_of_work(db):
+                agent_ids = await aio.create_agents(db, candidates)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+            existing = await aio.get_existing_usernames(db, [c["username"] for c in candidates])
+            candidates = _drop_existing(results, candidates, existing)
+    _record_created(results, candidates, agent_ids)
+    return _summary(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create agents in bulk from a CSV or JSON file")
+    parser.add_argument("file", help="CSV or JSON file of agents, - for stdin")
+    parser.add_argument("--format", choices=("csv", "json"), help="default: from the file extension, else csv")
+    parser.add_argument("--workers", type=int, default=AGENT_PROVISIONING_WORKERS, help="password hashing threads")
+    args = parser.parse_args()
+
+    text = sys.stdin.read() if args.file == "-" else open(args.file, encoding="utf-8-sig").read()
+    fmt = args.format or ("json" if args.file.lower().endswith(".json") else "csv")
+    rows = parse_agents_json(text) if fmt == "json" else parse_agents_csv(text)
+
+    crud.init_db()
+    db = crud.SessionLocal()
+    try:
+        outcome = provision_agents(db, rows, args.workers)
+    finally:
+        db.close()
+    for result in outcome["results"]:
+        detail = f"id {result['agent_id']}" if "agent_id" in result else result.get("error", "")
+        print(f"{result['row'] + 1:>5}  {result['username'] or '-':<24} {result['status']:<15} {detail}")
+    print(
+        f"{outcome['created']} created, {outcome['already_exists']} already existed, "
+        f"{outcome['duplicate']} duplicate, {outcome['invalid']} invalid of {outcome['total']} rows"
+    )
+    sys.exit(1 if outcome["duplicate"] or outcome["invalid"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,9 @@ import httpx
 import json
 import logging
 from config import ORDER_SERVICE_HOST, ORGANIZATION_ID
+from services.http_transport import HttpTransport
+from services.resilience import ServiceCaller, ServicePolicy
+from services.read_cache import ReadThroughCache, read_caches, cached, invalidate, json_or_none
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
@@ -13,13 +16,17 @@ logger = logging.getLogger(__name__)
 class CustomerServiceClient:
     """Client for communicating with customer service API"""
     
-    def __init__(self, host: str = ORDER_SERVICE_HOST):
+    def __init__(self, host: str = ORDER_SERVICE_HOST, transport: HttpTransport = None, policy: ServicePolicy = None,
+                 caches: Dict[str, ReadThroughCache] = None):
         self.host = host
+        self.caller = ServiceCaller("customer", transport, policy)
+        # Read-through caches by method name; {} disables caching
+        self.caches = read_caches if caches is None else caches
         self.org_id = ORGANIZATION_ID
     
     def get_customer(self, customer_id: str) -> Optional[Dict[str, Any]]:
         """
-        Get customer details from customer service
+        Get customer details from customer service, through the "customer" read cache
         
         Args:
             customer_id: Customer ID
@@ -30,14 +37,10 @@ class CustomerServiceClient:
         try:
             url = f"{self.host}/customer-service/customer/{customer_id}"
             
-            with httpx.Client(timeout=30.0) as client:
-                response = client.get(url)
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.warning(f"Customer {customer_id} not found: {response.status_code}")
-                    return None
+            customer = cached(self.caches, "customer", str(customer_id), lambda: json_or_none(self.caller.request("GET", url, endpoint="/customer-service/customer/{customer_id}")))
+            if customer is None:
+                logger.warning(f"Customer {customer_id} not found")
+            return customer
                     
         except httpx.RequestError as e:
             logger.error(f"Network error fetching customer {customer_id}: {str(e)}")
@@ -69,15 +72,15 @@ class CustomerServiceClient:
                 **customer_data
             }
             
-            with httpx.Client(timeout=30.0) as client:
-                response = client.patch(url, json=payload)
+            response = self.caller.request("PATCH", url, json=payload, idempotent=True, endpoint="/customer-service/customer/{customer_id}")
                 
-                if response.status_code in [200, 201]:
-                    logger.info(f"Successfully updated customer {customer_id}")
-                    return True
-                else:
-                    logger.error(f"Failed to update customer {customer_id}: {response.status_code} - {response.text}")
-                    return False
+            if response.status_code in [200, 201]:
+                logger.info(f"Successfully updated customer {customer_id}")
+                invalidate("customer", [customer_id], self.caches)
+                return True
+            else:
+                logger.error(f"Failed to update customer {customer_id}: {response.status_code} - {response.text}")
+                return False
                     
         except httpx.RequestError as e:
             logger.error(f"Network error updating customer {customer_id}: {str(e)}")
@@ -104,15 +107,14 @@ class CustomerServiceClient:
                 **customer_data
             }
             
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(url, json=payload)
+            response = self.caller.request("POST", url, json=payload)
                 
-                if response.status_code in [200, 201]:
-                    logger.info(f"Successfully created customer")
-                    return response.json()
-                else:
-                    logger.error(f"Failed to create customer: {response.status_code} - {response.text}")
-                    return None
+            if response.status_code in [200, 201]:
+                logger.info(f"Successfully created customer")
+                return response.json()
+            else:
+                logger.error(f"Failed to create customer: {response.status_code} - {response.text}")
+                return None
                     
         except httpx.RequestError as e:
             logger.error(f"Network error creating customer: {str(e)}")
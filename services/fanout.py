@@ -0,0 +1,88 @@
+"""
+Concurrent fan-out of external calls under one deadline
+
+Every call gets the time left until the shared deadline as its timeout, so N
+calls together take at most the deadline instead of N times a per-call timeout.
+A semaphore bounds how many run at once; calls still waiting for a slot when
+the deadline passes are not started at all.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Call outcomes
+OK = "OK"
+FAILED = "FAILED"
+ERROR = "ERROR"
+TIMEOUT = "TIMEOUT"
+NOT_STARTED = "NOT_STARTED"
+
+
+async def fan_out(
+    calls: List[Tuple[str, Callable[[float], Awaitable[bool]]]],
+    deadline_seconds: float,
+    concurrency: int
+) -> Dict[str, Any]:
+    """
+    Run calls concurrently within one overall deadline
+
+    Args:
+        calls: (name, fn) pairs; fn takes the seconds left until the deadline
+            (to use as its own timeout) and returns True on success
+        deadline_seconds: Budget for all calls together
+        concurrency: Most calls in flight at once
+
+    Returns:
+        {"results", "elapsed_ms", "deadline_seconds"} with one result per call, in
+        input order: {"name", "status", "error", "wait_ms", "elapsed_ms"} where status
+        is OK, FAILED (the call returned False), ERROR (it raised), TIMEOUT or
+        NOT_STARTED
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + deadline_seconds
+    limit = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(name: str, fn: Callable[[float], Awaitable[bool]]) -> Dict[str, Any]:
+        queued = loop.time()
+        result = {"name": name, "status": NOT_STARTED, "error": None, "wait_ms": 0.0, "elapsed_ms": 0.0}
+        try:
+            await asyncio.wait_for(limit.acquire(), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            result["wait_ms"] = round((loop.time() - queued) * 1000, 1)
+            result["error"] = "Deadline passed before the call started"
+            return result
+        try:
+            began = loop.time()
+            result["wait_ms"] = round((began - queued) * 1000, 1)
+            remaining = deadline - began
+            try:
+                if remaining <= 0:
+                    result["error"] = "Deadline passed before the call started"
+                    return result
+                ok = await asyncio.wait_for(fn(remaining), remaining)
+                result["status"] = OK if ok else FAILED
+                if not ok:
+                    result["error"] = "Remote service rejected the call"
+            except (asyncio.TimeoutError, TimeoutError) as e:
+                result["status"] = TIMEOUT
+                result["error"] = str(e) or f"No answer within {remaining:.2f}s"
+            except Exception as e:
+                # httpx timeouts derive from Exception, not TimeoutError
+                result["status"] = TIMEOUT if "Timeout" in type(e).__name__ else ERROR
+                result["error"] = f"{type(e).__name__}: {e}"
+            result["elapsed_ms"] = round((loop.time() - began) * 1000, 1)
+            return result
+        finally:
+            limit.release()
+
+    results = await asyncio.gather(*(run(name, fn) for name, fn in calls))
+    elapsed_ms = round((loop.time() - started) * 1000, 1)
+    statuses = [result["status"] for result in results]
+    logger.info(
+        f"Fan-out of {len(calls)} calls took {elapsed_ms} ms (deadline {deadline_seconds}s): "
+        + ", ".join(f"{statuses.count(s)} {s}" for s in (OK, FAILED, ERROR, TIMEOUT, NOT_STARTED) if statuses.count(s))
+    )
+    return {"results": list(results), "elapsed_ms": elapsed_ms, "deadline_seconds": deadline_seconds}
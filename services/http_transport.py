@@ -0,0 +1,88 @@
+"""
+Shared pooled HTTP transport for the service clients
+
+One httpx.Client per process and one httpx.AsyncClient per event loop, with
+keep-alive connection pools, so calls to the order, inventory and customer
+services reuse open connections instead of connecting (and handshaking TLS) on
+every request. Clients are created on first use and closed in the app lifespan.
+"""
+import asyncio
+import threading
+import weakref
+import logging
+from typing import Optional
+import httpx
+from config import (
+    HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP_TIMEOUT_SECONDS, HTTP_CONNECT_TIMEOUT_SECONDS, HTTP2_ENABLED
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpTransport:
+    """Lazily created, shared sync and async httpx clients with tunable pool limits"""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        timeout: float = HTTP_TIMEOUT_SECONDS,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT_SECONDS,
+        http2: bool = HTTP2_ENABLED
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        if http2 and not _http2_available():
+            logger.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._client: Optional[httpx.Client] = None
+        # AsyncClient connections belong to the event loop that opened them
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def client(self) -> httpx.Client:
+        """The process-wide sync client"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(limits=self.limits, timeout=self.timeout, http2=self.http2)
+        return self._client
+
+    def async_client(self) -> httpx.AsyncClient:
+        """The async client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._async_clients[loop] = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+        return client
+
+    def close(self):
+        """Close the sync client; the next call opens a new one"""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self):
+        """Close the async client of the running event loop"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+http_transport = HttpTransport()
@@ -5,6 +5,9 @@ import httpx
 import json
 import logging
 from config import ORDER_SERVICE_HOST, ORGANIZATION_ID
+from services.http_transport import HttpTransport
+from services.resilience import ServiceCaller, ServicePolicy
+from services.read_cache import ReadThroughCache, read_caches, cached, invalidate, json_or_none
 from typing import Dict, Any, Optional, List
 
 logger = logging.getLogger(__name__)
@@ -13,8 +16,12 @@ logger = logging.getLogger(__name__)
 class InventoryServiceClient:
     """Client for communicating with inventory service API"""
     
-    def __init__(self, host: str = ORDER_SERVICE_HOST):
+    def __init__(self, host: str = ORDER_SERVICE_HOST, transport: HttpTransport = None, policy: ServicePolicy = None,
+                 caches: Dict[str, ReadThroughCache] = None):
         self.host = host
+        self.caller = ServiceCaller("inventory", transport, policy)
+        # Read-through caches by method name; {} disables caching
+        self.caches = read_caches if caches is None else caches
         self.org_id = ORGANIZATION_ID
     
     def update_inventory(
@@ -36,23 +43,10 @@ class InventoryServiceClient:
         """
         try:
             url = f"{self.host}/inventory-service/item"
+            payload = self._inventory_payload(product_id, store_id, stock)
             
-            payload = {
-                "organizationId": self.org_id,
-                "productId": product_id,
-                "storeId": store_id,
-                "stock": stock
-            }
-            
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(url, json=payload)
-                
-                if response.status_code in [200, 201]:
-                    logger.info(f"Successfully updated inventory for product {product_id} at store {store_id}")
-                    return True
-                else:
-                    logger.error(f"Failed to update inventory: {response.status_code} - {response.text}")
-                    return False
+            response = self.caller.request("POST", url, json=payload, idempotent=True)
+            return self._inventory_updated(response, product_id, store_id)
                     
         except httpx.RequestError as e:
             logger.error(f"Network error updating inventory: {str(e)}")
@@ -61,9 +55,54 @@ class InventoryServiceClient:
             logger.error(f"Error updating inventory: {str(e)}")
             return False
     
+    async def update_inventory_async(
+        self,
+        product_id: int,
+        store_id: int,
+        stock: float,
+        timeout: float = None
+    ) -> bool:
+        """
+        Async variant of update_inventory
+
+        Network errors and timeouts that outlast the client's retries are raised
+        rather than logged (CircuitOpenError while the host's breaker is open), so
+        a caller fanning out several calls can report each outcome.
+        
+        Args:
+            product_id: Product ID
+            store_id: Store ID
+            stock: New stock quantity
+            timeout: Seconds left for this call, retries included (default: the transport's timeout per try)
+        
+        Returns:
+            True if the inventory service accepted the update, False otherwise
+        """
+        url = f"{self.host}/inventory-service/item"
+        payload = self._inventory_payload(product_id, store_id, stock)
+        response = await self.caller.arequest("POST", url, json=payload, idempotent=True, timeout=timeout)
+        return self._inventory_updated(response, product_id, store_id)
+    
+    def _inventory_payload(self, product_id: int, store_id: int, stock: float) -> Dict[str, Any]:
+        return {
+            "organizationId": self.org_id,
+            "productId": product_id,
+            "storeId": store_id,
+            "stock": stock
+        }
+    
+    def _inventory_updated(self, response: httpx.Response, product_id: int, store_id: int) -> bool:
+        if response.status_code in [200, 201]:
+            logger.info(f"Successfully updated inventory for product {product_id} at store {store_id}")
+            invalidate("inventory", [f"{product_id}:{store_id}"], self.caches)
+            invalidate("inventory_by_product", [product_id], self.caches)
+            return True
+        logger.error(f"Failed to update inventory: {response.status_code} - {response.text}")
+        return False
+    
     def get_inventory(self, product_id: int, store_id: int) -> Optional[Dict[str, Any]]:
         """
-        Get inventory details from inventory service
+        Get inventory details from inventory service, through the "inventory" read cache
         
         Args:
             product_id: Product ID
@@ -75,14 +114,10 @@ class InventoryServiceClient:
         try:
             url = f"{self.host}/inventory-service/item/{product_id}/{store_id}"
             
-            with httpx.Client(timeout=30.0) as client:
-                response = client.get(url)
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.warning(f"Inventory not found for product {product_id} at store {store_id}: {response.status_code}")
-                    return None
+            inventory = cached(self.caches, "inventory", f"{product_id}:{store_id}", lambda: json_or_none(self.caller.request("GET", url, endpoint="/inventory-service/item/{product_id}/{store_id}")))
+            if inventory is None:
+                logger.warning(f"Inventory not found for product {product_id} at store {store_id}")
+            return inventory
                     
         except httpx.RequestError as e:
             logger.error(f"Network error fetching inventory: {str(e)}")
@@ -93,7 +128,7 @@ class InventoryServiceClient:
     
     def get_inventory_by_product(self, product_id: int) -> Optional[List[Dict[str, Any]]]:
         """
-        Get inventory for all stores for a product
+        Get inventory for all stores for a product, through the "inventory_by_product" read cache
         
         Args:
             product_id: Product ID
@@ -104,14 +139,10 @@ class InventoryServiceClient:
         try:
             url = f"{self.host}/inventory-service/product/{product_id}"
             
-            with httpx.Client(timeout=30.0) as client:
-                response = client.get(url)
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.warning(f"Inventory not found for product {product_id}: {response.status_code}")
-                    return None
+            inventory = cached(self.caches, "inventory_by_product", str(product_id), lambda: json_or_none(self.caller.request("GET", url, endpoint="/inventory-service/product/{product_id}")))
+            if inventory is None:
+                logger.warning(f"Inventory not found for product {product_id}")
+            return inventory
                     
         except httpx.RequestError as e:
             logger.error(f"Network error fetching inventory: {str(e)}")
@@ -0,0 +1,256 @@
+"""
+Write-behind batching of stock updates pushed to the inventory service
+
+Only the latest stock level of a (product, store) pair matters, so updates are
+collected for a short window, collapsed to the newest value per pair and then
+flushed as one concurrent batch of calls (services.fanout) under one deadline.
+Every submitter gets a future that resolves with the outcome of the call that
+carried its value or a newer one.
+
+When INVENTORY_PUSH_MAX_PENDING pairs are waiting, submitters block (or their
+push() waits) until a flush makes room. stop() flushes what is left.
+"""
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+from config import (
+    INVENTORY_PUSH_WINDOW_SECONDS, INVENTORY_PUSH_MAX_BATCH, INVENTORY_PUSH_MAX_PENDING,
+    INVENTORY_PUSH_CONCURRENCY, INVENTORY_PUSH_DEADLINE_SECONDS
+)
+from services.fanout import fan_out, OK, FAILED, TIMEOUT
+from services.http_transport import http_transport
+from services.inventory_client import InventoryServiceClient
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryPushFull(Exception):
+    """No room for another (product, store) pair before the timeout"""
+
+
+class InventoryPushError(Exception):
+    """The call carrying an update failed or was not made"""
+
+
+class InventoryPushBatcher:
+    """Thread coalescing stock updates per (product, store) and flushing them in concurrent batches"""
+
+    def __init__(
+        self,
+        client: InventoryServiceClient = None,
+        window: float = INVENTORY_PUSH_WINDOW_SECONDS,
+        max_batch: int = INVENTORY_PUSH_MAX_BATCH,
+        max_pending: int = INVENTORY_PUSH_MAX_PENDING,
+        concurrency: int = INVENTORY_PUSH_CONCURRENCY,
+        deadline_seconds: float = INVENTORY_PUSH_DEADLINE_SECONDS
+    ):
+        self.client = client or InventoryServiceClient()
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max(max_pending, max_batch, 1)
+        self.concurrency = concurrency
+        self.deadline_seconds = deadline_seconds
+        # (product_id, store_id) -> [latest stock, futures of every update it replaced]
+        self._pending: Dict[Tuple[int, int], list] = {}
+        self._first_pending_at = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._loop = None
+        self._stopping = False
+        self.submitted = 0
+        self.flushed = 0
+        self.pushed = 0
+        self.failed = 0
+        self.flushes = 0
+        self.blocked = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Start the flushing thread"""
+        if self._thread:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="inventory-push", daemon=True)
+        self._thread.start()
+        logger.info("Started inventory push batcher")
+
+    def stop(self, timeout: float = 10.0):
+        """Flush the pending updates and stop the thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, product_id: int, store_id: int, stock: float, timeout: float = None) -> Future:
+        """
+        Queue a stock update, replacing any queued value of the same pair
+
+        Blocks while max_pending pairs are queued, for at most `timeout` seconds
+        (forever when None).
+
+        Returns:
+            Future resolving to True once the service accepted this value or a newer one
+
+        Raises:
+            InventoryPushFull: when no room was made within the timeout
+            RuntimeError: when the batcher is not running
+        """
+        future = Future()
+        key = (product_id, store_id)
+        with self._cond:
+            if self._thread is None or self._stopping:
+                raise RuntimeError("Inventory push batcher is not running")
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                self.blocked += 1
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: len(self._pending) < self.max_pending or self._stopping, timeout):
+                    raise InventoryPushFull(f"{len(self._pending)} inventory updates already waiting to be pushed")
+            entry = self._pending.get(key)
+            if entry is None:
+                if not self._pending:
+                    self._first_pending_at = time.monotonic()
+                self._pending[key] = [stock, [future]]
+                if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                    self._cond.notify_all()
+            else:
+                entry[0] = stock
+                entry[1].append(future)
+            self.submitted += 1
+        return future
+
+    async def push(self, product_id: int, store_id: int, stock: float, timeout: float = None) -> bool:
+        """
+        Async submit: wait (without blocking the event loop) for room and for the outcome
+
+        Returns:
+            True once the service accepted this value or a newer one, False if it refused it
+
+        Raises:
+            asyncio.TimeoutError: when no outcome arrived within the timeout
+            InventoryPushError: when the call failed
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        while True:
+            try:
+                future = self.submit(product_id, store_id, stock, timeout=0)
+                break
+            except InventoryPushFull:
+                if deadline and loop.time() + self.window >= deadline:
+                    raise asyncio.TimeoutError("No room in the inventory push queue") from None
+                await asyncio.sleep(self.window)
+        waiter = asyncio.wrap_future(future)
+        # Marks the outcome as retrieved even if this caller stops waiting
+        waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+        # Not wait_for: the value stays queued when the caller stops waiting
+        done, _ = await asyncio.wait({waiter}, timeout=max(deadline - loop.time(), 0) if deadline else None)
+        if not done:
+            raise asyncio.TimeoutError(f"Inventory update not pushed within {timeout:.2f}s")
+        return waiter.result()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                try:
+                    self._loop.run_until_complete(self._flush(batch))
+                except Exception as e:
+                    logger.error(f"Inventory push batcher error: {str(e)}")
+                    for _, futures in batch.values():
+                        for future in futures:
+                            if not future.done():
+                                future.set_exception(e)
+        finally:
+            self._loop.run_until_complete(http_transport.aclose())
+            self._loop.close()
+            self._loop = None
+
+    def _next_batch(self) -> Optional[Dict[Tuple[int, int], list]]:
+        """Wait for the window of the oldest pending update to pass, then take everything pending"""
+        with self._cond:
+            while True:
+                if self._pending:
+                    wait = self._first_pending_at + self.window - time.monotonic()
+                    if wait <= 0 or len(self._pending) >= self.max_batch or self._stopping:
+                        batch, self._pending = self._pending, {}
+                        self._cond.notify_all()
+                        return batch
+                    self._cond.wait(wait)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+
+    async def _flush(self, batch: Dict[Tuple[int, int], list]):
+        items: List[Tuple[Tuple[int, int], list]] = list(batch.items())
+        calls = [
+            (f"inventory:{product_id}:{store_id}", self._push_call(product_id, store_id, entry[0]))
+            for (product_id, store_id), entry in items
+        ]
+        started = time.perf_counter()
+        outcome = await fan_out(calls, self.deadline_seconds, self.concurrency)
+        flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        failed = 0
+        for (_, entry), result in zip(items, outcome["results"]):
+            ok = result["status"] == OK
+            failed += not ok
+            for future in entry[1]:
+                if ok:
+                    future.set_result(True)
+                elif result["status"] == FAILED:
+                    future.set_result(False)
+                elif result["status"] == TIMEOUT:
+                    future.set_exception(asyncio.TimeoutError(result["error"]))
+                else:
+                    future.set_exception(InventoryPushError(result["error"]))
+        with self._cond:
+            self.flushes += 1
+            self.flushed += sum(len(entry[1]) for _, entry in items)
+            self.pushed += len(items)
+            self.failed += failed
+            self.last_batch_size = len(items)
+            self.last_flush_ms = flush_ms
+            self.max_flush_ms = max(self.max_flush_ms, flush_ms)
+            self._flush_ms_total += flush_ms
+
+    def _push_call(self, product_id: int, store_id: int, stock: float):
+        async def call(timeout: float) -> bool:
+            return await self.client.update_inventory_async(product_id, store_id, stock, timeout=timeout)
+        return call
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, coalescing ratio (updates per call sent) and flush latency"""
+        with self._cond:
+            return {
+                "running": self.running,
+                "pending": len(self._pending),
+                "submitted_total": self.submitted,
+                "pushed_total": self.pushed,
+                "coalesced_total": self.flushed - self.pushed,
+                "coalescing_ratio": round(self.flushed / self.pushed, 2) if self.pushed else None,
+                "failed_total": self.failed,
+                "blocked_total": self.blocked,
+                "flushes_total": self.flushes,
+                "last_batch_size": self.last_batch_size,
+                "last_flush_ms": self.last_flush_ms,
+                "avg_flush_ms": round(self._flush_ms_total / self.flushes, 1) if self.flushes else 0.0,
+                "max_flush_ms": self.max_flush_ms
+            }
+
+
+inventory_push = InventoryPushBatcher()
@@ -5,6 +5,9 @@ import httpx
 import json
 import logging
 from config import ORDER_SERVICE_HOST, ORGANIZATION_ID, ORDER_SERVICE_USER_ID
+from services.http_transport import HttpTransport
+from services.resilience import ServiceCaller, ServicePolicy
+from services.read_cache import ReadThroughCache, read_caches, cached, invalidate, json_or_none
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
@@ -13,8 +16,12 @@ logger = logging.getLogger(__name__)
 class OrderServiceClient:
     """Client for communicating with order service API"""
     
-    def __init__(self, host: str = ORDER_SERVICE_HOST):
+    def __init__(self, host: str = ORDER_SERVICE_HOST, transport: HttpTransport = None, policy: ServicePolicy = None,
+                 caches: Dict[str, ReadThroughCache] = None):
         self.host = host
+        self.caller = ServiceCaller("order", transport, policy)
+        # Read-through caches by method name; {} disables caching
+        self.caches = read_caches if caches is None else caches
         self.org_id = ORGANIZATION_ID
         self.user_id = ORDER_SERVICE_USER_ID
     
@@ -39,29 +46,10 @@ class OrderServiceClient:
         """
         try:
             url = f"{self.host}/order-service/order/{reference_number}"
+            payload = self._order_status_payload(status, crates, package_metadata)
             
-            # Build details JSON
-            details = {
-                "crates": crates or []
-            }
-            
-            payload = {
-                "organizationId": self.org_id,
-                "user": json.dumps({"id": int(self.user_id)}),
-                "status": status,
-                "details": json.dumps(details),
-                "packageMetaData": package_metadata or {}
-            }
-            
-            with httpx.Client(timeout=30.0) as client:
-                response = client.patch(url, json=payload)
-                
-                if response.status_code in [200, 201]:
-                    logger.info(f"Successfully updated order {reference_number} to {status}")
-                    return True
-                else:
-                    logger.error(f"Failed to update order {reference_number}: {response.status_code} - {response.text}")
-                    return False
+            response = self.caller.request("PATCH", url, json=payload, idempotent=True, endpoint="/order-service/order/{reference_number}")
+            return self._order_status_updated(response, reference_number, status)
                     
         except httpx.RequestError as e:
             logger.error(f"Network error updating order {reference_number}: {str(e)}")
@@ -70,9 +58,59 @@ class OrderServiceClient:
             logger.error(f"Error updating order {reference_number}: {str(e)}")
             return False
     
+    async def update_order_status_async(
+        self,
+        reference_number: str,
+        status: str,
+        crates: list = None,
+        package_metadata: Dict[str, Any] = None,
+        timeout: float = None
+    ) -> bool:
+        """
+        Async variant of update_order_status
+
+        Network errors and timeouts that outlast the client's retries are raised
+        rather than logged (CircuitOpenError while the host's breaker is open), so
+        a caller fanning out several calls can report each outcome.
+        
+        Args:
+            reference_number: Order reference number
+            status: New status (e.g., "PACKED")
+            crates: List of crate labels
+            package_metadata: Package metadata with weight and items
+            timeout: Seconds left for this call, retries included (default: the transport's timeout per try)
+        
+        Returns:
+            True if the order service accepted the update, False otherwise
+        """
+        url = f"{self.host}/order-service/order/{reference_number}"
+        payload = self._order_status_payload(status, crates, package_metadata)
+        response = await self.caller.arequest("PATCH", url, json=payload, idempotent=True, timeout=timeout, endpoint="/order-service/order/{reference_number}")
+        return self._order_status_updated(response, reference_number, status)
+    
+    def _order_status_payload(self, status: str, crates: list = None, package_metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        details = {
+            "crates": crates or []
+        }
+        return {
+            "organizationId": self.org_id,
+            "user": json.dumps({"id": int(self.user_id)}),
+            "status": status,
+            "details": json.dumps(details),
+            "packageMetaData": package_metadata or {}
+        }
+    
+    def _order_status_updated(self, response: httpx.Response, reference_number: str, status: str) -> bool:
+        if response.status_code in [200, 201]:
+            logger.info(f"Successfully updated order {reference_number} to {status}")
+            invalidate("order", [reference_number], self.caches)
+            return True
+        logger.error(f"Failed to update order {reference_number}: {response.status_code} - {response.text}")
+        return False
+    
     def get_order(self, reference_number: str) -> Optional[Dict[str, Any]]:
         """
-        Get order details from order service
+        Get order details from order service, through the "order" read cache
         
         Args:
             reference_number: Order reference number
@@ -83,14 +121,10 @@ class OrderServiceClient:
         try:
             url = f"{self.host}/order-service/order/{reference_number}"
             
-            with httpx.Client(timeout=30.0) as client:
-                response = client.get(url)
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.warning(f"Order {reference_number} not found: {response.status_code}")
-                    return None
+            order = cached(self.caches, "order", reference_number, lambda: json_or_none(self.caller.request("GET", url, endpoint="/order-service/order/{reference_number}")))
+            if order is None:
+                logger.warning(f"Order {reference_number} not found")
+            return order
                     
         except httpx.RequestError as e:
             logger.error(f"Network error fetching order {reference_number}: {str(e)}")
@@ -0,0 +1,276 @@
+"""
+Bulk order ingestion engine for the order webhook
+
+Turns a batch of webhook orders into Order, OrderItem, Product and Inventory rows
+with a fixed number of queries: every referenced product, order id and reference
+number is preloaded with one IN query each, the missing rows are inserted with
+one multi-row INSERT per table and the whole batch is committed once. If the
+batch insert fails, orders are retried one by one so each order stays
+all-or-nothing.
+"""
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+import models as crud
+from models import Order, OrderItem, Product, Inventory
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== Payload Mapping ====================
+
+def order_payload_from_webhook(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a webhook order dict to Order column values"""
+    try:
+        amount = float(order_data.get("amount") or 0)
+    except Exception:
+        amount = 0.0
+    try:
+        discount = float(order_data.get("discount") or 0)
+    except Exception:
+        discount = 0.0
+    try:
+        shipping = float(order_data.get("shipping") or 0)
+    except Exception:
+        shipping = 0.0
+
+    return {
+        "order_id": order_data.get("id"),
+        "reference_number": order_data.get("referenceNumber"),
+        "customer_id": order_data.get("customerId") or order_data.get("customer", {}).get("id"),
+        "customer_name": order_data.get("customer", {}).get("name", ""),
+        "amount": amount,
+        "discount": discount,
+        "shipping": shipping,
+        "status": order_data.get("status", "PENDING"),
+        "order_type": order_data.get("type", {}).get("name") if isinstance(order_data.get("type"), dict) else order_data.get("type"),
+        "pickup_location_id": (order_data.get("pickupLocation", {}).get("id") if isinstance(order_data.get("pickupLocation"), dict) else order_data.get("pickupLocationId")),
+        "preferred_date": order_data.get("preferredDate"),
+        "slot_type": order_data.get("slotType"),
+        "slot_start_time": order_data.get("slotStartTime"),
+        "slot_end_time": order_data.get("slotEndTime"),
+        "raw_payload": order_data
+    }
+
+
+def product_payload_from_item(item_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a webhook order item dict to Product column values"""
+    return {
+        "product_id": item_data.get("id"),
+        "client_item_id": item_data.get("clientItemId") or item_data.get("client_item_id"),
+        "name": item_data.get("name"),
+        "slug": item_data.get("slug"),
+        "images": item_data.get("images") or item_data.get("imagesExtra"),
+        "status": item_data.get("status", "ENABLED"),
+        "average_rating": float(item_data.get("averageRating") or 0),
+        "total_reviews": int(item_data.get("totalReviews") or 0),
+        "sold_by_weight": bool(item_data.get("soldByWeight") or False)
+    }
+
+
+def inventory_payload_from_store_data(product_id: int, store_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a storeSpecificData entry to Inventory column values (product_id is the external id)"""
+    location = store_data.get("location")
+    return {
+        "product_id": product_id,
+        "store_id": store_data.get("storeId") or store_data.get("store_id") or 0,
+        "stock": float(store_data.get("stock", 0) or 0),
+        "tax": store_data.get("tax"),
+        "mrp": float(store_data.get("mrp", 0) or 0),
+        "discount": float(store_data.get("discount", 0) or 0),
+        "aisle": (location or {}).get("aisle") if isinstance(location, dict) else store_data.get("aisle"),
+        "rack": (location or {}).get("rack") if isinstance(location, dict) else store_data.get("rack"),
+        "shelf": (location or {}).get("position") if isinstance(location, dict) else store_data.get("shelf"),
+        "unit": store_data.get("unit", 1),
+        "status": store_data.get("status", "ENABLED"),
+        "location_data": location
+    }
+
+
+# ==================== Ingestion ====================
+
+def ingest_orders(db: Session, orders: List[Dict[str, Any]], retry_conflicts: bool = True) -> List[Dict[str, Any]]:
+    """
+    Ingest a batch of webhook orders with a single commit
+
+    Args:
+        db: Database session
+        orders: List of webhook order dicts
+        retry_conflicts: Replan once if a concurrent writer caused a unique conflict
+
+    Returns:
+        One result dict per input order, in input order
+    """
+    if not orders:
+        return []
+    try:
+        with crud.atomic(db):
+            results = _ingest_batch(db, orders)
+            crud.commit(db)
+        return results
+    except Exception as e:
+        if isinstance(e, IntegrityError) and retry_conflicts:
+            # A concurrent writer inserted one of our products/orders after the preload;
+            # re-planning sees the new rows and resolves the conflict.
+            logger.warning(f"Conflict ingesting {len(orders)} orders, replanning: {str(e.orig)}")
+            return ingest_orders(db, orders, retry_conflicts=False)
+        if len(orders) == 1:
+            logger.error(f"Error processing order: {str(e)}")
+            order_data = orders[0]
+            order_id = order_data.get("id") if isinstance(order_data, dict) else None
+            return [{"order_id": order_id, "status": "FAILED", "error": str(e)}]
+        logger.warning(f"Batch ingestion of {len(orders)} orders failed, retrying per order: {str(e)}")
+        results = []
+        for order_data in orders:
+            results.extend(ingest_orders(db, [order_data]))
+        return results
+
+
+def _ingest_batch(db: Session, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Plan and insert every order of the batch; the caller commits or rolls back"""
+    valid_orders = [o for o in orders if isinstance(o, dict)]
+    order_ids = {o.get("id") for o in valid_orders if o.get("id") is not None}
+    references = {o.get("referenceNumber") for o in valid_orders if o.get("referenceNumber") is not None}
+    item_product_ids = {
+        item.get("id")
+        for o in valid_orders
+        for item in (o.get("items") or [])
+        if isinstance(item, dict) and item.get("id") is not None
+    }
+
+    # Preload everything the batch references: one IN query per lookup
+    existing_order_ids = crud.get_existing_order_ids(db, order_ids)
+    existing_references = crud.get_existing_order_references(db, references)
+    product_pks = {pid: p.id for pid, p in crud.get_products_by_external_ids(db, item_product_ids).items()}
+    taken_slugs = crud.get_existing_product_slugs(db, {
+        item.get("slug")
+        for o in valid_orders
+        for item in (o.get("items") or [])
+        if isinstance(item, dict) and item.get("slug") and item.get("id") not in product_pks
+    })
+
+    plan = {"products": [], "inventories": [], "orders": [], "items": []}
+    results = []
+    for order_data in orders:
+        try:
+            result = _plan_order(order_data, product_pks, taken_slugs, existing_order_ids, existing_references, plan)
+        except Exception as e:
+            logger.error(f"Error processing order: {str(e)}")
+            order_id = order_data.get("id") if isinstance(order_data, dict) else None
+            result = {"order_id": order_id, "status": "FAILED", "error": str(e)}
+        results.append(result)
+
+    # Parents are inserted with RETURNING so children can be keyed to their new ids
+    if plan["products"]:
+        rows = db.execute(insert(Product).returning(Product.id, Product.product_id), plan["products"])
+        product_pks.update({product_id: pk for pk, product_id in rows})
+    order_pks = {}
+    if plan["orders"]:
+        rows = db.execute(insert(Order).returning(Order.id, Order.order_id), plan["orders"])
+        order_pks = {order_id: pk for pk, order_id in rows}
+
+    if plan["inventories"]:
+        for inv in plan["inventories"]:
+            inv["product_id"] = product_pks[inv["product_id"]]
+        db.execute(insert(Inventory), plan["inventories"])
+    if plan["items"]:
+        for item in plan["items"]:
+            item["order_id"] = order_pks[item["order_id"]]
+            item["product_id"] = product_pks[item["product_item_id"]]
+        db.execute(insert(OrderItem), plan["items"])
+    return results
+
+
+def _plan_order(
+    order_data: Dict[str, Any],
+    product_pks: Dict[int, Optional[int]],
+    taken_slugs: set,
+    existing_order_ids: set,
+    existing_references: set,
+    plan: Dict[str, list]
+) -> Dict[str, Any]:
+    """Build the rows for one order in memory; rows reference parents by external id until insert"""
+    order_id = order_data.get("id")
+    reference_number = order_data.get("referenceNumber")
+
+    if order_id in existing_order_ids:
+        return {"order_id": order_id, "reference_number": reference_number, "status": "ALREADY_EXISTS"}
+    if reference_number is not None and reference_number in existing_references:
+        raise ValueError(f"Reference number {reference_number} already in use")
+
+    order_payload = order_payload_from_webhook(order_data)
+
+    # Rows are only added to the plan once the whole order is known to be valid
+    order_plan = {"products": [], "inventories": [], "items": []}
+    for item_data in order_data.get("items", []):
+        try:
+            ordered_qty = float(item_data.get("orderDetails", {}).get("orderedQuantity", 0) or 0)
+            mrp = float(item_data.get("orderDetails", {}).get("mrp", 0) or 0)
+            discount_item = float(item_data.get("orderDetails", {}).get("discount", 0) or 0)
+
+            product_id = item_data.get("id")
+            if product_id not in product_pks and not any(p["product_id"] == product_id for p in order_plan["products"]):
+                if not _plan_product(item_data, taken_slugs, order_plan):
+                    continue
+
+            order_plan["items"].append({
+                "order_id": order_id,
+                "product_id": None,
+                "product_item_id": product_id,
+                "ordered_quantity": ordered_qty,
+                "mrp": mrp,
+                "discount": discount_item
+            })
+        except Exception as e:
+            logger.error(f"Error processing item {item_data.get('id')}: {str(e)}")
+
+    if not order_plan["items"]:
+        raise ValueError("Order has no valid items")
+
+    for product in order_plan["products"]:
+        product_pks[product["product_id"]] = None
+    plan["products"].extend(order_plan["products"])
+    plan["inventories"].extend(order_plan["inventories"])
+    plan["items"].extend(order_plan["items"])
+    plan["orders"].append(order_payload)
+    existing_order_ids.add(order_id)
+    if reference_number is not None:
+        existing_references.add(reference_number)
+
+    return {
+        "order_id": order_id,
+        "reference_number": reference_number,
+        "status": "SUCCESS",
+        "items_count": len(order_plan["items"])
+    }
+
+
+def _plan_product(item_data: Dict[str, Any], taken_slugs: set, order_plan: Dict[str, list]) -> bool:
+    """Plan a new product (and its store inventories) from an order item; False if it cannot be created"""
+    product_id = item_data.get("id")
+    try:
+        product_payload = product_payload_from_item(item_data)
+        slug = product_payload.get("slug")
+        if slug and slug in taken_slugs:
+            raise ValueError(f"Slug {slug} already in use")
+    except Exception as e:
+        logger.error(f"Error creating product {product_id}: {str(e)}")
+        return False
+
+    if slug:
+        taken_slugs.add(slug)
+    order_plan["products"].append(product_payload)
+
+    # Create inventory entries from store-specific data (if provided); one row per store
+    inventories = {}
+    for store_data in item_data.get("storeSpecificData", []) or []:
+        try:
+            inventory = inventory_payload_from_store_data(product_id, store_data)
+            inventories[inventory["store_id"]] = inventory
+        except Exception as e:
+            logger.warning(f"Error creating inventory for product {product_id}: {str(e)}")
+    order_plan["inventories"].extend(inventories.values())
+
+    return True
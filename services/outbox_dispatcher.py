@@ -0,0 +1,331 @@
+"""
+Background dispatcher delivering outbox messages to external services
+
+Requests only write outbox rows in their own transaction; this thread claims due
+messages in batches and sends each batch concurrently through the sender
+registered for each topic, under one deadline (services.fanout), over the
+pooled connections of services.http_transport. A failed delivery is retried
+with exponential backoff and jitter, and after OUTBOX_MAX_ATTEMPTS the message
+is dead-lettered (status DEAD) so it can be inspected and re-driven.
+deliver_now lets a request send its own messages before answering; whatever
+it cannot deliver is left to the dispatcher.
+
+Inventory updates carry the latest stock level, so a newer one supersedes the
+undelivered older ones of the same (product, store), and they are sent through
+the coalescing services.inventory_push batcher when it runs.
+"""
+import asyncio
+import random
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from config import (
+    OUTBOX_POLL_INTERVAL, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_BACKOFF_BASE_SECONDS, OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_RETENTION_HOURS,
+    OUTBOX_DELIVERY_CONCURRENCY, OUTBOX_DELIVERY_DEADLINE_SECONDS, OUTBOX_VISIBILITY_TIMEOUT_SECONDS
+)
+import models as crud
+from models import SessionLocal
+from services.fanout import fan_out, OK, NOT_STARTED
+from services.http_transport import http_transport
+from services.order_client import OrderServiceClient
+from services.inventory_client import InventoryServiceClient
+from services.inventory_push import inventory_push
+
+logger = logging.getLogger(__name__)
+
+ORDER_STATUS = "ORDER_STATUS"
+INVENTORY = "INVENTORY"
+
+
+class OutboxDispatcher:
+    """Thread delivering outbox messages with concurrent batches, backoff retries and dead-lettering"""
+
+    def __init__(
+        self,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        backoff_base: float = OUTBOX_BACKOFF_BASE_SECONDS,
+        backoff_max: float = OUTBOX_BACKOFF_MAX_SECONDS,
+        concurrency: int = OUTBOX_DELIVERY_CONCURRENCY,
+        deadline_seconds: float = OUTBOX_DELIVERY_DEADLINE_SECONDS,
+        visibility_timeout: float = OUTBOX_VISIBILITY_TIMEOUT_SECONDS
+    ):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.concurrency = concurrency
+        self.deadline_seconds = deadline_seconds
+        self.visibility_timeout = visibility_timeout
+        self.senders: Dict[str, Callable[[Dict[str, Any], float], Awaitable[bool]]] = {}
+        self.coalescing_topics = set()
+        self._thread = None
+        self._loop = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._last_requeue = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.last_lag_seconds = 0.0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+
+    def register(self, topic: str, sender: Callable[[Dict[str, Any], float], Awaitable[bool]], coalesce: bool = False):
+        """
+        Register the coroutine delivering message payloads of the given topic
+
+        It is called with the payload and the seconds left until the delivery
+        deadline, and returns True on success. With coalesce, a payload is the
+        latest state of its key, and publishing a message supersedes the
+        undelivered older ones of the same key.
+        """
+        self.senders[topic] = sender
+        if coalesce:
+            self.coalescing_topics.add(topic)
+
+    def publish(self, db: Session, messages: List[Dict[str, Any]], hold_seconds: float = 0) -> List[int]:
+        """
+        Record messages ({"topic", "key", "payload"}) in the caller's transaction
+
+        The dispatcher is woken up once the transaction commits; messages of a
+        rolled-back transaction are never sent. Messages the caller will send
+        itself with deliver_now are held back from the dispatcher for hold_seconds.
+
+        Returns:
+            The message IDs, e.g. for deliver_now
+        """
+        for message in messages:
+            if message["topic"] not in self.senders:
+                raise ValueError(f"No sender registered for outbox topic {message['topic']}")
+        for topic in self.coalescing_topics:
+            crud.supersede_outbox_messages(db, topic, [m["key"] for m in messages if m["topic"] == topic])
+        if hold_seconds:
+            return crud.add_outbox_messages(db, messages, datetime.utcnow() + timedelta(seconds=hold_seconds))
+        message_ids = crud.add_outbox_messages(db, messages)
+        if crud.in_unit_of_work(db):
+            event.listen(db, "after_commit", lambda session: self._wakeup.set(), once=True)
+        else:
+            self._wakeup.set()
+        return message_ids
+
+    def wakeup(self):
+        """Make the dispatcher poll now, e.g. after dead letters were requeued"""
+        self._wakeup.set()
+
+    def start(self):
+        """Requeue messages abandoned by a previous run and start the dispatcher thread"""
+        if self._thread:
+            return
+        self._requeue_stale()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info("Started outbox dispatcher")
+
+    def stop(self, timeout: float = 10.0):
+        """Signal the dispatcher to stop after its current batch and wait for it"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds before the next attempt: doubles per attempt up to backoff_max, jittered between half and all of it"""
+        delay = min(self.backoff_base * (2 ** max(attempts - 1, 0)), self.backoff_max)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    # Also while busy: a dead peer's messages hold back their keys, not the whole outbox
+                    self._requeue_if_due()
+                    if not self.dispatch_batch():
+                        self._purge_if_due()
+                        self._wakeup.wait(self.poll_interval)
+                        self._wakeup.clear()
+                except Exception as e:
+                    logger.error(f"Outbox dispatcher error: {str(e)}")
+                    self._stop.wait(self.poll_interval)
+        finally:
+            self._close_loop()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        # One loop for the thread's lifetime, so the pooled connections of its
+        # AsyncClient are reused from batch to batch
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+
+    def _close_loop(self):
+        loop, self._loop = self._loop, None
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.run_until_complete(http_transport.aclose())
+        finally:
+            loop.close()
+
+    def dispatch_batch(self) -> int:
+        """Claim and deliver one batch of due messages; returns the number claimed"""
+        db = SessionLocal()
+        try:
+            messages = crud.claim_outbox_batch(db, self.batch_size)
+            if not messages:
+                return 0
+            # Detached, so the commits recording the outcomes do not expire and reload them
+            db.expunge_all()
+            outcome = self._event_loop().run_until_complete(self.deliver(messages))
+            self._record(db, messages, outcome)
+            return len(messages)
+        finally:
+            db.close()
+
+    async def deliver_now(self, db: AsyncSession, message_ids: List[int], deadline_seconds: float = None) -> Dict[str, Any]:
+        """
+        Deliver the given messages from the calling request, within a deadline
+
+        Messages whose key still has an older undelivered message are left to the
+        dispatcher, as are the ones that fail; their retry is scheduled as usual.
+
+        Returns:
+            The fan-out outcome: {"results", "elapsed_ms", "deadline_seconds"}
+        """
+        messages = await db.run_sync(crud.claim_outbox_batch, len(message_ids), message_ids)
+        if not messages:
+            return {"results": [], "elapsed_ms": 0.0, "deadline_seconds": deadline_seconds or self.deadline_seconds}
+        db.expunge_all()
+        outcome = await self.deliver(messages, deadline_seconds)
+        await db.run_sync(self._record, messages, outcome)
+        return outcome
+
+    async def deliver(self, messages: list, deadline_seconds: float = None) -> Dict[str, Any]:
+        """Send messages concurrently, at most `concurrency` at a time, all within one deadline"""
+        calls = [(f"{message.topic} {message.message_key}", self._sender_call(message)) for message in messages]
+        return await fan_out(calls, deadline_seconds or self.deadline_seconds, self.concurrency)
+
+    def _sender_call(self, message) -> Callable[[float], Awaitable[bool]]:
+        sender = self.senders.get(message.topic)
+
+        async def call(timeout: float) -> bool:
+            if sender is None:
+                raise ValueError(f"No sender registered for outbox topic {message.topic}")
+            return await sender(message.payload, timeout)
+        return call
+
+    def _record(self, db: Session, messages: list, outcome: Dict[str, Any]):
+        """Store the delivery outcome of claimed messages: sent, retry later, dead-lettered or released"""
+        now = datetime.utcnow()
+        sent = []
+        not_started = []
+        for message, result in zip(messages, outcome["results"]):
+            error = result["error"]
+            if result["status"] == OK:
+                sent.append(message.id)
+            elif result["status"] == NOT_STARTED:
+                not_started.append(message.id)
+            elif message.attempts >= self.max_attempts:
+                logger.error(f"Outbox message {message.id} ({message.topic} {message.message_key}) dead-lettered after {message.attempts} attempts: {error}")
+                crud.dead_letter_outbox_message(db, message.id, error)
+                with self._lock:
+                    self.dead_lettered += 1
+            else:
+                delay = self.backoff(message.attempts)
+                logger.warning(f"Outbox message {message.id} ({message.topic} {message.message_key}) failed, retrying in {delay:.1f}s: {error}")
+                crud.retry_outbox_message(db, message.id, error, now + timedelta(seconds=delay))
+                with self._lock:
+                    self.retried += 1
+        crud.mark_outbox_sent(db, sent)
+        crud.release_outbox_messages(db, not_started)
+        with self._lock:
+            self.sent += len(sent)
+            self.last_batch_size = len(messages)
+            self.last_batch_ms = outcome["elapsed_ms"]
+            self.last_lag_seconds = max((now - m.created_at).total_seconds() for m in messages)
+
+    def _requeue_stale(self):
+        """Requeue messages SENDING for longer than the visibility timeout, e.g. after a dispatcher died"""
+        self._last_requeue = time.monotonic()
+        db = SessionLocal()
+        try:
+            stale = crud.requeue_stale_outbox_messages(db, datetime.utcnow() - timedelta(seconds=self.visibility_timeout))
+            if stale:
+                logger.warning(f"Requeued {stale} outbox messages left SENDING for over {self.visibility_timeout:g}s")
+        finally:
+            db.close()
+
+    def _requeue_if_due(self):
+        if time.monotonic() - self._last_requeue < min(self.visibility_timeout, 60):
+            return
+        self._requeue_stale()
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        db = SessionLocal()
+        try:
+            purged = crud.purge_sent_outbox_messages(db, datetime.utcnow() - timedelta(hours=OUTBOX_RETENTION_HOURS))
+            if purged:
+                logger.info(f"Purged {purged} sent outbox messages")
+        finally:
+            db.close()
+
+    def metrics(self, db: Session) -> Dict[str, Any]:
+        """Outbox depth, lag and dispatcher counters"""
+        stats = crud.get_outbox_stats(db)
+        counts = stats["counts"]
+        oldest = stats["oldest_pending_at"]
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "pending": counts.get("PENDING", 0),
+                "sending": counts.get("SENDING", 0),
+                "sent": counts.get("SENT", 0),
+                "superseded": counts.get("SUPERSEDED", 0),
+                "dead": counts.get("DEAD", 0),
+                "oldest_pending_age_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+                "last_lag_seconds": self.last_lag_seconds,
+                "last_batch_size": self.last_batch_size,
+                "last_batch_ms": self.last_batch_ms,
+                "sent_total": self.sent,
+                "retried_total": self.retried,
+                "dead_lettered_total": self.dead_lettered
+            }
+
+
+async def _send_order_status(payload: Dict[str, Any], timeout: float) -> bool:
+    return await order_client.update_order_status_async(
+        payload["reference_number"], payload["status"], payload.get("crates"), payload.get("package_metadata"),
+        timeout=timeout
+    )
+
+
+async def _send_inventory(payload: Dict[str, Any], timeout: float) -> bool:
+    if inventory_push.running:
+        # Coalesced with the updates other batches and requests send at the same time
+        return await inventory_push.push(payload["product_id"], payload["store_id"], payload["stock"], timeout=timeout)
+    return await inventory_client.update_inventory_async(
+        payload["product_id"], payload["store_id"], payload["stock"], timeout=timeout
+    )
+
+
+order_client = OrderServiceClient()
+inventory_client = InventoryServiceClient()
+
+outbox_dispatcher = OutboxDispatcher()
+outbox_dispatcher.register(ORDER_STATUS, _send_order_status)
+outbox_dispatcher.register(INVENTORY, _send_inventory, coalesce=True)
@@ -0,0 +1,151 @@
+"""
+Bounded worker pool for bcrypt password hashing and verification
+
+One bcrypt call takes about 250 ms of CPU. Run inside an async route it blocks
+the event loop, and every other request, for that long. The pool runs the calls
+on PASSWORD_HASH_WORKERS threads instead (bcrypt releases the GIL while it
+works), so the loop keeps serving scans during a login storm.
+
+Admission control: at most PASSWORD_HASH_MAX_QUEUE calls wait for a worker;
+further calls are refused at once with PasswordHashBusy, and a call that
+waited longer than PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS is refused instead of
+run (its client has most likely given up).
+"""
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE, PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS
+from utils.auth import hash_password, verify_password
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHashBusy(Exception):
+    """Too many password hashing calls are waiting; try again later"""
+
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 1)
+
+
+class PasswordHashPool:
+    """Thread pool running bcrypt calls for async routes, with a bounded queue and queue-time metrics"""
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+        queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Calls submitted and not finished yet (queued or running)
+        self._admitted = 0
+        self._running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        # Queue times (ms) of the most recent calls
+        self._queue_ms = deque(maxlen=1000)
+        self._run_ms_total = 0.0
+        self.max_queue_ms = 0.0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    def stop(self):
+        """Shut the worker threads down; calls still queued are cancelled"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def hash(self, password: str) -> str:
+        """hash_password on a worker thread"""
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """verify_password on a worker thread"""
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        """
+        Raises:
+            PasswordHashBusy: when the queue is full or the call waited too long for a worker
+        """
+        if self.workers <= 0:
+            # Inline on the event loop, as before the pool existed
+            return fn(*args)
+        with self._lock:
+            if self._admitted >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHashBusy(f"{self._admitted - self._running} password hashing calls already waiting")
+            self._admitted += 1
+            self.submitted += 1
+        try:
+            future = self._pool().submit(self._job, fn, args, time.monotonic())
+        except BaseException:
+            self._release()
+            raise
+        # Also runs when a queued call is cancelled because its request went away
+        future.add_done_callback(lambda f: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def _job(self, fn: Callable, args: tuple, submitted_at: float) -> Any:
+        started = time.monotonic()
+        queue_ms = (started - submitted_at) * 1000
+        with self._lock:
+            self._queue_ms.append(queue_ms)
+            self.max_queue_ms = max(self.max_queue_ms, round(queue_ms, 1))
+            if started - submitted_at > self.queue_timeout:
+                self.expired += 1
+                raise PasswordHashBusy(f"Waited {queue_ms:.0f} ms for a password hashing worker")
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            run_ms = (time.monotonic() - started) * 1000
+            with self._lock:
+                self._running -= 1
+                self.completed += 1
+                self._run_ms_total += run_ms
+
+    def metrics(self) -> Dict[str, Any]:
+        """Occupancy, refusals and queue-time percentiles of the recent calls"""
+        with self._lock:
+            queue_ms = list(self._queue_ms)
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._admitted - self._running,
+                "submitted_total": self.submitted,
+                "completed_total": self.completed,
+                "rejected_total": self.rejected,
+                "expired_total": self.expired,
+                "queue_ms_p50": _percentile(queue_ms, 0.5),
+                "queue_ms_p99": _percentile(queue_ms, 0.99),
+                "max_queue_ms": self.max_queue_ms,
+                "avg_run_ms": round(self._run_ms_total / self.completed, 1) if self.completed else 0.0
+            }
+
+
+password_hasher = PasswordHashPool()
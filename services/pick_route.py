@@ -0,0 +1,308 @@
+"""
+Pick route planning
+
+A store is modelled as parallel aisles joined by a front and a back cross aisle.
+An aisle's position comes from the natural order of the store's aisle names, and
+a rack's position along the aisles from the natural order of the store's rack
+names (rack numbering runs the same way in every aisle). Shelves are stacked at
+the same spot, so they add no walking. When every stop of a route has numeric
+"x"/"y" coordinates in Inventory.location_data, plain Manhattan distance over
+those coordinates is used instead.
+
+Routes start and end at the front of the first aisle (the packing area). The
+visiting order is an S-shaped (serpentine) sweep over the aisles, improved with
+2-opt moves until no reversal shortens the tour. Layouts are cached per store
+and layout version, and routes per layout fingerprint and stop set.
+
+Planning is split into loading the rows (PickRoutePlanner.load) and ordering the
+stops (PickRoutePlanner.build), which touches no database. Async routes use the
+*_async functions, which load through the session and run the 2-opt, up to
+MAX_OPTIMISED_STOPS stops, on a worker thread instead of the event loop.
+"""
+import asyncio
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import PICK_ROUTE_CACHE_SIZE
+import models as crud
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Walking distance between neighbouring aisles, in rack lengths
+AISLE_PITCH = 3.0
+# 2-opt is quadratic per pass; longer routes keep the serpentine order
+MAX_OPTIMISED_STOPS = 400
+
+DEPOT = (0.0, 0.0)
+
+
+def natural_key(value: Optional[str]) -> tuple:
+    """Sort key comparing digit runs as numbers, so A2 sorts before A10"""
+    if not value:
+        return ()
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part.lower()) for part in re.split(r"(\d+)", str(value)) if part)
+
+
+def location_point(location_data: Any) -> Optional[Tuple[float, float]]:
+    """Numeric (x, y) from location_data ({"x", "y"} or {"coordinates": {"x", "y"}}), or None"""
+    if not isinstance(location_data, dict):
+        return None
+    coords = location_data.get("coordinates") if isinstance(location_data.get("coordinates"), dict) else location_data
+    try:
+        return (float(coords["x"]), float(coords["y"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class StoreLayout:
+    """Aisle and rack positions of one store, built from its distinct (aisle, rack) pairs"""
+
+    def __init__(self, locations: List[Tuple[Optional[str], Optional[str]]]):
+        aisles = sorted({str(aisle) for aisle, _ in locations if aisle}, key=natural_key)
+        racks = sorted({str(rack) for aisle, rack in locations if aisle and rack}, key=natural_key)
+        self.aisle_index = {aisle: i for i, aisle in enumerate(aisles)}
+        # Racks are 1..depth; 0 is the front cross aisle, depth + 1 the back one
+        self.rack_index = {rack: j + 1 for j, rack in enumerate(racks)}
+        self.depth = len(racks)
+        canonical = repr((aisles, racks))
+        self.fingerprint = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    def position(self, aisle: Optional[str], rack: Optional[str]) -> Optional[Tuple[float, float]]:
+        """(aisle index, rack index) of a location, or None when it is not in the layout"""
+        if not aisle or str(aisle) not in self.aisle_index:
+            return None
+        return (float(self.aisle_index[str(aisle)]), float(self.rack_index.get(str(rack) if rack else "", 0)))
+
+    def distance(self, a: Tuple[float, float], b: Tuple[float, float]) -> float:
+        """Walking distance between two positions, leaving an aisle by whichever cross aisle is shorter"""
+        if a[0] == b[0]:
+            return abs(a[1] - b[1])
+        across = abs(a[0] - b[0]) * AISLE_PITCH
+        return across + min(a[1] + b[1], 2 * (self.depth + 1) - a[1] - b[1])
+
+
+def manhattan(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def route_length(points: List[Tuple[float, float]], distance) -> float:
+    """Length of the closed tour depot -> points... -> depot"""
+    tour = [DEPOT] + list(points) + [DEPOT]
+    return sum(distance(tour[i], tour[i + 1]) for i in range(len(tour) - 1))
+
+
+def serpentine(points: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Visit aisles left to right, walking up the first visited aisle, down the next, and so on"""
+    by_aisle = {}
+    for point in points:
+        by_aisle.setdefault(point[0], []).append(point)
+    ordered = []
+    for n, aisle in enumerate(sorted(by_aisle)):
+        ordered.extend(sorted(by_aisle[aisle], key=lambda p: p[1], reverse=n % 2 == 1))
+    return ordered
+
+
+def two_opt(points: List[Tuple[float, float]], distance, max_passes: int = 50) -> List[Tuple[float, float]]:
+    """Reverse route segments while doing so shortens the closed tour"""
+    tour = [DEPOT] + list(points) + [DEPOT]
+    n = len(tour)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 2):
+            for k in range(i + 1, n - 1):
+                a, b, c, d = tour[i - 1], tour[i], tour[k], tour[k + 1]
+                if distance(a, c) + distance(b, d) < distance(a, b) + distance(c, d) - 1e-9:
+                    tour[i:k + 1] = reversed(tour[i:k + 1])
+                    improved = True
+        if not improved:
+            break
+    return tour[1:-1]
+
+
+def plan_route(points: List[Tuple[float, float]], distance) -> List[Tuple[float, float]]:
+    """Short visiting order for distinct positions: serpentine sweep, then 2-opt"""
+    ordered = serpentine(points)
+    if 2 < len(ordered) <= MAX_OPTIMISED_STOPS:
+        ordered = two_opt(ordered, distance)
+    return ordered
+
+
+class PickRoutePlanner:
+    """Plans pick routes with bounded LRU caches of store layouts and planned routes"""
+
+    def __init__(self, max_entries: int = PICK_ROUTE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._layouts: "OrderedDict[int, Tuple[tuple, StoreLayout]]" = OrderedDict()
+        self._routes: "OrderedDict[tuple, List[Tuple[float, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.layout_hits = 0
+        self.route_hits = 0
+        self.routes_planned = 0
+
+    def _cache_get(self, cache: OrderedDict, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, cache: OrderedDict, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+    def layout(self, db: Session, store_id: int) -> Tuple[tuple, StoreLayout]:
+        """Layout of a store, rebuilt only when rows were added or removed or an aisle or rack moved"""
+        version = crud.get_store_layout_version(db, store_id)
+        cached = self._cache_get(self._layouts, store_id)
+        if cached is not None and cached[0] == version:
+            with self._lock:
+                self.layout_hits += 1
+            return cached
+        entry = (version, StoreLayout(crud.get_store_locations(db, store_id)))
+        self._cache_put(self._layouts, store_id, entry)
+        return entry
+
+    def plan(self, db: Session, store_id: int, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Group entries into stops and order the stops into a short walk
+
+        Args:
+            db: Database session
+            store_id: Store the entries are picked in
+            entries: Dicts with an internal "product_id"; they are returned
+                unchanged inside the stops
+
+        Returns:
+            {"store_id", "layout_version", "distance", "unordered_distance", "stops", "unlocated"}
+            where each stop has its sequence number, aisle, rack and entries
+            (sorted by shelf), and unordered_distance is the walk in input order
+        """
+        return self.build(store_id, entries, *self.load(db, store_id, entries))
+
+    def load(self, db: Session, store_id: int, entries: List[Dict[str, Any]]) -> Tuple[StoreLayout, Dict[int, tuple]]:
+        """The store's layout and the entries' locations, everything build() needs from the database"""
+        _, layout = self.layout(db, store_id)
+        return layout, crud.get_item_locations(db, store_id, [entry["product_id"] for entry in entries])
+
+    def build(
+        self, store_id: int, entries: List[Dict[str, Any]], layout: StoreLayout, locations: Dict[int, tuple]
+    ) -> Dict[str, Any]:
+        """The plan() result from loaded rows; CPU only, safe to run on a worker thread"""
+        located = []
+        unlocated = []
+        for entry in entries:
+            aisle, rack, shelf, location_data = locations.get(entry["product_id"], (None, None, None, None))
+            grid = layout.position(aisle, rack)
+            if grid is None and location_point(location_data) is None:
+                unlocated.append(entry)
+                continue
+            located.append((entry, aisle, rack, shelf, grid, location_point(location_data)))
+
+        # Coordinates only when every stop has them; mixing them with aisle positions is meaningless
+        use_points = bool(located) and all(point is not None for *_, point in located)
+        distance = manhattan if use_points else layout.distance
+        stops = {}
+        unordered = []
+        for entry, aisle, rack, shelf, grid, point in located:
+            position = point if use_points else grid
+            if position is None:
+                unlocated.append(entry)
+                continue
+            if position not in stops:
+                stops[position] = {"aisle": aisle, "rack": rack, "entries": []}
+                unordered.append(position)
+            stops[position]["entries"].append({**entry, "shelf": shelf})
+
+        key = ("points" if use_points else layout.fingerprint, frozenset(unordered))
+        ordered = self._cache_get(self._routes, key)
+        if ordered is not None:
+            with self._lock:
+                self.route_hits += 1
+        else:
+            ordered = plan_route(unordered, distance)
+            with self._lock:
+                self.routes_planned += 1
+            self._cache_put(self._routes, key, ordered)
+
+        route = []
+        for sequence, position in enumerate(ordered, start=1):
+            stop = stops[position]
+            stop["entries"].sort(key=lambda e: natural_key(e["shelf"]))
+            route.append({"sequence": sequence, **stop})
+        return {
+            "store_id": store_id,
+            "layout_version": layout.fingerprint,
+            "distance": round(route_length(ordered, distance), 2),
+            "unordered_distance": round(route_length(unordered, distance), 2),
+            "stops": route,
+            "unlocated": unlocated
+        }
+
+
+pick_route_planner = PickRoutePlanner()
+
+
+def _order_entries(db: Session, order, include_picked: bool) -> List[Dict[str, Any]]:
+    entries = []
+    for item in crud.get_order_items(db, order.id):
+        remaining = (item.ordered_quantity or 0) - (item.picked_quantity or 0)
+        if remaining <= 0 and not include_picked:
+            continue
+        entries.append({
+            "order_item_id": item.id,
+            "product_id": item.product_id,
+            "external_product_id": item.product_item_id,
+            "ordered_quantity": float(item.ordered_quantity or 0),
+            "picked_quantity": float(item.picked_quantity or 0),
+            "remaining": float(max(remaining, 0))
+        })
+    return entries
+
+
+def _wave_entries(db: Session, wave) -> List[Dict[str, Any]]:
+    from services.wave_picking import build_pick_list
+
+    return [
+        {key: line[key] for key in ("product_id", "external_product_id", "name", "ordered_quantity", "picked_quantity", "remaining", "orders")}
+        for line in build_pick_list(db, wave) if line["remaining"] > 0
+    ]
+
+
+def _load(db: Session, store_id: int, entries_of, *args) -> tuple:
+    entries = entries_of(db, *args)
+    return (entries, *pick_route_planner.load(db, store_id, entries))
+
+
+def plan_order_route(db: Session, order, include_picked: bool = False) -> Dict[str, Any]:
+    """Route over an order's items in its pickup store; picked items are left out unless include_picked"""
+    entries = _order_entries(db, order, include_picked)
+    return {"order_id": order.id, **pick_route_planner.plan(db, order.pickup_location_id, entries)}
+
+
+def plan_wave_route(db: Session, wave) -> Dict[str, Any]:
+    """Route over the unpicked lines of a wave's combined pick list"""
+    entries = _wave_entries(db, wave)
+    return {"wave_id": wave.id, **pick_route_planner.plan(db, wave.pickup_location_id, entries)}
+
+
+async def plan_order_route_async(db: AsyncSession, order, include_picked: bool = False) -> Dict[str, Any]:
+    """plan_order_route for async routes: the stops are ordered off the event loop"""
+    loaded = await db.run_sync(_load, order.pickup_location_id, _order_entries, order, include_picked)
+    route = await asyncio.to_thread(pick_route_planner.build, order.pickup_location_id, *loaded)
+    return {"order_id": order.id, **route}
+
+
+async def plan_wave_route_async(db: AsyncSession, wave) -> Dict[str, Any]:
+    """plan_wave_route for async routes: the stops are ordered off the event loop"""
+    loaded = await db.run_sync(_load, wave.pickup_location_id, _wave_entries, wave)
+    route = await asyncio.to_thread(pick_route_planner.build, wave.pickup_location_id, *loaded)
+    return {"wave_id": wave.id, **route}
@@ -0,0 +1,203 @@
+"""
+Read-through cache for GETs against the external services
+
+Each cached client method has its own ReadThroughCache, a size-bounded LRU
+whose entries live for the method's TTL:
+
+- "not found" answers (a None value) are cached too, for a shorter time
+- for `stale_seconds` past its TTL an entry is still served while one
+  background refresh fetches a new value
+- concurrent misses for the same key wait for one upstream call instead of
+  each making their own
+- errors are not cached; while refreshes fail, the stale value keeps being
+  served until its stale window ends
+
+Webhook handlers that receive fresher data invalidate the affected keys.
+"""
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+import httpx
+from config import (
+    READ_CACHE_ENABLED, READ_CACHE_SIZE, READ_CACHE_STALE_SECONDS, READ_CACHE_NEGATIVE_TTL_SECONDS,
+    READ_CACHE_REFRESH_WORKERS, ORDER_CACHE_TTL_SECONDS, INVENTORY_CACHE_TTL_SECONDS, CUSTOMER_CACHE_TTL_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+_refresh_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _refresh_executor() -> ThreadPoolExecutor:
+    global _refresh_pool
+    if _refresh_pool is None:
+        with _pool_lock:
+            if _refresh_pool is None:
+                _refresh_pool = ThreadPoolExecutor(max_workers=READ_CACHE_REFRESH_WORKERS, thread_name_prefix="read-cache-refresh")
+    return _refresh_pool
+
+
+class ReadThroughCache:
+    """LRU of key -> upstream value with TTL, negative caching, stale-while-revalidate and single-flight loads"""
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_entries: int = READ_CACHE_SIZE,
+        stale_seconds: float = READ_CACHE_STALE_SECONDS,
+        negative_ttl_seconds: float = READ_CACHE_NEGATIVE_TTL_SECONDS
+    ):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        # key -> (value, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        # key -> Future of the upstream call in flight
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def get(self, key: str, load: Callable[[], Any]) -> Any:
+        """
+        Return the cached value of key, calling load() on a miss
+
+        load returns the value (None for "not found") or raises; exceptions are
+        passed on to every caller waiting for the same key and are not cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if value is None:
+                        self.negative_hits += 1
+                    return value
+                if now < expires_at + self.stale_seconds:
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        self.refreshes += 1
+                        _refresh_executor().submit(self._load, key, load, self._inflight[key], True)
+                    return value
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            return self._load(key, load, future)
+        return future.result()
+
+    def _load(self, key: str, load: Callable[[], Any], future: Future, background: bool = False) -> Any:
+        try:
+            value = load()
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+                stale = self._entries.get(key) if background else None
+            if background:
+                # The stale value stays in place until its stale window ends
+                logger.warning(f"Background refresh of {self.name} {key} failed: {str(e)}")
+                future.set_result(stale[0] if stale else None)
+                return None
+            future.set_exception(e)
+            raise
+        ttl = self.negative_ttl_seconds if value is None else self.ttl_seconds
+        with self._lock:
+            # Invalidated while loading: hand the value to the waiters but do not keep it
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                self._entries[key] = (value, time.monotonic() + ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+        return value
+
+    def invalidate(self, keys: Iterable[str]) -> int:
+        """Drop the given keys (and forget loads in flight for them); returns the number of entries dropped"""
+        dropped = 0
+        with self._lock:
+            for key in keys:
+                self._inflight.pop(key, None)
+                if self._entries.pop(key, None) is not None:
+                    dropped += 1
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._inflight.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "refreshes": self.refreshes,
+                "errors": self.errors,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else None
+            }
+
+
+def json_or_none(response: httpx.Response) -> Any:
+    """Body of a 200 answer, or None for a 404; any other status raises, so it is not cached"""
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code == 404:
+        return None
+    raise httpx.HTTPStatusError(f"Unexpected status {response.status_code}", request=response.request, response=response)
+
+
+def cached(caches: Dict[str, ReadThroughCache], name: str, key: str, load: Callable[[], Any]) -> Any:
+    """Read key through the named cache, or call load() directly when there is none"""
+    cache = caches.get(name)
+    return cache.get(key, load) if cache is not None else load()
+
+
+def invalidate(name: str, keys: Iterable[Any], caches: Dict[str, ReadThroughCache] = None) -> int:
+    """Invalidation hook: drop keys from the cache of the given method (by default the shared one), if it exists"""
+    cache = (read_caches if caches is None else caches).get(name)
+    return cache.invalidate([str(key) for key in keys]) if cache is not None else 0
+
+
+def read_cache_metrics() -> Dict[str, Any]:
+    return {name: cache.metrics() for name, cache in read_caches.items()}
+
+
+# Shared caches of the service clients, by method
+read_caches: Dict[str, ReadThroughCache] = {
+    "order": ReadThroughCache("order", ORDER_CACHE_TTL_SECONDS),
+    "inventory": ReadThroughCache("inventory", INVENTORY_CACHE_TTL_SECONDS),
+    "inventory_by_product": ReadThroughCache("inventory_by_product", INVENTORY_CACHE_TTL_SECONDS),
+    "customer": ReadThroughCache("customer", CUSTOMER_CACHE_TTL_SECONDS),
+} if READ_CACHE_ENABLED else {}
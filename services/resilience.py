@@ -0,0 +1,417 @@
+"""
+Retries, circuit breaking and hedging for calls to the external services
+
+Every service client sends its requests through a ServiceCaller with a
+ServicePolicy:
+
+- Idempotent calls are retried on network errors and 429/5xx answers, with
+  exponential backoff and jitter. Other calls are only retried when the
+  request never left (connection refused, no free pooled connection).
+- Each host has one CircuitBreaker, shared by all clients calling it. After
+  `breaker_failures` failures in a row it opens and calls fail at once with
+  CircuitOpenError; after `breaker_reset_seconds` one probe call is let
+  through, and its outcome closes or reopens the breaker.
+- GETs can be hedged: when the first request has not answered after
+  `hedge_after` seconds a second one is sent, and the first answer wins.
+
+resilience_metrics() reports breaker states and the per-client counters; each
+call's latency (retries included) and failures are also recorded per upstream
+endpoint in the upstream_request_* metrics of GET /metrics.
+"""
+import asyncio
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+from config import (
+    SERVICE_RETRY_ATTEMPTS, SERVICE_RETRY_BACKOFF_SECONDS, SERVICE_RETRY_BACKOFF_MAX_SECONDS,
+    CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_RESET_SECONDS, SERVICE_HEDGE_AFTER_SECONDS
+)
+from services.http_transport import HttpTransport, http_transport
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Breaker states
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+# Raised before the request was written, so even a non-idempotent call can be retried
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+upstream_duration = registry.histogram(
+    "upstream_request_duration_seconds", "Time of calls to the external services, retries included, by endpoint template and outcome",
+    ("service", "method", "endpoint", "status")
+)
+upstream_errors = registry.counter(
+    "upstream_request_errors_total", "Calls to the external services that failed or answered 5xx, by endpoint template",
+    ("service", "method", "endpoint", "error")
+)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """The host's circuit breaker is open; the call was not sent"""
+
+
+def _error_label(error: BaseException) -> str:
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "transport"
+    return "error"
+
+
+class ServicePolicy:
+    """Retry, circuit breaker and hedging settings of a service client"""
+
+    def __init__(
+        self,
+        max_attempts: int = SERVICE_RETRY_ATTEMPTS,
+        backoff_base: float = SERVICE_RETRY_BACKOFF_SECONDS,
+        backoff_max: float = SERVICE_RETRY_BACKOFF_MAX_SECONDS,
+        breaker_failures: int = CIRCUIT_BREAKER_FAILURES,
+        breaker_reset_seconds: float = CIRCUIT_BREAKER_RESET_SECONDS,
+        hedge_after: float = SERVICE_HEDGE_AFTER_SECONDS
+    ):
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.hedge_after = hedge_after
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds before the next try: doubles per attempt up to backoff_max, jittered between half and all of it"""
+        delay = min(self.backoff_base * (2 ** max(attempt - 1, 0)), self.backoff_max)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker of one host"""
+
+    def __init__(self, host: str, failure_threshold: int, reset_seconds: float):
+        self.host = host
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if now - self._opened_at < self.reset_seconds or self._probing:
+            return OPEN
+        return HALF_OPEN
+
+    def before_call(self):
+        """Let the call through, or raise CircuitOpenError; in HALF_OPEN only one probe passes"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"Circuit breaker for {self.host} is open")
+
+    def record(self, healthy: bool):
+        """Record the outcome of a call that was let through"""
+        with self._lock:
+            self._probing = False
+            if healthy:
+                if self._opened_at is not None:
+                    logger.info(f"Circuit breaker for {self.host} closed")
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit breaker for {self.host} opened after {self._failures} failures")
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+
+    def abandon(self):
+        """Forget a call that was let through but cancelled before it had an outcome"""
+        with self._lock:
+            self._probing = False
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state(time.monotonic()),
+                "consecutive_failures": self._failures,
+                "opened_total": self.opened,
+                "rejected_total": self.rejected
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_counters: Dict[str, Dict[str, int]] = {}
+_registry_lock = threading.Lock()
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+
+
+def circuit_breaker(url: str, policy: ServicePolicy) -> CircuitBreaker:
+    """The breaker of the URL's host, created with the policy of its first caller"""
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.setdefault(
+                host, CircuitBreaker(host, policy.breaker_failures, policy.breaker_reset_seconds)
+            )
+    return breaker
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _registry_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedged-request")
+    return _hedge_pool
+
+
+class ServiceCaller:
+    """Sends a client's requests over the shared transport under its ServicePolicy"""
+
+    def __init__(self, name: str, transport: HttpTransport = None, policy: ServicePolicy = None):
+        self.name = name
+        self.transport = transport or http_transport
+        self.policy = policy or ServicePolicy()
+        with _registry_lock:
+            # Clients of the same name (e.g. one per module) add up to one set of counters
+            self.counters = _counters.setdefault(name, {
+                "calls": 0, "retries": 0, "failures": 0, "hedged": 0, "hedge_wins": 0, "rejected": 0
+            })
+
+    def _count(self, counter: str):
+        with _registry_lock:
+            self.counters[counter] += 1
+
+    def _retry(self, attempt: int, retryable: bool, time_left: float = None) -> Optional[float]:
+        """Backoff before the next try, or None when the call should not be tried again"""
+        if not retryable or attempt >= self.policy.max_attempts:
+            return None
+        delay = self.policy.backoff(attempt)
+        if time_left is not None and delay >= time_left:
+            return None
+        self._count("retries")
+        return delay
+
+    def _observe(self, method: str, endpoint: str, status: str, seconds: float):
+        upstream_duration.observe(seconds, service=self.name, method=method, endpoint=endpoint, status=status)
+        if not status.isdigit():
+            upstream_errors.inc(service=self.name, method=method, endpoint=endpoint, error=status)
+        elif int(status) >= 500:
+            upstream_errors.inc(service=self.name, method=method, endpoint=endpoint, error="5xx")
+
+    def request(self, method: str, url: str, idempotent: bool = None, endpoint: str = None, **kwargs) -> httpx.Response:
+        """
+        Send a request with retries, circuit breaking and (for GETs) hedging
+
+        Args:
+            method: HTTP method
+            url: Absolute URL
+            idempotent: Whether the call may be repeated (default: by method)
+            endpoint: Path template labelling the call's metrics, e.g. "/order-service/order/{reference_number}"
+                (default: the URL's path, which should not carry ids)
+            **kwargs: Passed on to httpx (json, params, timeout, ...)
+
+        Returns:
+            The last response, which may still be an error status
+
+        Raises:
+            httpx.TransportError: when every try failed, or CircuitOpenError
+        """
+        started = time.perf_counter()
+        status = "cancelled"
+        try:
+            response = self._request(method, url, idempotent, **kwargs)
+            status = str(response.status_code)
+            return response
+        except Exception as e:
+            status = _error_label(e)
+            raise
+        finally:
+            self._observe(method, endpoint or urlsplit(url).path, status, time.perf_counter() - started)
+
+    def _request(self, method: str, url: str, idempotent: Optional[bool], **kwargs) -> httpx.Response:
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        breaker = circuit_breaker(url, self.policy)
+        hedge = method == "GET" and self.policy.hedge_after > 0
+        self._count("calls")
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self._count("rejected")
+                raise
+            try:
+                if hedge:
+                    response = self._send_hedged(method, url, **kwargs)
+                else:
+                    response = self.transport.client().request(method, url, **kwargs)
+            except Exception as e:
+                breaker.record(False)
+                delay = self._retry(
+                    attempt, isinstance(e, httpx.TransportError) and (idempotent or isinstance(e, NOT_SENT_ERRORS))
+                )
+                if delay is None:
+                    self._count("failures")
+                    raise
+                logger.warning(f"{self.name} {method} {url} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            else:
+                breaker.record(response.status_code < 500)
+                delay = self._retry(attempt, idempotent and response.status_code in RETRY_STATUSES)
+                if delay is None:
+                    if response.status_code >= 500:
+                        self._count("failures")
+                    return response
+                logger.warning(f"{self.name} {method} {url} answered {response.status_code}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def _send_hedged(self, method: str, url: str, **kwargs) -> httpx.Response:
+        # A losing request is not interrupted; it finishes on its pool thread
+        pool = _hedge_executor()
+        client = self.transport.client()
+        futures = [pool.submit(client.request, method, url, **kwargs)]
+        done, _ = wait(futures, timeout=self.policy.hedge_after)
+        if not done:
+            self._count("hedged")
+            futures.append(pool.submit(client.request, method, url, **kwargs))
+        pending = set(futures)
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            answered = [future for future in done if future.exception() is None]
+            if answered:
+                if answered[0] is not futures[0]:
+                    self._count("hedge_wins")
+                return answered[0].result()
+            if not pending:
+                raise done.pop().exception()
+
+    async def arequest(
+        self, method: str, url: str, idempotent: bool = None, timeout: float = None, endpoint: str = None, **kwargs
+    ) -> httpx.Response:
+        """
+        Async variant of request
+
+        Args:
+            timeout: Budget for all tries together; each try gets what is left of it
+                (default: the transport's timeout per try)
+        """
+        started = time.perf_counter()
+        status = "cancelled"
+        try:
+            response = await self._arequest(method, url, idempotent, timeout, **kwargs)
+            status = str(response.status_code)
+            return response
+        except Exception as e:
+            status = _error_label(e)
+            raise
+        finally:
+            self._observe(method, endpoint or urlsplit(url).path, status, time.perf_counter() - started)
+
+    async def _arequest(self, method: str, url: str, idempotent: Optional[bool], timeout: Optional[float], **kwargs) -> httpx.Response:
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        breaker = circuit_breaker(url, self.policy)
+        hedge = method == "GET" and self.policy.hedge_after > 0
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        self._count("calls")
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self._count("rejected")
+                raise
+            try:
+                send_timeout = deadline - loop.time() if deadline else httpx.USE_CLIENT_DEFAULT
+                if hedge:
+                    response = await self._asend_hedged(method, url, timeout=send_timeout, **kwargs)
+                else:
+                    response = await self.transport.async_client().request(method, url, timeout=send_timeout, **kwargs)
+            except asyncio.CancelledError:
+                # Cut short by the caller's own deadline, which says nothing about the host
+                breaker.abandon()
+                raise
+            except Exception as e:
+                breaker.record(False)
+                delay = self._retry(
+                    attempt, isinstance(e, httpx.TransportError) and (idempotent or isinstance(e, NOT_SENT_ERRORS)),
+                    deadline - loop.time() if deadline else None
+                )
+                if delay is None:
+                    self._count("failures")
+                    raise
+                logger.warning(f"{self.name} {method} {url} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            else:
+                breaker.record(response.status_code < 500)
+                delay = self._retry(
+                    attempt, idempotent and response.status_code in RETRY_STATUSES,
+                    deadline - loop.time() if deadline else None
+                )
+                if delay is None:
+                    if response.status_code >= 500:
+                        self._count("failures")
+                    return response
+                logger.warning(f"{self.name} {method} {url} answered {response.status_code}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _asend_hedged(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client = self.transport.async_client()
+        tasks = [asyncio.ensure_future(client.request(method, url, **kwargs))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.policy.hedge_after)
+            if not done:
+                self._count("hedged")
+                tasks.append(asyncio.ensure_future(client.request(method, url, **kwargs)))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                answered = [task for task in done if task.exception() is None]
+                if answered:
+                    if answered[0] is not tasks[0]:
+                        self._count("hedge_wins")
+                    return answered[0].result()
+                if not pending:
+                    raise done.pop().exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def resilience_metrics() -> Dict[str, Any]:
+    """Circuit breaker state per host and retry/hedging counters per client"""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+        clients = {name: dict(counters) for name, counters in _counters.items()}
+    return {
+        "breakers": {breaker.host: breaker.metrics() for breaker in breakers},
+        "clients": clients
+    }
@@ -0,0 +1,92 @@
+"""
+Batch scan engine for offline scanner flushes
+
+A handheld that lost connectivity replays its buffered scans in one request.
+Every order and item the scans touch is loaded with one IN query each, the scans
+are validated in order against quantities held in memory, and the accepted ones
+are written as one UPDATE per changed item plus one multi-row INSERT of picking
+activities. Scans whose client-generated scan_id is already recorded are
+reported as duplicates and not applied again.
+"""
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+import models as crud
+from models import Order, OrderItem
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def apply_scans(db: Session, scans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Validate and apply an ordered list of scans; the caller's unit of work commits
+
+    Args:
+        db: Database session
+        scans: Scan dicts with scan_id, order_id, product_id, quantity and method
+
+    Returns:
+        One result per scan, in input order, with status PICKED, DUPLICATE or
+        REJECTED (plus an error message)
+    """
+    orders = crud.get_orders_by_ids(db, [scan["order_id"] for scan in scans])
+    items = {}
+    for item in crud.get_order_items_for_orders(db, orders.keys(), for_update=True):
+        # The first item of an order for a product, as add-item matches it
+        items.setdefault((item.order_id, item.product_id), item)
+    recorded = crud.get_recorded_scan_ids(db, [scan.get("scan_id") for scan in scans])
+
+    results = []
+    activities = []
+    for scan in scans:
+        scan_id, order_id, product_id = scan.get("scan_id"), scan["order_id"], scan["product_id"]
+        quantity = scan.get("quantity") or 1.0
+        result = {"scan_id": scan_id, "order_id": order_id, "product_id": product_id}
+        item = items.get((order_id, product_id))
+        if scan_id is not None and scan_id in recorded:
+            results.append({**result, "status": "DUPLICATE", **_quantities(item)})
+            continue
+        error = _validate(orders.get(order_id), item, quantity)
+        if error:
+            results.append({**result, "status": "REJECTED", "error": error})
+            continue
+
+        item.picked_quantity += quantity
+        if scan_id is not None:
+            recorded.add(scan_id)
+        activities.append({
+            "order_id": order_id,
+            "picking_method": "ITEM_PICKED",
+            "scan_id": scan_id,
+            "details": {"product_id": product_id, "method": scan.get("method"), "quantity": quantity}
+        })
+        results.append({**result, "status": "PICKED", **_quantities(item)})
+
+    # Flushes the changed items as well
+    crud.create_picking_activities(db, activities)
+    logger.info(f"Applied {len(activities)} of {len(scans)} scans")
+    return results
+
+
+def _validate(order: Optional[Order], item: Optional[OrderItem], quantity: float) -> Optional[str]:
+    """Why a scan cannot be applied, with the messages add-item uses; None when it can"""
+    if order is None:
+        return "Order not found"
+    if order.picking_status != "IN_PROGRESS":
+        return "Order picking not in progress"
+    if item is None:
+        return "Product not in this order"
+    new_quantity = item.picked_quantity + quantity
+    if new_quantity > item.ordered_quantity:
+        return f"Picked quantity ({new_quantity}) exceeds ordered quantity ({item.ordered_quantity})"
+    return None
+
+
+def _quantities(item: Optional[OrderItem]) -> Dict[str, Any]:
+    if item is None:
+        return {}
+    return {
+        "picked_quantity": float(item.picked_quantity),
+        "ordered_quantity": float(item.ordered_quantity),
+        "remaining": float(item.ordered_quantity - item.picked_quantity)
+    }
@@ -0,0 +1,206 @@
+"""
+Wave picking engine
+
+A wave groups several orders of one store so an agent picks them in a single
+walk. The pick list sums the quantities of every product across the wave's
+orders and sorts the lines by store location (aisle, rack, shelf), so the walk
+visits each location once. A picked quantity is distributed back to the orders'
+OrderItem rows, oldest order first. Every function works on loaded rows in
+memory and leaves the commit to the caller's unit of work.
+"""
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+from config import WAVE_MAX_ORDERS
+import models as crud
+from models import PickWave
+from services.pick_route import natural_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def start_wave(db: Session, pickup_location_id: int, order_ids: List[int], agent_id: Optional[int] = None) -> PickWave:
+    """
+    Create a wave from orders of one store and start picking all of them
+
+    Args:
+        db: Database session
+        pickup_location_id: Store the orders are picked in
+        order_ids: Internal order IDs
+        agent_id: Agent the wave is assigned to
+
+    Returns:
+        The new wave
+
+    Raises:
+        ValueError: When an order is missing, belongs to another store, or its
+        picking has already started
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        raise ValueError("A wave needs at least one order")
+    if len(order_ids) > WAVE_MAX_ORDERS:
+        raise ValueError(f"A wave takes at most {WAVE_MAX_ORDERS} orders")
+
+    orders = crud.get_orders_by_ids(db, order_ids, for_update=True)
+    missing = [oid for oid in order_ids if oid not in orders]
+    if missing:
+        raise ValueError(f"Orders not found: {missing}")
+    other_store = [oid for oid in order_ids if orders[oid].pickup_location_id != pickup_location_id]
+    if other_store:
+        raise ValueError(f"Orders not for pickup location {pickup_location_id}: {other_store}")
+    started = [oid for oid in order_ids if orders[oid].picking_status != "NOT_STARTED" or orders[oid].wave_id is not None]
+    if started:
+        raise ValueError(f"Picking already started or completed: {started}")
+
+    wave = crud.create_wave(db, pickup_location_id, order_ids, agent_id)
+    crud.create_picking_activities(db, [
+        {
+            "order_id": oid,
+            "picking_method": "PICKING_STARTED",
+            "picker_agent_id": str(agent_id) if agent_id is not None else None,
+            "details": {"wave_id": wave.id}
+        }
+        for oid in order_ids
+    ])
+    logger.info(f"Started wave {wave.id} with {len(order_ids)} orders at pickup location {pickup_location_id}")
+    return wave
+
+
+def build_pick_list(db: Session, wave: PickWave) -> List[Dict[str, Any]]:
+    """
+    One line per product with the quantities summed over the wave's orders, in walking order
+
+    Each line lists the orders it is split across, so picked units can be put
+    into the right tote.
+    """
+    lines = {}
+    for item, order, product, aisle, rack, shelf in crud.get_wave_item_rows(db, wave):
+        line = lines.get(item.product_id)
+        if line is None:
+            line = lines[item.product_id] = {
+                "product_id": item.product_id,
+                "external_product_id": product.product_id if product else item.product_item_id,
+                "name": product.name if product else None,
+                "aisle": aisle,
+                "rack": rack,
+                "shelf": shelf,
+                "ordered_quantity": 0.0,
+                "picked_quantity": 0.0,
+                "orders": []
+            }
+        line["ordered_quantity"] += item.ordered_quantity or 0
+        line["picked_quantity"] += item.picked_quantity or 0
+        line["orders"].append({
+            "order_id": order.id,
+            "reference_number": order.reference_number,
+            "order_item_id": item.id,
+            "ordered_quantity": float(item.ordered_quantity or 0),
+            "picked_quantity": float(item.picked_quantity or 0)
+        })
+    for line in lines.values():
+        line["remaining"] = line["ordered_quantity"] - line["picked_quantity"]
+    return sorted(lines.values(), key=_location_key)
+
+
+def pick_wave(db: Session, wave: PickWave, picks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Apply picked quantities of wave lines, distributing each to the orders oldest first
+
+    Args:
+        db: Database session
+        wave: An IN_PROGRESS wave
+        picks: Dicts with product_id (internal), quantity, method and an optional
+            client-generated scan_id
+
+    Returns:
+        One result per pick, in input order, with status PICKED (and the
+        per-order allocations), DUPLICATE or REJECTED (and an error message)
+    """
+    items_by_product = {}
+    for item, order, _, _, _, _ in crud.get_wave_item_rows(db, wave, for_update=True):
+        # Orders finished or reset on their own since the wave started take no more units
+        if order.picking_status == "IN_PROGRESS":
+            items_by_product.setdefault(item.product_id, []).append(item)
+    recorded = crud.get_recorded_scan_ids(db, [pick.get("scan_id") for pick in picks])
+
+    results = []
+    activities = []
+    for pick in picks:
+        scan_id, product_id = pick.get("scan_id"), pick["product_id"]
+        quantity = pick.get("quantity") or 1.0
+        result = {"scan_id": scan_id, "product_id": product_id}
+        if scan_id is not None and scan_id in recorded:
+            results.append({**result, "status": "DUPLICATE"})
+            continue
+        items = items_by_product.get(product_id)
+        if not items:
+            results.append({**result, "status": "REJECTED", "error": "Product not in this wave"})
+            continue
+        remaining = sum(item.ordered_quantity - item.picked_quantity for item in items)
+        if quantity > remaining:
+            results.append({
+                **result, "status": "REJECTED",
+                "error": f"Picked quantity ({quantity}) exceeds remaining wave quantity ({remaining})"
+            })
+            continue
+
+        allocations = []
+        left = quantity
+        for item in items:
+            take = min(left, item.ordered_quantity - item.picked_quantity)
+            if take <= 0:
+                continue
+            item.picked_quantity += take
+            left -= take
+            allocations.append({"order_id": item.order_id, "order_item_id": item.id, "quantity": float(take)})
+            activities.append({
+                "order_id": item.order_id,
+                "picking_method": "ITEM_PICKED",
+                # The scan id is unique, so it is kept on the first allocation only
+                "scan_id": scan_id if len(allocations) == 1 else None,
+                "picker_agent_id": str(wave.picker_agent_id) if wave.picker_agent_id is not None else None,
+                "details": {"product_id": product_id, "method": pick.get("method"), "quantity": float(take), "wave_id": wave.id}
+            })
+            if left <= 0:
+                break
+        if scan_id is not None:
+            recorded.add(scan_id)
+        results.append({
+            **result, "status": "PICKED", "quantity": float(quantity),
+            "remaining": float(remaining - quantity), "allocations": allocations
+        })
+
+    # Flushes the changed items as well
+    crud.create_picking_activities(db, activities)
+    return results
+
+
+def finish_wave(db: Session, wave: PickWave) -> Dict[str, Any]:
+    """
+    Close a wave and report which of its orders are fully picked
+
+    Fully picked orders are ready for /picking/complete/{order_id}; short
+    orders stay IN_PROGRESS so they can be finished one by one.
+    """
+    orders = crud.get_wave_orders(db, wave.id)
+    unpicked = {}
+    for item in crud.get_order_items_for_orders(db, [order.id for order in orders]):
+        if item.picked_quantity < item.ordered_quantity:
+            unpicked[item.order_id] = unpicked.get(item.order_id, 0) + 1
+    crud.complete_wave(db, wave.id)
+    return {
+        "wave_id": wave.id,
+        "status": "COMPLETED",
+        "ready_orders": [order.id for order in orders if order.id not in unpicked],
+        "short_orders": [
+            {"order_id": order.id, "reference_number": order.reference_number, "unpicked_items": unpicked[order.id]}
+            for order in orders if order.id in unpicked
+        ]
+    }
+
+
+def _location_key(line: Dict[str, Any]):
+    """Sort key walking aisles, racks and shelves in natural order (A2 before A10); unlocated lines last"""
+    located = any(line[part] for part in ("aisle", "rack", "shelf"))
+    return (not located, natural_key(line["aisle"]), natural_key(line["rack"]), natural_key(line["shelf"]), line["product_id"] or 0)
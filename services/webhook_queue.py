@@ -0,0 +1,249 @@
+"""
+Background worker pool draining the durable webhook queue
+"""
+import random
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from config import (
+    WEBHOOK_QUEUE_WORKERS, WEBHOOK_QUEUE_POLL_INTERVAL, WEBHOOK_QUEUE_MAX_ATTEMPTS,
+    WEBHOOK_QUEUE_BACKOFF_BASE_SECONDS, WEBHOOK_QUEUE_BACKOFF_MAX_SECONDS, WEBHOOK_QUEUE_VISIBILITY_TIMEOUT_SECONDS,
+    WEBHOOK_JOB_RETENTION_HOURS
+)
+import models as crud
+from models import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class ClaimLost(Exception):
+    """A running job was requeued as abandoned and may be running elsewhere"""
+
+
+class WebhookQueue:
+    """Pool of worker threads processing persisted webhook jobs"""
+
+    def __init__(
+        self,
+        workers: int = WEBHOOK_QUEUE_WORKERS,
+        poll_interval: float = WEBHOOK_QUEUE_POLL_INTERVAL,
+        max_attempts: int = WEBHOOK_QUEUE_MAX_ATTEMPTS,
+        backoff_base: float = WEBHOOK_QUEUE_BACKOFF_BASE_SECONDS,
+        backoff_max: float = WEBHOOK_QUEUE_BACKOFF_MAX_SECONDS,
+        visibility_timeout: float = WEBHOOK_QUEUE_VISIBILITY_TIMEOUT_SECONDS
+    ):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.visibility_timeout = visibility_timeout
+        self.handlers: Dict[str, Callable[[Session, Any], Any]] = {}
+        self.ordering_keys: Dict[str, str] = {}
+        self._threads = []
+        # Jobs this process is running; their heartbeat is refreshed until they finish
+        self._running = set()
+        self._heartbeat_thread = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._last_requeue = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.last_lag_seconds = 0.0
+        self.last_duration_seconds = 0.0
+
+    def register(self, kind: str, handler: Callable[[Session, Any], Any], ordering_key: str = None):
+        """
+        Register the function that processes jobs of the given kind
+
+        Kinds registered with the same ordering_key (default: the kind itself) are
+        processed strictly in enqueue order, one job at a time.
+        """
+        self.handlers[kind] = handler
+        self.ordering_keys[kind] = ordering_key or kind
+
+    def enqueue(self, db: Session, kind: str, payload) -> int:
+        """
+        Persist a payload and wake up a worker
+
+        Args:
+            db: Database session
+            kind: Registered job kind
+            payload: JSON-serialisable payload
+
+        Returns:
+            The job ID
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for webhook job kind {kind}")
+        job = crud.enqueue_webhook_job(db, kind, payload, self.ordering_keys[kind])
+        if crud.in_unit_of_work(db):
+            # The job only becomes visible to the workers when the unit of work commits
+            event.listen(db, "after_commit", lambda session: self._wakeup.set(), once=True)
+        else:
+            self._wakeup.set()
+        return job.id
+
+    def start(self):
+        """Requeue jobs abandoned by a previous run and start the workers"""
+        if self._threads:
+            return
+        self._requeue_stale()
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="webhook-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+        logger.info(f"Started {self.workers} webhook queue workers")
+
+    def stop(self, timeout: float = 10.0):
+        """Signal the workers to stop after their current job and wait for them"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join(timeout)
+        self._heartbeat_thread = None
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds before the next attempt: doubles per attempt up to backoff_max, jittered between half and all of it"""
+        delay = min(self.backoff_base * (2 ** max(attempts - 1, 0)), self.backoff_max)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self._process_next():
+                    self._requeue_if_due()
+                    self._purge_if_due()
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+            except Exception as e:
+                logger.error(f"Webhook worker error: {str(e)}")
+                self._stop.wait(self.poll_interval)
+
+    def _process_next(self) -> bool:
+        """Claim and process one job; returns False when the queue is empty"""
+        db = SessionLocal()
+        try:
+            job = crud.claim_next_webhook_job(db)
+            if job is None:
+                return False
+            job_id, kind, payload, attempts, claimed_at = job.id, job.kind, job.payload, job.attempts, job.started_at
+            lag = (job.started_at - job.created_at).total_seconds()
+            started = time.perf_counter()
+            with self._lock:
+                self._running.add(job_id)
+            try:
+                handler = self.handlers.get(kind)
+                if handler is None:
+                    raise ValueError(f"No handler registered for webhook job kind {kind}")
+                # One transaction per job, recording its completion too, so a job is
+                # never done without its writes, nor its writes kept for a lost claim
+                with crud.unit_of_work(db):
+                    result = handler(db, payload)
+                    if not crud.complete_webhook_job(db, job_id, result, claimed_at):
+                        raise ClaimLost(f"Webhook job {job_id} was requeued while it ran")
+                with self._lock:
+                    self.processed += 1
+            except ClaimLost as e:
+                db.rollback()
+                logger.warning(f"{str(e)}; its changes were rolled back")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error processing webhook job {job_id} ({kind}): {str(e)}")
+                retry_at = datetime.utcnow() + timedelta(seconds=self.backoff(attempts))
+                job = crud.fail_webhook_job(db, job_id, str(e), self.max_attempts, retry_at, claimed_at)
+                if job and job.status == "FAILED":
+                    with self._lock:
+                        self.failed += 1
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+            with self._lock:
+                self.last_lag_seconds = lag
+                self.last_duration_seconds = time.perf_counter() - started
+            return True
+        finally:
+            db.close()
+
+    def _heartbeat(self):
+        """Refresh the heartbeat of this process's running jobs a few times per visibility timeout"""
+        while not self._stop.wait(self.visibility_timeout / 3):
+            with self._lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            db = SessionLocal()
+            try:
+                crud.touch_webhook_jobs(db, job_ids)
+            except OperationalError as e:
+                # On SQLite a running job holds the write lock, which keeps requeues out as well;
+                # the next beat retries
+                logger.debug(f"Webhook job heartbeat skipped: {str(e)}")
+            except Exception as e:
+                logger.error(f"Webhook job heartbeat failed: {str(e)}")
+            finally:
+                db.close()
+
+    def _requeue_stale(self):
+        """Requeue jobs whose heartbeat stopped for longer than the visibility timeout, i.e. whose worker died"""
+        self._last_requeue = time.monotonic()
+        db = SessionLocal()
+        try:
+            stale = crud.requeue_stale_webhook_jobs(db, datetime.utcnow() - timedelta(seconds=self.visibility_timeout))
+            if stale:
+                logger.warning(f"Requeued {stale} webhook jobs with no heartbeat for over {self.visibility_timeout:g}s")
+        finally:
+            db.close()
+
+    def _requeue_if_due(self):
+        if time.monotonic() - self._last_requeue < min(self.visibility_timeout, 60):
+            return
+        self._requeue_stale()
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        db = SessionLocal()
+        try:
+            purged = crud.purge_finished_webhook_jobs(db, datetime.utcnow() - timedelta(hours=WEBHOOK_JOB_RETENTION_HOURS))
+            if purged:
+                logger.info(f"Purged {purged} finished webhook jobs")
+        finally:
+            db.close()
+
+    def metrics(self, db: Session) -> Dict[str, Any]:
+        """Queue depth, lag and worker counters"""
+        stats = crud.get_webhook_queue_stats(db)
+        counts = stats["counts"]
+        oldest = stats["oldest_pending_at"]
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "depth": counts.get("PENDING", 0),
+                "processing": counts.get("PROCESSING", 0),
+                "done": counts.get("DONE", 0),
+                "failed": counts.get("FAILED", 0),
+                "oldest_pending_age_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+                "last_lag_seconds": self.last_lag_seconds,
+                "last_duration_seconds": self.last_duration_seconds,
+                "processed_total": self.processed,
+                "failed_total": self.failed
+            }
+
+
+webhook_queue = WebhookQueue()
@@ -1,17 +1,28 @@
 """
 Authentication utilities for JWT tokens and agent verification
 """
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 import bcrypt
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from models import get_db, get_agent_by_username
+from config import (
+    SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_SYNC_SECONDS
+)
+from models import get_async_db, on_agent_change
+from models.aio import get_agent_by_username, get_agent_versions
+
+logger = logging.getLogger(__name__)
 
 # Password hashing: use bcrypt_sha256 to avoid bcrypt's 72-byte limit
 pwd_context = CryptContext(schemes=["bcrypt_sha256", "bcrypt"], deprecated="auto")
@@ -76,22 +87,197 @@ def verify_token(token: str) -> dict:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
-async def get_current_agent(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Get current authenticated agent from token"""
+class AgentPrincipal:
+    """Snapshot of the authenticated agent, detached from any session"""
+    __slots__ = ("id", "username", "full_name", "email", "phone", "status", "is_active", "version")
+
+    def __init__(self, agent):
+        for name in self.__slots__:
+            setattr(self, name, getattr(agent, name))
+        self.version = self.version or 0
+
+
+class PrincipalCache:
+    """
+    LRU of verified tokens -> (claims, agent snapshot)
+
+    Keyed by the token's SHA-256, so raw tokens are not kept. Entries expire
+    after ttl_seconds or when the token does, whichever is first. Changes to an
+    agent's status or password drop its entries right away in this process;
+    with sync_seconds set, a periodic query of agent versions drops those
+    changed by other processes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PRINCIPAL_CACHE_SIZE,
+        ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS,
+        sync_seconds: float = PRINCIPAL_CACHE_SYNC_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sync_seconds = sync_seconds
+        # token hash -> (claims, snapshot, expires_at)
+        self._entries: "OrderedDict[str, Tuple[dict, AgentPrincipal, float]]" = OrderedDict()
+        # username -> hashes of its cached tokens
+        self._by_username: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._next_sync = time.monotonic() + sync_seconds
+        self._synced_at = datetime.utcnow()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.syncs = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Tuple[dict, AgentPrincipal]]:
+        key = self.token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[2]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+        return None
+
+    def put(self, token: str, claims: dict, principal: AgentPrincipal):
+        if not self.enabled:
+            return
+        ttl = self.ttl_seconds
+        if claims.get("exp") is not None:
+            ttl = min(ttl, claims["exp"] - time.time())
+        if ttl <= 0:
+            return
+        key = self.token_key(token)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (claims, principal, time.monotonic() + ttl)
+            self._by_username.setdefault(principal.username, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_username.get(entry[1].username)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_username[entry[1].username]
+
+    def invalidate_agent(self, username: str) -> int:
+        """Drop every cached token of the agent; returns the number of entries dropped"""
+        with self._lock:
+            keys = list(self._by_username.get(username, ()))
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def sync_due(self) -> Optional[datetime]:
+        """
+        When a sync is due, claim it and return the time to look for changes from
+
+        The window overlaps the previous one by sync_seconds, so a change
+        committed while the last sync ran is not missed.
+        """
+        if self.sync_seconds <= 0 or not self._entries:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sync:
+                return None
+            self._next_sync = now + self.sync_seconds
+            since = self._synced_at - timedelta(seconds=self.sync_seconds)
+            self._synced_at = datetime.utcnow()
+            self.syncs += 1
+            return since
+
+    def apply_versions(self, versions: Iterable[Tuple[str, int]]) -> int:
+        """Drop entries whose agent now has another version; returns the number dropped"""
+        dropped = 0
+        with self._lock:
+            for username, version in versions:
+                for key in list(self._by_username.get(username, ())):
+                    if self._entries[key][1].version != version:
+                        self._drop(key)
+                        dropped += 1
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_username.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "agents": len(self._by_username),
+                "ttl_seconds": self.ttl_seconds,
+                "sync_seconds": self.sync_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "syncs": self.syncs,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None
+            }
+
+
+principal_cache = PrincipalCache()
+on_agent_change(principal_cache.invalidate_agent)
+
+
+async def _sync_principal_cache(db: AsyncSession):
+    """Drop cached principals of agents changed by other processes, at most once per sync interval"""
+    since = principal_cache.sync_due()
+    if since is None:
+        return
     try:
+        principal_cache.apply_versions(await get_agent_versions(db, since))
+    except Exception as e:
+        logger.warning(f"Principal cache sync failed: {str(e)}")
+
+
+async def get_current_agent(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """
+    Get current authenticated agent from token
+
+    Returns an AgentPrincipal snapshot. Tokens seen recently are answered from
+    the principal cache without touching the database.
+    """
+    await _sync_principal_cache(db)
+    cached = principal_cache.get(token)
+    if cached is not None:
+        agent = cached[1]
+    else:
         payload = verify_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-    except HTTPException:
-        raise
-    
-    agent = get_agent_by_username(db, username=username)
-    
-    if agent is None:
-        raise HTTPException(status_code=401, detail="Agent not found")
+
+        row = await get_agent_by_username(db, username=username)
+        if row is None:
+            raise HTTPException(status_code=401, detail="Agent not found")
+        agent = AgentPrincipal(row)
+        principal_cache.put(token, payload, agent)
+
     if agent.status != "ACTIVE":
         raise HTTPException(status_code=403, detail="Agent is not active")
-    
-    return agent
 
+    return agent
@@ -0,0 +1,237 @@
+"""
+Idempotency utilities for webhook deduplication
+
+Two layers share one store: `Idempotency-Key` request replays return the stored
+response, and per-entity content hashes let the webhook processors skip entities
+whose payload has not changed since it was last written. Lookups go through a
+bounded in-memory LRU first and fall back to the `idempotency_records` table.
+
+The LRU only takes digests that have been committed, so a rolled back unit of
+work leaves nothing behind to skip on the retry. It is per process: forget()
+clears the table and this process's LRU, but other worker processes keep their
+cached digests until they expire.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS
+import models as crud
+
+REQUEST_SCOPE = "request"
+_CACHE_HIT = object()
+
+
+def fingerprint(payload: Any) -> str:
+    """SHA-256 of the canonical JSON form of a payload"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """Bounded LRU of (scope, key) -> digest backed by the idempotency_records table"""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.cache_hits = 0
+        self.table_hits = 0
+        self.skipped_writes = 0
+        self.replayed_requests = 0
+
+    # ---------- LRU ----------
+
+    def _cache_get(self, scope: str, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get((scope, key))
+            if entry is None:
+                return None
+            digest, stored_at = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._cache[(scope, key)]
+                return None
+            self._cache.move_to_end((scope, key))
+            return digest
+
+    def _cache_put(self, scope: str, key: str, digest: str, stored_at: Optional[float] = None):
+        with self._lock:
+            self._cache[(scope, key)] = (digest, stored_at or time.time())
+            self._cache.move_to_end((scope, key))
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _cache_put_all(self, scope: str, entries: Iterable[Tuple[str, str, Optional[float]]]):
+        for key, digest, stored_at in entries:
+            self._cache_put(scope, key, digest, stored_at)
+
+    def _once_committed(self, db: Session, fn):
+        """Run fn now, or inside a unit of work once it commits; nothing runs if it rolls back"""
+        if not crud.in_unit_of_work(db):
+            fn()
+            return
+
+        def committed(session):
+            event.remove(db, "after_rollback", rolled_back)
+            fn()
+
+        def rolled_back(session):
+            event.remove(db, "after_commit", committed)
+
+        event.listen(db, "after_commit", committed, once=True)
+        event.listen(db, "after_rollback", rolled_back, once=True)
+
+    # ---------- Entity fingerprints ----------
+
+    def filter_unchanged(self, db: Session, scope: str, entries: Iterable[Tuple[Any, Any]]) -> Tuple[List[Tuple[Any, Optional[str], Any]], int]:
+        """
+        Drop entities whose content hash matches the last successful write
+
+        Args:
+            db: Database session
+            scope: Entity kind (e.g. "product")
+            entries: (key, entity) pairs; entities with a None key are always kept
+
+        Returns:
+            ([(key, digest, entity), ...] still to be written, number skipped)
+        """
+        pending = []
+        misses = {}
+        for key, entity in entries:
+            if key is None:
+                pending.append((None, None, entity))
+                continue
+            key = str(key)
+            digest = fingerprint(entity)
+            cached = self._cache_get(scope, key)
+            if cached == digest:
+                with self._lock:
+                    self.cache_hits += 1
+                pending.append((key, digest, _CACHE_HIT))
+            else:
+                misses[key] = digest
+                pending.append((key, digest, entity))
+
+        stored = {}
+        if misses:
+            since = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+            stored = crud.get_idempotency_records(db, scope, misses.keys(), since)
+
+        changed = []
+        skipped = 0
+        confirmed = []
+        for key, digest, entity in pending:
+            if entity is _CACHE_HIT:
+                skipped += 1
+                continue
+            record = stored.get(key)
+            if record is not None and record.digest == digest:
+                confirmed.append((key, digest, record.created_at.replace(tzinfo=timezone.utc).timestamp()))
+                with self._lock:
+                    self.table_hits += 1
+                skipped += 1
+                continue
+            changed.append((key, digest, entity))
+
+        if confirmed:
+            # Inside a unit of work the record may be one this transaction wrote
+            self._once_committed(db, lambda: self._cache_put_all(scope, confirmed))
+        with self._lock:
+            self.skipped_writes += skipped
+        return changed, skipped
+
+    def remember(self, db: Session, scope: str, digests: Dict[str, str]):
+        """Record the content hashes of successfully written entities; the LRU takes them once they commit"""
+        digests = {str(k): v for k, v in digests.items() if k is not None and v is not None}
+        if not digests:
+            return
+        crud.save_idempotency_records(db, scope, digests)
+        entries = [(key, digest, None) for key, digest in digests.items()]
+        self._once_committed(db, lambda: self._cache_put_all(scope, entries))
+        self._purge_if_due(db)
+
+    def forget(self, db: Session, scope: str, keys: Iterable[Any]):
+        """Invalidate entity hashes after the entity changed locally"""
+        keys = [str(k) for k in keys if k is not None]
+        if not keys:
+            return
+
+        def evict():
+            with self._lock:
+                for key in keys:
+                    self._cache.pop((scope, key), None)
+
+        evict()
+        crud.delete_idempotency_records(db, scope, keys)
+        # Until the commit other sessions still read the old records and may cache them again
+        self._once_committed(db, evict)
+
+    # ---------- Idempotency-Key requests ----------
+
+    def _request_record(self, db: Session, route: str, idempotency_key: str):
+        key = f"{route}:{idempotency_key}"
+        since = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        return crud.get_idempotency_records(db, REQUEST_SCOPE, [key], since).get(key)
+
+    def has_response(self, db: Session, route: str, idempotency_key: str) -> bool:
+        """Whether a response is stored for an Idempotency-Key"""
+        return self._request_record(db, route, idempotency_key) is not None
+
+    def get_response(self, db: Session, route: str, idempotency_key: str, body: Any = None, digest: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the stored response for a replayed Idempotency-Key
+
+        Streamed bodies pass the `digest` of their raw bytes instead of the parsed body.
+
+        Raises:
+            ValueError: the key was already used with a different body
+        """
+        record = self._request_record(db, route, idempotency_key)
+        if record is None:
+            return None
+        if record.digest != (digest or fingerprint(body)):
+            raise ValueError("Idempotency-Key was already used with a different payload")
+        with self._lock:
+            self.replayed_requests += 1
+        return record.response
+
+    def save_response(self, db: Session, route: str, idempotency_key: str, body: Any, status_code: int, content: Any, digest: Optional[str] = None):
+        """Store the response sent for an Idempotency-Key"""
+        key = f"{route}:{idempotency_key}"
+        crud.save_idempotency_records(
+            db, REQUEST_SCOPE, {key: digest or fingerprint(body)},
+            responses={key: {"status_code": status_code, "content": content}}
+        )
+
+    # ---------- Maintenance ----------
+
+    def _purge_if_due(self, db: Session):
+        now = time.monotonic()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        crud.purge_idempotency_records(db, datetime.utcnow() - timedelta(seconds=self.ttl_seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and skip counters"""
+        with self._lock:
+            return {
+                "cache_entries": len(self._cache),
+                "cache_capacity": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "cache_hits": self.cache_hits,
+                "table_hits": self.table_hits,
+                "skipped_writes": self.skipped_writes,
+                "replayed_requests": self.replayed_requests
+            }
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,164 @@
+"""
+Incremental JSON parsing for large webhook bodies
+
+Webhook bodies are usually one big array of entities (optionally wrapped in an
+envelope object). `JsonItemStream` reads the body chunk by chunk and yields the
+array's elements one at a time, so only the element being decoded and the
+unread tail of the current chunk are held in memory, however large the body is.
+"""
+import codecs
+import hashlib
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Sequence, Tuple
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class JsonStreamError(ValueError):
+    """The body is not well-formed JSON"""
+
+
+class JsonItemStream:
+    """
+    Yield the items of a JSON body as they arrive
+
+    The items are the elements of a top-level array, or of the array (or single
+    object) found under one of `paths` in a top-level object, e.g.
+    ("data", "order") for {"code": 200, "data": {"order": [...]}}. Every other
+    member of the enclosing objects is collected in `envelope`. When no path
+    matches, `found` stays False and `envelope` holds the whole top-level object.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], paths: Iterable[Sequence[str]] = ()):
+        self.paths = [tuple(p) for p in paths]
+        self.envelope: Dict[str, Any] = {}
+        self.found = False
+        self._chunks = chunks.__aiter__()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._sha256 = hashlib.sha256()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the raw bytes read so far"""
+        return self._sha256.hexdigest()
+
+    async def items(self) -> AsyncIterator[Any]:
+        """Yield each item; raises JsonStreamError on malformed JSON"""
+        ch = await self._peek()
+        if ch == "[":
+            self.found = True
+            async for item in self._array():
+                yield item
+        elif ch == "{":
+            async for item in self._object(self.paths, self.envelope):
+                yield item
+        else:
+            raise JsonStreamError("Expected a JSON array or object")
+        if await self._peek() is not None:
+            raise JsonStreamError("Unexpected data after the JSON document")
+
+    async def drain(self) -> str:
+        """Read the rest of the body without parsing it; returns the digest"""
+        while await self._read():
+            self._buf = ""
+        return self.digest
+
+    # ---------- Structure ----------
+
+    async def _object(self, paths: Sequence[Tuple[str, ...]], target: Dict[str, Any]) -> AsyncIterator[Any]:
+        await self._expect("{")
+        if await self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = await self._value()
+            if not isinstance(key, str):
+                raise JsonStreamError("Expected an object key")
+            await self._expect(":")
+            remaining = [p[1:] for p in paths if p and p[0] == key]
+            ch = await self._peek()
+            if () in remaining and ch == "[":
+                self.found = True
+                async for item in self._array():
+                    yield item
+            elif () in remaining and ch == "{":
+                self.found = True
+                yield await self._value()
+            elif remaining and ch == "{":
+                nested = target[key] = {}
+                async for item in self._object([p for p in remaining if p], nested):
+                    yield item
+            else:
+                target[key] = await self._value()
+            ch = await self._peek()
+            self._pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise JsonStreamError("Expected ',' or '}' in object")
+
+    async def _array(self) -> AsyncIterator[Any]:
+        await self._expect("[")
+        if await self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield await self._value()
+            ch = await self._peek()
+            self._pos += 1
+            if ch == "]":
+                return
+            if ch != ",":
+                raise JsonStreamError("Expected ',' or ']' in array")
+
+    # ---------- Tokens ----------
+
+    async def _value(self) -> Any:
+        """Decode the next complete value, reading more of the body until it is complete"""
+        await self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+                # A value touching the end of the buffer may continue in the next chunk (e.g. 12|34)
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise JsonStreamError(f"Malformed JSON: {e.msg}") from e
+            await self._read()
+
+    async def _expect(self, ch: str):
+        if await self._peek() != ch:
+            raise JsonStreamError(f"Expected '{ch}'")
+        self._pos += 1
+
+    async def _peek(self) -> Optional[str]:
+        """Skip whitespace and return the next character (None at the end of the body)"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not await self._read():
+                return None
+
+    async def _read(self) -> bool:
+        """Append the next chunk to the buffer, dropping what was already consumed"""
+        if self._eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            self._buf = self._buf[self._pos:] + self._text.decode(b"", final=True)
+            self._pos = 0
+            return False
+        self._sha256.update(chunk)
+        self._buf = self._buf[self._pos:] + self._text.decode(chunk)
+        self._pos = 0
+        return True
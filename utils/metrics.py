@@ -0,0 +1,247 @@
+"""
+In-process metrics served at GET /metrics in the Prometheus text format
+
+Counters, gauges and histograms live in one registry and are rendered in the
+text exposition format (version 0.0.4) on every scrape, so any Prometheus
+compatible scraper can collect them without an agent or extra dependency.
+
+- MetricsMiddleware records latency per route template and status, and the
+  requests in flight
+- modules declare their own metrics at import time with registry.counter(),
+  registry.gauge() and registry.histogram(); declaring a name twice returns the
+  same metric
+
+Label values must come from a small set (route templates, not paths), since
+every combination is kept for the life of the process.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from config import METRICS_ENABLED
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; the Prometheus client defaults, for request-sized latencies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        # label values -> sample state
+        self._samples: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {', '.join(self.labels) or '(none)'}, got {', '.join(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _header(self) -> List[str]:
+        documentation = self.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        return [f"# HELP {self.name} {documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            samples = sorted(self._samples.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in samples
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. requests served"""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._samples.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight"""
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._samples.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets if bound != math.inf))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                # [count per bucket (the last one is +Inf), sum]
+                sample = self._samples[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            sample[0][index] += 1
+            sample[1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            sample = self._samples.get(self._key(labels))
+            return sum(sample[0]) if sample else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            samples = sorted((key, (list(counts), total)) for key, (counts, total) in self._samples.items())
+        lines = self._header()
+        for key, (counts, total) in samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """The process's metrics by name, rendered together for a scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _declare(self, cls, name: str, documentation: str, labels: Sequence[str], **options) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **options)
+            elif type(metric) is not cls or metric.labels != tuple(labels):
+                raise ValueError(f"Metric {name} is already declared as a {metric.type} with labels {metric.labels}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._declare(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._declare(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._declare(Histogram, name, documentation, labels, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Every metric in the text exposition format, by name"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Drop all recorded samples; the metrics stay declared"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to serve HTTP requests, by route template and status",
+    ("method", "route", "status")
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being served")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request
+
+    The route label is the matched route template (e.g. "/api/v1/orders/{order_id}"),
+    so the number of series stays bounded; requests matching no route share "(unrouted)".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        # A request failing before it answers is reported as a 500, as the server will
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "(unrouted)"
+            http_request_duration.observe(
+                time.perf_counter() - started, method=scope.get("method", ""), route=route, status=status["code"]
+            )
@@ -0,0 +1,230 @@
+"""
+Per-request SQL instrumentation and N+1 detection
+
+Engine events time every statement. While a request is being served (see
+SQLInstrumentationMiddleware) its statements are also counted, and grouped by
+shape: the SQL text with expanded IN lists collapsed, so the same query run
+for different parameters has the same shape. A shape run
+SQL_N_PLUS_ONE_THRESHOLD or more times in one request is reported as an N+1
+suspect: usually a query inside a loop that one batched query could replace.
+
+- statements slower than SQL_SLOW_QUERY_MS are logged, with parameter values
+  replaced by their types, from requests and background workers alike
+- each response can carry the counts in a Server-Timing header (SQL_SERVER_TIMING)
+- counts, DB time and suspects are aggregated per route for GET /health/sql
+- with METRICS_ENABLED, statement times also go to the db_query_duration_seconds histogram
+"""
+import re
+import threading
+import time
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from sqlalchemy import event
+from config import SQL_INSTRUMENTATION_ENABLED, SQL_SLOW_QUERY_MS, SQL_N_PLUS_ONE_THRESHOLD, SQL_SERVER_TIMING, METRICS_ENABLED
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Shapes kept per route in the aggregate, most repeated first
+MAX_SUSPECTS_PER_ROUTE = 10
+
+query_duration = registry.histogram(
+    "db_query_duration_seconds", "Time to execute SQL statements, by statement kind", ("kind",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+STATEMENT_KINDS = frozenset(("select", "insert", "update", "delete", "with", "begin", "commit", "rollback", "savepoint", "release", "pragma"))
+
+_IN_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)|\((?:\s*\$\d+\s*,)+\s*\$\d+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_KEYWORD = re.compile(r"\s*([A-Za-z]+)")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace normalised and expanded IN / VALUES lists collapsed to one placeholder"""
+    return _IN_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def statement_kind(statement: str) -> str:
+    """Lower-cased first keyword of the statement (select, insert, ...), or other"""
+    match = _KEYWORD.match(statement)
+    keyword = match.group(1).lower() if match else ""
+    return keyword if keyword in STATEMENT_KINDS else "other"
+
+
+def redact(parameters: Any) -> Any:
+    """Parameter values replaced by their type names, so logs never carry the data"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            # executemany: the first row stands for the rest
+            return [redact(parameters[0]), f"... {len(parameters)} rows"]
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class RequestQueries:
+    """Statements of one request"""
+    __slots__ = ("count", "db_ms", "slow", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.db_ms = 0.0
+        self.slow = 0
+        self.shapes: Counter = Counter()
+
+    def suspects(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> Dict[str, int]:
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("sql_request_queries", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    elapsed_ms = elapsed * 1000
+    if METRICS_ENABLED:
+        query_duration.observe(elapsed, kind=statement_kind(statement))
+    queries = _current.get()
+    slow = elapsed_ms >= SQL_SLOW_QUERY_MS
+    if queries is not None:
+        queries.count += 1
+        queries.db_ms += elapsed_ms
+        queries.shapes[statement_shape(statement)] += 1
+        queries.slow += slow
+    if slow:
+        logger.warning(f"Slow query ({elapsed_ms:.1f} ms): {_WHITESPACE.sub(' ', statement)} params={redact(parameters)}")
+
+
+def _handle_error(exception_context):
+    # A failed statement gets no after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def instrument_engine(engine):
+    """Time every statement of a (sync or async) engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class RouteStats:
+    """Per-route aggregate of the requests' statement counts, DB time and N+1 suspects"""
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, queries: RequestQueries, request_ms: float):
+        suspects = queries.suspects()
+        if suspects:
+            worst = max(suspects, key=suspects.get)
+            logger.warning(f"Possible N+1 in {route}: {suspects[worst]}x {worst[:300]}")
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    "requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0, "max_db_ms": 0.0,
+                    "request_ms": 0.0, "slow_queries": 0, "n_plus_one_requests": 0,
+                    # shape -> [requests in which it repeated, most repeats in one request]
+                    "suspects": {}
+                }
+            stats["requests"] += 1
+            stats["queries"] += queries.count
+            stats["max_queries"] = max(stats["max_queries"], queries.count)
+            stats["db_ms"] += queries.db_ms
+            stats["max_db_ms"] = max(stats["max_db_ms"], queries.db_ms)
+            stats["request_ms"] += request_ms
+            stats["slow_queries"] += queries.slow
+            if suspects:
+                stats["n_plus_one_requests"] += 1
+                for shape, count in suspects.items():
+                    seen = stats["suspects"].setdefault(shape, [0, 0])
+                    seen[0] += 1
+                    seen[1] = max(seen[1], count)
+                if len(stats["suspects"]) > MAX_SUSPECTS_PER_ROUTE:
+                    kept = sorted(stats["suspects"].items(), key=lambda item: item[1][0], reverse=True)
+                    stats["suspects"] = dict(kept[:MAX_SUSPECTS_PER_ROUTE])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Routes by total DB time, with averages per request"""
+        with self._lock:
+            routes = {
+                route: dict(stats, suspects={shape: list(seen) for shape, seen in stats["suspects"].items()})
+                for route, stats in self._routes.items()
+            }
+        return {
+            route: {
+                "requests": stats["requests"],
+                "avg_queries": round(stats["queries"] / stats["requests"], 1),
+                "max_queries": stats["max_queries"],
+                "db_ms_total": round(stats["db_ms"], 1),
+                "avg_db_ms": round(stats["db_ms"] / stats["requests"], 2),
+                "max_db_ms": round(stats["max_db_ms"], 1),
+                "db_share": round(stats["db_ms"] / stats["request_ms"], 3) if stats["request_ms"] else None,
+                "slow_queries": stats["slow_queries"],
+                "n_plus_one_requests": stats["n_plus_one_requests"],
+                "n_plus_one_suspects": [
+                    {"shape": shape, "requests": seen[0], "max_repeats": seen[1]}
+                    for shape, seen in sorted(stats["suspects"].items(), key=lambda item: item[1][0], reverse=True)
+                ]
+            }
+            for route, stats in sorted(routes.items(), key=lambda item: item[1]["db_ms"], reverse=True)
+        }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_stats = RouteStats()
+
+
+class SQLInstrumentationMiddleware:
+    """
+    ASGI middleware collecting the statements of each HTTP request
+
+    Statements are attributed to the route template (e.g. "POST
+    /api/v1/picking/complete/{order_id}"), so one route's requests aggregate together.
+    """
+
+    def __init__(self, app, server_timing: bool = SQL_SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_INSTRUMENTATION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries()
+        token = _current.set(queries)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={queries.db_ms:.1f};desc="{queries.count} queries", '
+                    f'dbn1;desc="{len(queries.suspects())} N+1 suspects"'.encode()
+                ))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            # Unrouted requests (static files, 404s) share one entry so the table stays bounded
+            path = getattr(scope.get("route"), "path", None) or "(unrouted)"
+            route_stats.record(f"{scope.get('method', '')} {path}", queries, (time.perf_counter() - started) * 1000)